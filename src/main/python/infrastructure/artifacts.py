@@ -0,0 +1,172 @@
+"""Content-addressed S3 store for rendered templates.
+
+Each template is stored under ``<prefix>/<sha256>.json``, so an object that
+is already in the bucket never needs uploading again and re-deploying an
+unchanged stack costs no uploads. Nested stack children (the relative
+``TemplateURL``s written by ``split.py``) are uploaded first and their URLs
+substituted into the parent before it is hashed, so the whole tree is
+content-addressed.
+
+    python artifacts.py --bucket voyc-templates build/docs_ci.json
+    python artifacts.py --bucket test --endpoint-url http://localhost:5000 ...
+
+Pass ``endpoint_url`` (or a ready ``client``) to run against a local S3
+stand-in such as moto.
+"""
+import argparse
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class ArtifactStore(object):
+
+    def __init__(self, bucket, prefix='templates', client=None, region=None,
+                 endpoint_url=None, workers=8):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client or boto3.client(
+            's3', region_name=region, endpoint_url=endpoint_url
+        )
+        self.region = region or self.client.meta.region_name
+        self.endpoint_url = endpoint_url
+        self.workers = workers
+
+    def key(self, body):
+        return '%s/%s.json' % (self.prefix, hashlib.sha256(body).hexdigest())
+
+    def url(self, key):
+        if self.endpoint_url:
+            return '%s/%s/%s' % (self.endpoint_url.rstrip('/'), self.bucket, key)
+        return 'https://%s.s3.%s.amazonaws.com/%s' % (self.bucket, self.region, key)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def ensure(self, body):
+        """Upload ``body`` unless its key exists. Returns ``(key, uploaded)``."""
+        key = self.key(body)
+        if self.exists(key):
+            return key, False
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=body, ContentType='application/json'
+        )
+        return key, True
+
+    def publish(self, files):
+        """Store a set of rendered templates, children before parents.
+
+        ``files`` maps file names to JSON text as returned by
+        ``compiler.render``; relative ``TemplateURL``s naming another file in
+        the set are replaced by that file's URL. Returns ``{name: url}`` and
+        the number of objects actually uploaded.
+        """
+        pending = OrderedDict(
+            (name, json.loads(text)) for name, text in files.items()
+        )
+        urls, uploaded = OrderedDict(), 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending:
+                # Every file whose nested children already have URLs.
+                ready = [
+                    name for name, template in pending.items()
+                    if not set(_children(template)) & set(pending)
+                ]
+                if not ready:
+                    raise ValueError(
+                        'Circular TemplateURL references: %s' % ', '.join(pending)
+                    )
+                bodies = OrderedDict()
+                for name in ready:
+                    template = pending.pop(name)
+                    if _children(template):
+                        text = json.dumps(
+                            _resolve(template, urls),
+                            sort_keys=True,
+                            separators=(',', ':'),
+                        )
+                    else:
+                        text = files[name]
+                    bodies[name] = text.encode('utf-8')
+                for name, (key, was_uploaded) in zip(
+                    bodies, pool.map(self.ensure, bodies.values())
+                ):
+                    urls[name] = self.url(key)
+                    uploaded += was_uploaded
+
+        return OrderedDict((name, urls[name]) for name in files), uploaded
+
+
+def _children(template):
+    return [
+        resource['Properties']['TemplateURL']
+        for resource in template.get('Resources', {}).values()
+        if resource.get('Type') == 'AWS::CloudFormation::Stack'
+        and isinstance(resource.get('Properties', {}).get('TemplateURL'), str)
+        and '://' not in resource['Properties']['TemplateURL']
+    ]
+
+
+def _resolve(template, urls):
+    template = json.loads(json.dumps(template))
+    for resource in template.get('Resources', {}).values():
+        if resource.get('Type') != 'AWS::CloudFormation::Stack':
+            continue
+        properties = resource.get('Properties', {})
+        if properties.get('TemplateURL') in urls:
+            properties['TemplateURL'] = urls[properties['TemplateURL']]
+    return template
+
+
+def collect(path):
+    """Read a rendered template and the nested children it references."""
+    directory = os.path.dirname(path)
+    files, pending = OrderedDict(), [os.path.basename(path)]
+    while pending:
+        name = pending.pop(0)
+        if name in files:
+            continue
+        with open(os.path.join(directory, name)) as f:
+            files[name] = f.read()
+        pending.extend(_children(json.loads(files[name])))
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('templates', nargs='+', help='Rendered parent templates.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', default='templates')
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url', help='S3 endpoint, eg: a local moto server.'
+    )
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    store = ArtifactStore(
+        args.bucket,
+        prefix=args.prefix,
+        region=args.region,
+        endpoint_url=args.endpoint_url,
+        workers=args.workers,
+    )
+    for path in args.templates:
+        urls, uploaded = store.publish(collect(path))
+        print(f'{path}: {urls[os.path.basename(path)]} ({uploaded} uploaded)')
+
+
+if __name__ == '__main__':
+    main()
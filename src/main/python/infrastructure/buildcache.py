@@ -0,0 +1,86 @@
+"""CodeBuild project caches for the template generators.
+
+A cache is described by a plain dict, so it can sit in a template's
+``defaults`` and be overridden per target like any other build parameter:
+
+    {'type': 'LOCAL', 'modes': ['source', 'docker', 'custom']}
+    {'type': 'S3', 'location': 'voyc-build-cache/voyclib'}
+    None
+
+LOCAL caches live on the build host and need no permissions, but only hit
+while builds run close together. S3 caches survive between hosts: the
+location (``bucket/prefix``) becomes a ``CacheLocation`` template parameter
+and the role needs the statements returned by ``add``. What is cached is
+listed under ``cache: paths`` in the project's buildspec. The ``docker``
+mode also needs a privileged build environment.
+"""
+import awacs
+from awacs.aws import Allow, Statement
+from troposphere import Join, Parameter, Ref, Select, Split
+from troposphere.codebuild import ProjectCache
+
+
+LOCAL_MODES = {
+    'source': 'LOCAL_SOURCE_CACHE',
+    'docker': 'LOCAL_DOCKER_LAYER_CACHE',
+    'custom': 'LOCAL_CUSTOM_CACHE',
+}
+
+
+def add(t, spec, group='Codebuild'):
+    """Configure ``spec`` on template ``t``.
+
+    Returns ``(ProjectCache or None, [Statement])``: the project's ``Cache``
+    property and the statements its role needs to use it.
+    """
+    if not spec or spec['type'] == 'NO_CACHE':
+        return None, []
+
+    if spec['type'] == 'LOCAL':
+        unknown = set(spec['modes']) - set(LOCAL_MODES)
+        if unknown:
+            raise ValueError(
+                'Unknown LOCAL cache modes %s, expected %s'
+                % (', '.join(sorted(unknown)), ', '.join(LOCAL_MODES))
+            )
+        return ProjectCache(
+            Type='LOCAL', Modes=[LOCAL_MODES[m] for m in spec['modes']]
+        ), []
+
+    if spec['type'] != 'S3':
+        raise ValueError('Unknown cache type %r' % spec['type'])
+
+    location = t.add_parameter(
+        Parameter(
+            'CacheLocation',
+            Description='S3 build cache location, as bucket/prefix.',
+            Type='String',
+            Default=spec['location'],
+            MinLength='3',
+            MaxLength='256',
+            ConstraintDescription=('Cache location is required.'),
+        )
+    )
+    t.set_parameter_label(location, 'Cache Location')
+    t.add_parameter_to_group(location, group)
+
+    bucket = Select(0, Split('/', Ref(location)))
+    statements = [
+        Statement(
+            Effect=Allow,
+            Action=[
+                awacs.aws.Action('s3', 'GetObject'),
+                awacs.aws.Action('s3', 'PutObject'),
+            ],
+            Resource=[Join('', ['arn:aws:s3:::', Ref(location), '/*'])],
+        ),
+        Statement(
+            Effect=Allow,
+            Action=[
+                awacs.aws.Action('s3', 'GetBucketAcl'),
+                awacs.aws.Action('s3', 'GetBucketLocation'),
+            ],
+            Resource=[Join('', ['arn:aws:s3:::', bucket])],
+        ),
+    ]
+    return ProjectCache(Type='S3', Location=Ref(location)), statements
@@ -0,0 +1,51 @@
+"""CloudFront types newer than the pinned troposphere (2.6.3).
+
+``AWS::CloudFront::ResponseHeadersPolicy`` and the ``ResponseHeadersPolicyId``
+cache behaviour property are declared here in troposphere's own style, so
+templates can use them without a troposphere 3.x upgrade. Drop this module
+once the pin moves past 3.1.
+"""
+from troposphere import AWSObject, AWSProperty, cloudfront
+from troposphere.validators import boolean
+
+
+class CustomHeader(AWSProperty):
+    props = {
+        'Header': (str, True),
+        'Override': (boolean, True),
+        'Value': (str, True),
+    }
+
+
+class CustomHeadersConfig(AWSProperty):
+    props = {
+        'Items': ([CustomHeader], True),
+    }
+
+
+class ResponseHeadersPolicyConfig(AWSProperty):
+    props = {
+        'Comment': (str, False),
+        'CustomHeadersConfig': (CustomHeadersConfig, False),
+        'Name': (str, True),
+    }
+
+
+class ResponseHeadersPolicy(AWSObject):
+    resource_type = 'AWS::CloudFront::ResponseHeadersPolicy'
+
+    props = {
+        'ResponseHeadersPolicyConfig': (ResponseHeadersPolicyConfig, True),
+    }
+
+
+class CacheBehavior(cloudfront.CacheBehavior):
+    props = dict(
+        cloudfront.CacheBehavior.props, ResponseHeadersPolicyId=(str, False)
+    )
+
+
+class DefaultCacheBehavior(cloudfront.DefaultCacheBehavior):
+    props = dict(
+        cloudfront.DefaultCacheBehavior.props, ResponseHeadersPolicyId=(str, False)
+    )
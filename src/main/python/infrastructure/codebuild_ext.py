@@ -0,0 +1,11 @@
+"""CodeBuild properties newer than the pinned troposphere (2.6.3).
+
+The webhook ``BuildType`` (``BUILD`` or ``BUILD_BATCH``) is declared here in
+troposphere's own style, so batch builds can be started from webhooks without
+a troposphere 3.x upgrade. Drop this module once the pin moves past 3.0.
+"""
+from troposphere import codebuild
+
+
+class ProjectTriggers(codebuild.ProjectTriggers):
+    props = dict(codebuild.ProjectTriggers.props, BuildType=(str, False))
@@ -0,0 +1,363 @@
+"""Incremental compiler for the CloudFormation template modules.
+
+A template module is any module in this directory that defines a
+module-level ``OUTPUT`` file name and a ``build(**params)`` function
+returning a troposphere ``Template``. Each module is fingerprinted from its
+own source, the source of the sibling modules it imports and the parameters
+it is rendered with; only modules whose fingerprint changed are rendered,
+and outputs are only rewritten when the rendered JSON differs.
+
+Template modules import troposphere and awacs inside ``build`` so that
+discovering and fingerprinting them stays cheap; see ``startup.py``.
+
+    python compiler.py                  # compile every stale template
+    python compiler.py voyclib --force  # re-render voyclib.json
+    python compiler.py --set app_name=voyclib --set batch=false
+    python compiler.py --nested --minify # split oversized stacks
+"""
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from collections import OrderedDict, namedtuple
+
+import split
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = '.template-cache.json'
+
+# Changes to how templates are rendered invalidate every fingerprint.
+TOOL_SOURCES = [os.path.join(HERE, 'compiler.py'), os.path.join(HERE, 'split.py')]
+
+RENDER_OPTIONS = {'minify': False, 'nested': False}
+
+TemplateModule = namedtuple(
+    'TemplateModule', ['name', 'path', 'output', 'defaults', 'sources']
+)
+
+
+###########################################
+#               Discovery
+###########################################
+
+def _parse(path):
+    with open(path, 'rb') as f:
+        return ast.parse(f.read(), filename=path)
+
+
+def _assigned(tree, name):
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == name
+            for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    return None
+
+
+def _imported_names(tree):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name.split('.')[0]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            yield node.module.split('.')[0]
+
+
+def _local_sources(path, directory, seen=None):
+    """Return ``path`` and every sibling module it imports, transitively."""
+    seen = set() if seen is None else seen
+    if path in seen:
+        return seen
+    seen.add(path)
+    for name in _imported_names(_parse(path)):
+        sibling = os.path.join(directory, name + '.py')
+        if os.path.isfile(sibling):
+            _local_sources(sibling, directory, seen)
+    return seen
+
+
+def discover(directory=HERE):
+    modules = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.py'):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            tree = _parse(path)
+        except SyntaxError as e:
+            print(f'{filename}: skipped, {e}', file=sys.stderr)
+            continue
+        output = _assigned(tree, 'OUTPUT')
+        has_build = any(
+            isinstance(node, ast.FunctionDef) and node.name == 'build'
+            for node in tree.body
+        )
+        if not output or not has_build:
+            continue
+        modules.append(
+            TemplateModule(
+                name=filename[:-3],
+                path=path,
+                output=output,
+                defaults=_assigned(tree, 'defaults') or {},
+                sources=sorted(_local_sources(path, directory)),
+            )
+        )
+    return modules
+
+
+###########################################
+#             Fingerprinting
+###########################################
+
+def module_params(module, overrides):
+    """Keep only the overrides the module declares in its ``defaults``."""
+    return {k: v for k, v in (overrides or {}).items() if k in module.defaults}
+
+
+def fingerprint(module, params, options=None):
+    digest = hashlib.sha256()
+    for source in module.sources + TOOL_SOURCES:
+        digest.update(os.path.basename(source).encode())
+        with open(source, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    options = dict(RENDER_OPTIONS, **(options or {}))
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _digest_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def record(cache, module, key, files, out_dir):
+    """Store a render in ``cache``, removing split files it no longer has."""
+    previous = cache.get(module.output, {}).get('files', {})
+    for name in set(previous) - set(files):
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except FileNotFoundError:
+            pass
+    cache[module.output] = {'fingerprint': key, 'files': files}
+
+
+###########################################
+#               Rendering
+###########################################
+
+def load(module):
+    directory = os.path.dirname(module.path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(module.name, module.path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def render(module, params, minify=False, nested=False):
+    """Return ``{filename: JSON}`` for ``module``, its ``OUTPUT`` first.
+
+    ``nested`` splits templates over the CloudFormation limits into a parent
+    and child stacks (see ``split.py``); ``minify`` drops all whitespace.
+    """
+    template = load(module).build(**params)
+    if not minify and not nested:
+        return OrderedDict([(module.output, template.to_json())])
+
+    if nested:
+        stem = os.path.splitext(module.output)[0]
+        templates = split.split(template.to_dict(), stem)
+    else:
+        templates = {module.output: template.to_dict()}
+    if minify:
+        dump = split.minified
+    else:
+        def dump(t):
+            return json.dumps(t, indent=4, sort_keys=True, separators=(',', ': '))
+    return OrderedDict((name, dump(t)) for name, t in templates.items())
+
+
+def write_if_changed(path, text):
+    data = text.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def render_to(module, params, out_dirs, **options):
+    """Render ``module`` once and write its files into every ``out_dirs``.
+
+    Returns ``{filename: sha256}`` and one status per output directory.
+    """
+    files = render(module, params, **options)
+    statuses = []
+    for out_dir in out_dirs:
+        written = [
+            write_if_changed(os.path.join(out_dir, name), text)
+            for name, text in files.items()
+        ]
+        statuses.append('written' if any(written) else 'unchanged')
+    digests = {
+        name: hashlib.sha256(text.encode('utf-8')).hexdigest()
+        for name, text in files.items()
+    }
+    return digests, statuses
+
+
+def select(modules, names):
+    if not names:
+        return modules
+    unknown = set(names) - {m.name for m in modules}
+    if unknown:
+        raise ValueError(
+            'Unknown template modules: %s' % ', '.join(sorted(unknown))
+        )
+    return [m for m in modules if m.name in names]
+
+
+def plan(modules, out_dir, overrides, cache, force=False, options=None):
+    """Yield ``(module, params, fingerprint, fresh)`` per module."""
+    for module in modules:
+        params = module_params(module, overrides)
+        key = fingerprint(module, params, options)
+        entry = cache.get(module.output, {})
+        fresh = (
+            not force
+            and entry.get('fingerprint') == key
+            and bool(entry.get('files'))
+            and all(
+                _digest_file(os.path.join(out_dir, name)) == digest
+                for name, digest in entry['files'].items()
+            )
+        )
+        yield module, params, key, fresh
+
+
+def compile_templates(names=None, directory=HERE, out_dir=None, overrides=None,
+                      force=False, minify=False, nested=False):
+    """Render stale template modules.
+
+    Returns a list of ``(module name, output path, status)`` where status is
+    ``fresh`` (fingerprint and outputs matched, nothing rendered),
+    ``unchanged`` (rendered to identical bytes) or ``written``.
+    """
+    out_dir = out_dir or directory
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    cache = load_cache(cache_path)
+    options = {'minify': minify, 'nested': nested}
+
+    results = []
+    modules = select(discover(directory), names)
+    for module, params, key, fresh in plan(
+        modules, out_dir, overrides, cache, force, options
+    ):
+        output = os.path.join(out_dir, module.output)
+        if fresh:
+            results.append((module.name, output, 'fresh'))
+            continue
+        files, [status] = render_to(module, params, [out_dir], **options)
+        record(cache, module, key, files, out_dir)
+        results.append((module.name, output, status))
+
+    save_cache(cache_path, cache)
+    return results
+
+
+def parse_overrides(pairs):
+    """``{key: value}`` of ``key=value`` pairs. Values are read as JSON, so
+    ``batch=false`` or ``index_ttl=300`` keep their type; anything that is
+    not JSON stays a string."""
+    overrides = {}
+    for pair in pairs or []:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError('Expected key=value, got %r' % pair)
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', help='Template modules to compile.')
+    parser.add_argument(
+        '--out-dir', help='Output directory (default: alongside sources).'
+    )
+    parser.add_argument(
+        '--set',
+        dest='overrides',
+        action='append',
+        metavar='KEY=VALUE',
+        help='Override a template default, eg: app_name=voyclib. VALUE is '
+        'read as JSON when it parses, eg: batch=false.',
+    )
+    parser.add_argument(
+        '--force', action='store_true', help='Ignore the fingerprint cache.'
+    )
+    parser.add_argument(
+        '--minify', action='store_true', help='Write JSON without whitespace.'
+    )
+    parser.add_argument(
+        '--nested',
+        action='store_true',
+        help='Split templates over the CloudFormation limits into nested stacks.',
+    )
+    args = parser.parse_args(argv)
+    try:
+        overrides = parse_overrides(args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = compile_templates(
+        names=args.modules,
+        out_dir=args.out_dir,
+        overrides=overrides,
+        force=args.force,
+        minify=args.minify,
+        nested=args.nested,
+    )
+    for name, output, status in results:
+        print(f'{status:>9}  {os.path.relpath(output)}  ({name})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Makes pytest put this directory, and the scripts in it, on sys.path.
@@ -0,0 +1,312 @@
+"""Deploy rendered templates as CloudFormation stacks, in dependency order.
+
+Stacks are described in a JSON file; template paths are relative to it:
+
+    [
+        {"name": "voyc-docs", "template": "docs_ci.json"},
+        {"name": "voyclib", "template": "voyclib.json",
+         "parameters": {"S3BucketSecret": "hello"}, "depends_on": ["voyc-docs"]}
+    ]
+
+Every stack is deployed through a change set. Empty change sets are deleted
+and the stack is reported ``unchanged``; otherwise the change set is executed
+and the stack's events are streamed until it settles. Stacks whose
+dependencies have succeeded run concurrently, and dependents of a failed
+stack are skipped. Polling backs off while nothing happens and tightens
+again as soon as new events arrive.
+
+A dry run deletes its change sets again, along with the empty stacks that
+change sets for new stacks leave in ``REVIEW_IN_PROGRESS``.
+
+    python deploy.py stacks.json --bucket voyc-templates
+    python deploy.py stacks.json --dry-run
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import boto3
+from botocore.exceptions import ClientError
+
+import artifacts
+import split
+
+
+CAPABILITIES = [
+    'CAPABILITY_IAM',
+    'CAPABILITY_NAMED_IAM',
+    'CAPABILITY_AUTO_EXPAND',
+]
+
+SUCCEEDED = {'CREATE_COMPLETE', 'UPDATE_COMPLETE', 'IMPORT_COMPLETE'}
+NO_CHANGES = ("didn't contain changes", 'No updates are to be performed')
+
+
+class Backoff(object):
+    """Poll interval that grows while idle and resets on progress."""
+
+    def __init__(self, minimum=1.0, maximum=20.0, factor=1.6):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = minimum
+
+    def sleep(self, progressed):
+        if progressed:
+            self.delay = self.minimum
+        else:
+            self.delay = min(self.delay * self.factor, self.maximum)
+        time.sleep(self.delay * random.uniform(0.8, 1.2))
+
+
+def load_stacks(path):
+    with open(path) as f:
+        stacks = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for stack in stacks:
+        stack['template'] = os.path.join(base, stack['template'])
+        stack.setdefault('parameters', {})
+        stack.setdefault('depends_on', [])
+    return stacks
+
+
+def ordered(stacks):
+    """Validate the dependency graph and return stacks in topological order."""
+    by_name = {s['name']: s for s in stacks}
+    order, done = [], set()
+
+    def visit(name, trail=()):
+        if name in done:
+            return
+        if name in trail:
+            raise ValueError('Circular stack dependency: %s' % ' -> '.join(trail))
+        if name not in by_name:
+            raise ValueError('Unknown stack dependency %r' % name)
+        for dep in by_name[name]['depends_on']:
+            visit(dep, trail + (name,))
+        done.add(name)
+        order.append(by_name[name])
+
+    for stack in stacks:
+        visit(stack['name'])
+    return order
+
+
+class Deployer(object):
+
+    def __init__(self, client=None, store=None, region=None, dry_run=False,
+                 out=sys.stdout):
+        self.client = client or boto3.client('cloudformation', region_name=region)
+        self.store = store
+        self.dry_run = dry_run
+        self.out = out
+        self.lock = threading.Lock()
+
+    def log(self, stack, message):
+        with self.lock:
+            print(f'[{stack}] {message}', file=self.out)
+
+    ###########################################
+    #           Single stack
+    ###########################################
+
+    def template_args(self, path):
+        files = artifacts.collect(path)
+        body = files[os.path.basename(path)]
+        if len(files) == 1 and len(body.encode('utf-8')) <= split.MAX_BODY_BYTES:
+            return {'TemplateBody': body}
+        if not self.store:
+            raise ValueError(
+                '%s is too large to pass inline or has nested stacks; '
+                'an artifact bucket is required' % path
+            )
+        urls, _ = self.store.publish(files)
+        return {'TemplateURL': urls[os.path.basename(path)]}
+
+    def status(self, name):
+        try:
+            stack = self.client.describe_stacks(StackName=name)['Stacks'][0]
+        except ClientError as e:
+            if 'does not exist' in e.response['Error']['Message']:
+                return None
+            raise
+        return stack['StackStatus']
+
+    def change_set(self, stack):
+        name = stack['name']
+        status = self.status(name)
+        kind = 'CREATE' if status in (None, 'REVIEW_IN_PROGRESS') else 'UPDATE'
+        change_set = self.client.create_change_set(
+            StackName=name,
+            ChangeSetName='deploy-%d' % (time.time() * 1000),
+            ChangeSetType=kind,
+            Capabilities=CAPABILITIES,
+            Parameters=[
+                {'ParameterKey': k, 'ParameterValue': str(v)}
+                for k, v in sorted(stack['parameters'].items())
+            ],
+            **self.template_args(stack['template'])
+        )
+
+        backoff = Backoff(minimum=0.5, maximum=5.0)
+        while True:
+            described = self.client.describe_change_set(
+                ChangeSetName=change_set['Id']
+            )
+            if described['Status'] == 'CREATE_COMPLETE':
+                return change_set['Id'], self.changes(change_set['Id'], described)
+            if described['Status'] == 'FAILED':
+                reason = described.get('StatusReason', '')
+                if any(text in reason for text in NO_CHANGES):
+                    self.client.delete_change_set(ChangeSetName=change_set['Id'])
+                    return None, []
+                raise RuntimeError('Change set failed: %s' % reason)
+            backoff.sleep(False)
+
+    def changes(self, change_set_id, described):
+        """Every change of a change set; large ones come back in pages."""
+        changes = list(described.get('Changes', []))
+        while described.get('NextToken'):
+            described = self.client.describe_change_set(
+                ChangeSetName=change_set_id, NextToken=described['NextToken']
+            )
+            changes.extend(described.get('Changes', []))
+        return changes
+
+    def stream(self, name, since):
+        """Print stack events after ``since`` until the stack settles."""
+        seen = set()
+        backoff = Backoff()
+        while True:
+            events = []
+            paginator = self.client.get_paginator('describe_stack_events')
+            for page in paginator.paginate(StackName=name):
+                fresh = [
+                    e for e in page['StackEvents']
+                    if e['EventId'] not in seen and e['Timestamp'] >= since
+                ]
+                events.extend(fresh)
+                # Events are newest first; stop once a page reaches old ones.
+                if len(fresh) < len(page['StackEvents']):
+                    break
+
+            for event in reversed(events):
+                seen.add(event['EventId'])
+                self.log(name, ' '.join(filter(None, [
+                    event['Timestamp'].strftime('%H:%M:%S'),
+                    event['LogicalResourceId'],
+                    event['ResourceStatus'],
+                    event.get('ResourceStatusReason'),
+                ])))
+
+            status = self.status(name)
+            if status and not status.endswith('_IN_PROGRESS'):
+                return status
+            backoff.sleep(bool(events))
+
+    def deploy(self, stack):
+        name = stack['name']
+        change_set_id, changes = self.change_set(stack)
+        if not change_set_id:
+            self.log(name, 'no changes')
+            return 'unchanged'
+
+        for change in changes:
+            rc = change['ResourceChange']
+            self.log(name, '%s %s (%s)' % (
+                rc['Action'], rc['LogicalResourceId'], rc['ResourceType']
+            ))
+        if self.dry_run:
+            self.client.delete_change_set(ChangeSetName=change_set_id)
+            # A CREATE change set leaves an empty stack behind; remove it.
+            if self.status(name) == 'REVIEW_IN_PROGRESS':
+                self.client.delete_stack(StackName=name)
+            return 'planned'
+
+        since = self.client.describe_change_set(
+            ChangeSetName=change_set_id
+        )['CreationTime']
+        self.client.execute_change_set(ChangeSetName=change_set_id)
+        status = self.stream(name, since)
+        if status not in SUCCEEDED:
+            raise RuntimeError('Stack ended in %s' % status)
+        return status
+
+    ###########################################
+    #           Scheduling
+    ###########################################
+
+    def deploy_all(self, stacks, max_parallel=4):
+        """Deploy ``stacks``, running each as soon as its dependencies succeed.
+
+        Returns ``{stack name: result}`` where result is a final stack status,
+        ``unchanged``, ``planned``, ``failed: ...`` or ``skipped``.
+        """
+        stacks = ordered(stacks)
+        results = {}
+        waiting = list(stacks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            while waiting or running:
+                for stack in list(waiting):
+                    deps = stack['depends_on']
+                    if any(results.get(d, '').startswith(('failed', 'skipped'))
+                           for d in deps):
+                        waiting.remove(stack)
+                        results[stack['name']] = 'skipped'
+                        self.log(stack['name'], 'skipped, a dependency failed')
+                    elif all(d in results for d in deps):
+                        waiting.remove(stack)
+                        running[pool.submit(self.deploy, stack)] = stack['name']
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        results[name] = 'failed: %s' % e
+                        self.log(name, results[name])
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stacks', help='JSON file describing the stacks.')
+    parser.add_argument('--region')
+    parser.add_argument('--bucket', help='Artifact bucket for large templates.')
+    parser.add_argument('--prefix', default='templates')
+    parser.add_argument('--max-parallel', type=int, default=4)
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Create and print change sets, then delete them and any stacks '
+        'they created.',
+    )
+    args = parser.parse_args(argv)
+
+    store = None
+    if args.bucket:
+        store = artifacts.ArtifactStore(
+            args.bucket, prefix=args.prefix, region=args.region
+        )
+    deployer = Deployer(region=args.region, store=store, dry_run=args.dry_run)
+    results = deployer.deploy_all(load_stacks(args.stacks), args.max_parallel)
+
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(f'{name:<{width}}  {result}')
+    if any(r.startswith(('failed', 'skipped')) for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
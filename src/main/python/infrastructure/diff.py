@@ -0,0 +1,342 @@
+"""Structural diff between CloudFormation templates.
+
+Templates are compared section by section (parameters, mappings, conditions,
+resources, outputs) as trees rather than as text. Equal sections and entries
+are skipped with Python's own ``==``, and only changed entries are walked to
+find the property paths that differ.
+
+Hashing a template into an ``Index`` costs several plain comparisons, so it
+only pays for a template that is kept and diffed many times, eg: a baseline
+compared with many candidates. Two ``Index``es are compared by their
+per-entry digests; a diff involving a plain template never hashes.
+
+    python diff.py voyclib.json build/voyclib.json
+    python diff.py --check              # rendered templates vs committed JSON
+
+``--check`` also compares the batch build-graph of buildspec.yml with the
+one a module's ``build_graph`` generates from its parameters.
+    python diff.py --bench --resources 2000
+"""
+import argparse
+import hashlib
+import json
+import marshal
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+
+import yaml
+
+import compiler
+
+
+SECTIONS = ('Parameters', 'Mappings', 'Conditions', 'Resources', 'Outputs')
+# Where the ``buildspec_path`` of a module's parameters is found.
+SOURCE_ROOT = os.path.normpath(os.path.join(compiler.HERE, '..', '..', '..', '..'))
+
+SectionDiff = namedtuple('SectionDiff', ['added', 'removed', 'changed'])
+
+
+def digest(value):
+    """Process-local digest of a JSON value.
+
+    marshal is an order of magnitude faster than ``json.dumps`` here. Format
+    version 0 writes no object references or interning flags, so the digest
+    depends on the value only, not on how it was built. It is sensitive to
+    dict ordering, so equal digests mean equal values but a mismatch is only
+    confirmed by walking the entry.
+    """
+    return hashlib.blake2b(marshal.dumps(value, 0), digest_size=16).digest()
+
+
+class Index(object):
+    """Per-entry digests of a template, computed once for repeated diffs."""
+
+    def __init__(self, template):
+        self.template = template
+        self.header, self.values = _split(template)
+        self.digests = {
+            section: {name: digest(value) for name, value in entries.items()}
+            for section, entries in self.values.items()
+        }
+
+
+def _split(template):
+    """``(header, {section: entries})`` of a template dict or ``Index``."""
+    if isinstance(template, Index):
+        return template.header, template.values
+    header = {
+        key: value for key, value in template.items() if key not in SECTIONS
+    }
+    return header, {section: template.get(section, {}) for section in SECTIONS}
+
+
+def changes(old, new, path=()):
+    """Yield ``(path, old, new)`` for every leaf that differs."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new), key=str):
+            if key not in new:
+                yield path + (key,), old[key], None
+            elif key not in old:
+                yield path + (key,), None, new[key]
+            elif old[key] != new[key]:
+                yield from changes(old[key], new[key], path + (key,))
+    elif isinstance(old, list) and isinstance(new, list):
+        for i in range(max(len(old), len(new))):
+            a = old[i] if i < len(old) else None
+            b = new[i] if i < len(new) else None
+            if a != b:
+                yield from changes(a, b, path + (i,))
+    else:
+        yield path, old, new
+
+
+def diff(old, new):
+    """Compare two templates (dicts or ``Index``es) section by section.
+
+    Returns ``{section: SectionDiff}`` for sections that differ; the
+    ``Template`` pseudo-section covers top level keys such as Description.
+    ``changed`` maps entry names to their ``(path, old, new)`` leaf changes.
+    Digests are only compared when both templates are ``Index``es.
+    """
+    hashed = isinstance(old, Index) and isinstance(new, Index)
+    old_header, old_values = _split(old)
+    new_header, new_values = _split(new)
+    result = {}
+
+    if old_header != new_header:
+        result['Template'] = SectionDiff(
+            [], [], {'': list(changes(old_header, new_header))}
+        )
+
+    for section in SECTIONS:
+        before, after = old_values[section], new_values[section]
+        if hashed:
+            old_digests, new_digests = old.digests[section], new.digests[section]
+            if old_digests == new_digests:
+                continue
+        elif before == after:
+            continue
+        changed = {}
+        for name in sorted(
+            name for name in before.keys() & after.keys()
+            if (old_digests[name] != new_digests[name] if hashed
+                else before[name] != after[name])
+        ):
+            # Equal digests mean equal values; a mismatch may only be
+            # ordering, which the walk does not report.
+            leaves = list(changes(before[name], after[name]))
+            if leaves:
+                changed[name] = leaves
+        added = sorted(after.keys() - before.keys())
+        removed = sorted(before.keys() - after.keys())
+        if added or removed or changed:
+            result[section] = SectionDiff(added, removed, changed)
+    return result
+
+
+def _describe(value):
+    text = json.dumps(value, sort_keys=True)
+    return text if len(text) <= 60 else text[:57] + '...'
+
+
+def format_diff(result, new=None):
+    new = _split(new)[1] if new is not None else None
+    lines = []
+    for section in ('Template',) + SECTIONS:
+        if section not in result:
+            continue
+        added, removed, changed = result[section]
+        lines.append(section)
+        for name in added:
+            entry = new[section][name] if new else {}
+            kind = entry.get('Type') if isinstance(entry, dict) else None
+            lines.append(f'  + {name}' + (f' ({kind})' if kind else ''))
+        for name in removed:
+            lines.append(f'  - {name}')
+        for name, leaves in changed.items():
+            if name:
+                lines.append(f'  ~ {name}')
+            for path, a, b in leaves:
+                lines.append(
+                    '      %s: %s -> %s'
+                    % ('.'.join(map(str, path)), _describe(a), _describe(b))
+                )
+    return lines
+
+
+###########################################
+#         Rendered vs committed
+###########################################
+
+def check(names=None, directory=compiler.HERE, overrides=None, out=sys.stdout):
+    """Diff freshly rendered templates against the JSON committed beside them.
+
+    Modules without a committed output are skipped. Returns the names of the
+    modules whose generator and artifact disagree.
+    """
+    stale = []
+    for module in compiler.select(compiler.discover(directory), names):
+        committed = os.path.join(directory, module.output)
+        if not os.path.exists(committed):
+            continue
+        with open(committed) as f:
+            old = json.load(f)
+        params = compiler.module_params(module, overrides)
+        new = json.loads(compiler.render(module, params)[module.output])
+        result = diff(old, new)
+        if result:
+            stale.append(module.name)
+            print(f'{module.output} is out of date with {module.name}.py', file=out)
+            for line in format_diff(result, new):
+                print('  ' + line, file=out)
+        else:
+            print(f'{module.output} matches {module.name}.py', file=out)
+        generate = getattr(compiler.load(module), 'build_graph', None)
+        if generate and not check_build_graph(
+            module, dict(module.defaults, **params), generate, out=out
+        ):
+            stale.append(module.name)
+    return stale
+
+
+def check_build_graph(module, params, generate, source=SOURCE_ROOT,
+                      out=sys.stdout):
+    """Whether the buildspec's ``batch.build-graph`` is ``generate``'s for the
+    module's ``test_matrix``; a module building without batches passes."""
+    if not params.get('batch'):
+        return True
+    path = params['buildspec_path']
+    with open(os.path.join(source, path)) as f:
+        graph = (yaml.safe_load(f).get('batch') or {}).get('build-graph')
+    expected = generate(params['test_matrix'])
+    if graph == expected:
+        print(f'{path} build-graph matches {module.name}.py', file=out)
+        return True
+    print(f'{path} build-graph is out of date with {module.name}.py; '
+          'expected:', file=out)
+    text = yaml.safe_dump({'build-graph': expected}, sort_keys=False)
+    for line in text.splitlines():
+        print('  ' + line, file=out)
+    return False
+
+
+###########################################
+#               Benchmark
+###########################################
+
+def synthetic_template(resources, seed=0):
+    rng = random.Random(seed)
+    template = {
+        'Description': 'Synthetic benchmark template',
+        'Parameters': {},
+        'Resources': {},
+        'Outputs': {},
+    }
+    for i in range(resources):
+        name = f'Bucket{i}'
+        template['Parameters'][f'Param{i}'] = {
+            'Type': 'String', 'Default': f'value-{i}'
+        }
+        template['Resources'][name] = {
+            'Type': 'AWS::S3::Bucket',
+            'Properties': {
+                'BucketName': {'Fn::Sub': f'voyc-{i}-${{AWS::StackName}}'},
+                'Tags': [
+                    {'Key': f'tag{j}', 'Value': rng.random()} for j in range(8)
+                ],
+                'LifecycleConfiguration': {
+                    'Rules': [
+                        {'Id': f'rule{j}', 'ExpirationInDays': rng.randint(1, 90)}
+                        for j in range(4)
+                    ]
+                },
+            },
+        }
+        template['Outputs'][f'{name}Arn'] = {
+            'Value': {'Fn::GetAtt': [name, 'Arn']}
+        }
+    return template
+
+
+def bench(resources=1000, changed=10, repeat=5, out=sys.stdout):
+    old = synthetic_template(resources)
+    # Through JSON, as templates read from disk, so ``==`` cannot shortcut
+    # on objects shared by both sides.
+    new = json.loads(json.dumps(old))
+    rng = random.Random(1)
+    for i in rng.sample(range(resources), changed):
+        new['Resources'][f'Bucket{i}']['Properties']['Tags'][0]['Value'] = 'changed'
+    del new['Resources']['Bucket0']
+    new['Resources']['Extra'] = {'Type': 'AWS::SNS::Topic'}
+
+    def timed(fn):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    old_index, new_index = Index(old), Index(new)
+    timings = [
+        ('diff two templates', timed(lambda: diff(old, new))),
+        ('diff two kept indexes', timed(lambda: diff(old_index, new_index))),
+        ('index one template', timed(lambda: Index(new))),
+        ('full-tree leaf walk', timed(lambda: list(changes(old, new)))),
+    ]
+    size = len(json.dumps(old))
+    print(
+        f'{resources} resources, {changed} changed, {size / 1024:.0f} KiB JSON',
+        file=out,
+    )
+    for label, ms in timings:
+        print(f'  {label:<32}{ms:8.2f} ms', file=out)
+    plain, kept, index = timings[0][1], timings[1][1], timings[2][1]
+    if plain > kept:
+        print(
+            f'  an index pays off after {index / (plain - kept):.1f} diffs',
+            file=out,
+        )
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', help='OLD.json NEW.json')
+    parser.add_argument(
+        '--check', nargs='*', metavar='MODULE',
+        help='Diff rendered templates against their committed JSON.',
+    )
+    parser.add_argument(
+        '--bench', action='store_true', help='Benchmark on a synthetic template.'
+    )
+    parser.add_argument('--resources', type=int, default=1000)
+    parser.add_argument('--changed', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        bench(args.resources, args.changed)
+        return
+    if args.check is not None:
+        if check(args.check):
+            sys.exit(1)
+        return
+    if len(args.files) != 2:
+        parser.error('expected OLD.json NEW.json, --check or --bench')
+
+    templates = []
+    for path in args.files:
+        with open(path) as f:
+            templates.append(json.load(f))
+    result = diff(*templates)
+    for line in format_diff(result, templates[1]):
+        print(line)
+    if result:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
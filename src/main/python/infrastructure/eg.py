@@ -1,447 +1,611 @@
-import awacs
-from awacs.aws import Allow, Principal, Statement
-from awacs.sts import AssumeRole
-from troposphere import GetAtt, Join, Parameter, Ref, Sub, Tags, Template
-from troposphere.cloudfront import (
-    CloudFrontOriginAccessIdentity,
-    CloudFrontOriginAccessIdentityConfig,
-    DefaultCacheBehavior,
-    Distribution,
-    DistributionConfig,
-    ForwardedValues,
-    Origin,
-    S3OriginConfig,
-    ViewerCertificate,
-)
-from troposphere.codebuild import (
-    Artifacts,
-    Environment,
-    Project,
-    ProjectTriggers,
-    Source,
-    SourceAuth,
-    WebhookFilter,
-)
-from troposphere.iam import PolicyType, Role
-from troposphere.s3 import (
-    Bucket,
-    BucketEncryption,
-    BucketPolicy,
-    ServerSideEncryptionByDefault,
-    ServerSideEncryptionRule,
-    VersioningConfiguration,
-)
-
-
-t = Template()
-t.set_version()
-t.set_description(
-    'Generate static S3 hosting for Voyc docs as well as the Codebuild pipeline'
-    ' for building static docs.'
-)
-
-ref_region = Ref('AWS::Region')
-ref_account_id = Ref('AWS::AccountId')
-ref_stack_name = Ref('AWS::StackName')
+OUTPUT = 'docs_ci.json'
 
-###########################################
-#                 Params
-###########################################
+defaults = {
+    'account_id': '585487584801',
+    'region': 'eu-west-1',
+    'app_name': 'docs',
+    'acl_id': '70c9cf49-0771-4a10-8491-fe6d5d401e45',
+    'certificate_id': 'fb84241d-1bea-4adc-934a-cd37dd54e1ba',
+    # See buildcache.py.
+    'cache': {'type': 'LOCAL', 'modes': ['source', 'custom']},
+    # One CloudFront cache behaviour per row; the row without a ``path`` is
+    # the default behaviour. Each row uses either a ``managed`` cache policy
+    # or a custom one with a fixed edge ``ttl`` (seconds), optionally keyed
+    # on the query string. ``cache_control`` is the header sent to browsers.
+    'cache_table': [
+        {
+            # Sphinx appends ?v=<checksum> to everything under _static.
+            'name': 'assets',
+            'path': '_static/*',
+            'ttl': 31536000,
+            'query_strings': True,
+            'cache_control': 'public, max-age=31536000, immutable',
+        },
+        {
+            'name': 'images',
+            'path': '_images/*',
+            'managed': 'CachingOptimized',
+            'cache_control': 'public, max-age=86400',
+        },
+        {
+            'name': 'search',
+            'path': 'searchindex.js',
+            'ttl': 300,
+            'cache_control': 'public, max-age=300',
+        },
+        {
+            'name': 'html',
+            'ttl': 300,
+            'cache_control': 'public, max-age=0, must-revalidate',
+        },
+    ],
+}
 
-cloudfront_cnames = t.add_parameter(
-    Parameter(
-        'CloudfrontCnames',
-        Description=(
-            'Comma delimited list of hostnames that will serve as Cloudfront CNAMEs.'
-        ),
-        Type='CommaDelimitedList',
-        Default='docs.voyc.ai',
+MANAGED_CACHE_POLICIES = {
+    'CachingOptimized': '658327ea-f89d-4fab-a63d-7e88639e58f6',
+    'CachingOptimizedForUncompressedObjects': 'b2884449-e4de-46a7-ac36-70bc7f1ddd6d',
+    'CachingDisabled': '4135ea2d-6df8-44a3-9df3-4b5a84be39ad',
+}
+
+
+def build(**params):
+    import awacs
+    import buildcache
+    from awacs.aws import Allow, Principal, Statement
+    from awacs.sts import AssumeRole
+    from cloudfront_ext import (
+        CacheBehavior,
+        CustomHeader,
+        CustomHeadersConfig,
+        DefaultCacheBehavior,
+        ResponseHeadersPolicy,
+        ResponseHeadersPolicyConfig,
     )
-)
-t.set_parameter_label(cloudfront_cnames, 'Cloudfront CNAMEs')
-
-acl_arn = t.add_parameter(
-    Parameter(
-        'AclArn',
-        Description='Arn for WAFv2 ACL which allows VPN IP access.',
-        Type='String',
-        Default=(
-            'arn:aws:wafv2:us-east-1:585487584801:global/webacl/voyc-docs-acl/'
-            '70c9cf49-0771-4a10-8491-fe6d5d401e45'
-        ),
-        MinLength='51',
-        MaxLength='256',
-        ConstraintDescription=('WAF2 ACL Arn between 51 and 256 characters.'),
+    from troposphere import GetAtt, Join, Parameter, Ref, Sub, Tags, Template
+    from troposphere.cloudfront import (
+        CacheCookiesConfig,
+        CacheHeadersConfig,
+        CachePolicy,
+        CachePolicyConfig,
+        CacheQueryStringsConfig,
+        CloudFrontOriginAccessIdentity,
+        CloudFrontOriginAccessIdentityConfig,
+        Distribution,
+        DistributionConfig,
+        Origin,
+        ParametersInCacheKeyAndForwardedToOrigin,
+        S3OriginConfig,
+        ViewerCertificate,
     )
-)
-t.set_parameter_label(acl_arn, 'ACL Arn')
-
-acm_arn = t.add_parameter(
-    Parameter(
-        'AcmCertArm',
-        Description='Arn for the ACM certificate.',
-        Type='String',
-        Default=(
-            'arn:aws:acm:us-east-1:585487584801:certificate/'
-            'fb84241d-1bea-4adc-934a-cd37dd54e1ba'
-        ),
-        MinLength='51',
-        MaxLength='256',
-        ConstraintDescription=('ACM certificate Arn between 51 and 256 characters.'),
+    from troposphere.codebuild import (
+        Artifacts,
+        Environment,
+        Project,
+        ProjectTriggers,
+        Source,
+        SourceAuth,
+        WebhookFilter,
     )
-)
-t.set_parameter_label(acl_arn, 'Certificate Arn')
-
-git_location = t.add_parameter(
-    Parameter(
-        'GitLocation',
-        Description='The Github HTTPS clone URL.',
-        Type='String',
-        Default='https://github.com/voyc-ai/voyc.git',
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Git clone URL is required.'),
+    from troposphere.iam import PolicyType, Role
+    from troposphere.s3 import (
+        Bucket,
+        BucketEncryption,
+        BucketPolicy,
+        ServerSideEncryptionByDefault,
+        ServerSideEncryptionRule,
+        VersioningConfiguration,
     )
-)
-t.set_parameter_label(git_location, 'Github Location')
-
-branch_name = t.add_parameter(
-    Parameter(
-        'BranchName',
-        Description='The Git branch name to use. Eg: develop',
-        Type='String',
-        Default='develop',
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Branch name is required.'),
+
+    params = dict(defaults, **params)
+    account = params['account_id']
+    name = 'voyc-%s' % params['app_name']
+
+    t = Template()
+    t.set_version()
+    t.set_description(
+        'Generate static S3 hosting for Voyc docs as well as the Codebuild pipeline'
+        ' for building static docs.'
     )
-)
-t.set_parameter_label(branch_name, 'Branch Name')
-
-buildspec_location_param = t.add_parameter(
-    Parameter(
-        'DocsBuildspecPath',
-        Description='The documentation buildspec.yml file path.',
-        Type='String',
-        Default='codebuild/buildspec_docs.yml',
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription='Buildspec path smaller than 128 characters is required.',
+
+    ref_region = Ref('AWS::Region')
+    ref_account_id = Ref('AWS::AccountId')
+    ref_stack_name = Ref('AWS::StackName')
+
+    ###########################################
+    #                 Params
+    ###########################################
+
+    cloudfront_cnames = t.add_parameter(
+        Parameter(
+            'CloudfrontCnames',
+            Description=(
+                'Comma delimited list of hostnames that will serve as Cloudfront'
+                ' CNAMEs.'
+            ),
+            Type='CommaDelimitedList',
+            Default='docs.voyc.ai',
+        )
     )
-)
-t.set_parameter_label(buildspec_location_param, 'Buildspec Path')
-
-build_image = t.add_parameter(
-    Parameter(
-        'BuildImage',
-        Description='The Codebuild build image.',
-        Type='String',
-        Default='aws/codebuild/amazonlinux2-x86_64-standard:3.0',
-        MinLength='1',
-        MaxLength='256',
-        ConstraintDescription=('Build image is required.'),
+    t.set_parameter_label(cloudfront_cnames, 'Cloudfront CNAMEs')
+
+    acl_arn = t.add_parameter(
+        Parameter(
+            'AclArn',
+            Description='Arn for WAFv2 ACL which allows VPN IP access.',
+            Type='String',
+            Default=(
+                'arn:aws:wafv2:us-east-1:%s:global/webacl/%s-acl/%s'
+                % (account, name, params['acl_id'])
+            ),
+            MinLength='51',
+            MaxLength='256',
+            ConstraintDescription=('WAF2 ACL Arn between 51 and 256 characters.'),
+        )
     )
-)
-t.set_parameter_label(build_image, 'Build Image')
+    t.set_parameter_label(acl_arn, 'ACL Arn')
 
-for cf_param in [cloudfront_cnames, acl_arn, acm_arn]:
-    t.add_parameter_to_group(cf_param, 'Cloudfront')
+    acm_arn = t.add_parameter(
+        Parameter(
+            'AcmCertArm',
+            Description='Arn for the ACM certificate.',
+            Type='String',
+            Default=(
+                'arn:aws:acm:us-east-1:%s:certificate/%s'
+                % (account, params['certificate_id'])
+            ),
+            MinLength='51',
+            MaxLength='256',
+            ConstraintDescription=(
+                'ACM certificate Arn between 51 and 256 characters.'
+            ),
+        )
+    )
+    t.set_parameter_label(acl_arn, 'Certificate Arn')
 
-for git_param in [git_location, branch_name]:
-    t.add_parameter_to_group(git_param, 'Git')
+    git_location = t.add_parameter(
+        Parameter(
+            'GitLocation',
+            Description='The Github HTTPS clone URL.',
+            Type='String',
+            Default='https://github.com/voyc-ai/voyc.git',
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Git clone URL is required.'),
+        )
+    )
+    t.set_parameter_label(git_location, 'Github Location')
 
-for codebuild_param in [buildspec_location_param, build_image]:
-    t.add_parameter_to_group(codebuild_param, 'Codebuild')
+    branch_name = t.add_parameter(
+        Parameter(
+            'BranchName',
+            Description='The Git branch name to use. Eg: develop',
+            Type='String',
+            Default='develop',
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Branch name is required.'),
+        )
+    )
+    t.set_parameter_label(branch_name, 'Branch Name')
 
-###########################################
-#                  OAI
-###########################################
+    buildspec_location_param = t.add_parameter(
+        Parameter(
+            'DocsBuildspecPath',
+            Description='The documentation buildspec.yml file path.',
+            Type='String',
+            Default='codebuild/buildspec_docs.yml',
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=(
+                'Buildspec path smaller than 128 characters is required.'
+            ),
+        )
+    )
+    t.set_parameter_label(buildspec_location_param, 'Buildspec Path')
 
-cloudfront_oai = t.add_resource(
-    CloudFrontOriginAccessIdentity(
-        'CloudfrontOAI',
-        CloudFrontOriginAccessIdentityConfig=CloudFrontOriginAccessIdentityConfig(
-            Comment='OAI to private Voyc docs S3 bucket.',
-        ),
+    build_image = t.add_parameter(
+        Parameter(
+            'BuildImage',
+            Description='The Codebuild build image.',
+            Type='String',
+            Default='aws/codebuild/amazonlinux2-x86_64-standard:3.0',
+            MinLength='1',
+            MaxLength='256',
+            ConstraintDescription=('Build image is required.'),
+        )
     )
-)
+    t.set_parameter_label(build_image, 'Build Image')
 
-###########################################
-#                  S3
-###########################################
+    for cf_param in [cloudfront_cnames, acl_arn, acm_arn]:
+        t.add_parameter_to_group(cf_param, 'Cloudfront')
+
+    for git_param in [git_location, branch_name]:
+        t.add_parameter_to_group(git_param, 'Git')
+
+    for codebuild_param in [buildspec_location_param, build_image]:
+        t.add_parameter_to_group(codebuild_param, 'Codebuild')
+
+    cache, cache_statements = buildcache.add(t, params['cache'])
+
+    ###########################################
+    #                  OAI
+    ###########################################
+
+    cloudfront_oai = t.add_resource(
+        CloudFrontOriginAccessIdentity(
+            'CloudfrontOAI',
+            CloudFrontOriginAccessIdentityConfig=CloudFrontOriginAccessIdentityConfig(
+                Comment='OAI to private Voyc docs S3 bucket.',
+            ),
+        )
+    )
+
+    ###########################################
+    #                  S3
+    ###########################################
 
-s3_storage = t.add_resource(
-    Bucket(
-        'S3StorageBucket',
-        BucketName=Sub('voyc-docs'),
-        BucketEncryption=BucketEncryption(
-            ServerSideEncryptionConfiguration=[
-                ServerSideEncryptionRule(
-                    ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
-                        SSEAlgorithm='AES256'
+    s3_storage = t.add_resource(
+        Bucket(
+            'S3StorageBucket',
+            BucketName=Sub(name),
+            BucketEncryption=BucketEncryption(
+                ServerSideEncryptionConfiguration=[
+                    ServerSideEncryptionRule(
+                        ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
+                            SSEAlgorithm='AES256'
+                        )
                     )
-                )
-            ]
-        ),
-        VersioningConfiguration=VersioningConfiguration(Status='Enabled'),
-        Tags=Tags(
-            Name=Sub('voyc-${AWS::StackName}'),
-        ),
+                ]
+            ),
+            VersioningConfiguration=VersioningConfiguration(Status='Enabled'),
+            Tags=Tags(
+                Name=Sub('voyc-${AWS::StackName}'),
+            ),
+        )
     )
-)
-
-codebuild_role = t.add_resource(
-    Role(
-        'CodebuildRole',
-        AssumeRolePolicyDocument=awacs.aws.PolicyDocument(
-            Statement=[
-                Statement(
-                    Principal=Principal('Service', ['codebuild.amazonaws.com']),
-                    Effect=Allow,
-                    Action=[AssumeRole],
-                )
-            ]
-        ),
-        RoleName=Sub('voyc-docs-codebuild'),
+
+    codebuild_role = t.add_resource(
+        Role(
+            'CodebuildRole',
+            AssumeRolePolicyDocument=awacs.aws.PolicyDocument(
+                Statement=[
+                    Statement(
+                        Principal=Principal('Service', ['codebuild.amazonaws.com']),
+                        Effect=Allow,
+                        Action=[AssumeRole],
+                    )
+                ]
+            ),
+            RoleName=Sub('%s-codebuild' % name),
+        )
     )
-)
 
-cloudfront_policy = t.add_resource(
-    BucketPolicy(
-        'CloudfrontBucketPolicy',
-        DependsOn=[
-            'CloudfrontOAI',
-            'S3StorageBucket',
-            'DocsProject',
-        ],
-        Bucket=Ref(s3_storage),
-        PolicyDocument=awacs.aws.Policy(
-            Statement=[
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('s3', 'GetObject'),
-                    ],
-                    Resource=[
-                        Join('', [GetAtt('S3StorageBucket', 'Arn'), '/*']),
-                    ],
-                    Principal=Principal(
-                        'AWS',
-                        Join(
-                            '',
-                            [
-                                (
-                                    'arn:aws:iam::cloudfront:user/'
-                                    'CloudFront Origin Access Identity '
-                                ),
-                                Ref(cloudfront_oai),
-                            ],
+    cloudfront_policy = t.add_resource(
+        BucketPolicy(
+            'CloudfrontBucketPolicy',
+            DependsOn=[
+                'CloudfrontOAI',
+                'S3StorageBucket',
+                'DocsProject',
+            ],
+            Bucket=Ref(s3_storage),
+            PolicyDocument=awacs.aws.Policy(
+                Statement=[
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('s3', 'GetObject'),
+                        ],
+                        Resource=[
+                            Join('', [GetAtt('S3StorageBucket', 'Arn'), '/*']),
+                        ],
+                        Principal=Principal(
+                            'AWS',
+                            Join(
+                                '',
+                                [
+                                    (
+                                        'arn:aws:iam::cloudfront:user/'
+                                        'CloudFront Origin Access Identity '
+                                    ),
+                                    Ref(cloudfront_oai),
+                                ],
+                            ),
                         ),
                     ),
-                ),
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('s3', 'AbortMultipartUpload'),
-                        awacs.aws.Action('s3', 'ListMultipartUploadParts'),
-                        awacs.aws.Action('s3', '*Object'),
-                        awacs.aws.Action('s3', 'GetObjectAcl'),
-                        awacs.aws.Action('s3', 'PutObjectAcl'),
-                    ],
-                    Resource=[
-                        Join('', [GetAtt('S3StorageBucket', 'Arn'), '/*']),
-                    ],
-                    Principal=Principal(
-                        'AWS',
-                        GetAtt(codebuild_role, 'Arn'),
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('s3', 'AbortMultipartUpload'),
+                            awacs.aws.Action('s3', 'ListMultipartUploadParts'),
+                            awacs.aws.Action('s3', '*Object'),
+                            awacs.aws.Action('s3', 'GetObjectAcl'),
+                            awacs.aws.Action('s3', 'PutObjectAcl'),
+                        ],
+                        Resource=[
+                            Join('', [GetAtt('S3StorageBucket', 'Arn'), '/*']),
+                        ],
+                        Principal=Principal(
+                            'AWS',
+                            GetAtt(codebuild_role, 'Arn'),
+                        ),
                     ),
-                ),
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('s3', 'ListBucket'),
-                    ],
-                    Resource=[
-                        GetAtt('S3StorageBucket', 'Arn'),
-                    ],
-                    Principal=Principal(
-                        'AWS',
-                        GetAtt(codebuild_role, 'Arn'),
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('s3', 'ListBucket'),
+                        ],
+                        Resource=[
+                            GetAtt('S3StorageBucket', 'Arn'),
+                        ],
+                        Principal=Principal(
+                            'AWS',
+                            GetAtt(codebuild_role, 'Arn'),
+                        ),
                     ),
-                ),
-            ],
+                ],
+            ),
         ),
-    ),
-)
+    )
 
-codebuild_policy = t.add_resource(
-    PolicyType(
-        'CodebuildAccessPolicy',
-        DependsOn=[
-            'DocsDistribution',
-            'DocsProject',
-        ],
-        PolicyDocument=awacs.aws.Policy(
-            Statement=[
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('logs', 'CreateLogStream'),
-                        awacs.aws.Action('logs', 'CreateLogGroup'),
-                        awacs.aws.Action('logs', 'PutLogEvents'),
-                        awacs.aws.Action('logs', 'DescribeLogStreams'),
-                    ],
-                    Resource=[
-                        (
-                            'arn:aws:logs:eu-west-1:585487584801:log-group:'
-                            '/aws/codebuild/voyc-docs:log-stream:'
-                            '*'
+    codebuild_policy = t.add_resource(
+        PolicyType(
+            'CodebuildAccessPolicy',
+            DependsOn=[
+                'DocsDistribution',
+                'DocsProject',
+            ],
+            PolicyDocument=awacs.aws.Policy(
+                Statement=[
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('logs', 'CreateLogStream'),
+                            awacs.aws.Action('logs', 'CreateLogGroup'),
+                            awacs.aws.Action('logs', 'PutLogEvents'),
+                            awacs.aws.Action('logs', 'DescribeLogStreams'),
+                        ],
+                        Resource=[
+                            (
+                                'arn:aws:logs:%s:%s:log-group:'
+                                '/aws/codebuild/%s:log-stream:'
+                                '*' % (params['region'], account, name)
+                            ),
+                        ],
+                    ),
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('cloudfront', 'CreateInvalidation'),
+                        ],
+                        Resource=[
+                            Join(
+                                '',
+                                [
+                                    'arn:aws:cloudfront::%s:distribution/'
+                                    % account,
+                                    Ref('DocsDistribution'),
+                                ],
+                            ),
+                        ],
+                    ),
+                ] + cache_statements
+            ),
+            PolicyName=Sub('%s-S3' % name),
+            Roles=[
+                Ref(codebuild_role),
+            ],
+        )
+    )
+
+    ###########################################
+    #            Cache behaviours
+    ###########################################
+
+    cache_policies = {}
+    header_policies = {}
+
+    def cache_policy_id(row):
+        if row.get('managed'):
+            return MANAGED_CACHE_POLICIES[row['managed']]
+        key = (row['ttl'], bool(row.get('query_strings')))
+        if key not in cache_policies:
+            # Rows with the same settings share a policy, named after them.
+            suffix = '%d%s' % (row['ttl'], 'Query' if key[1] else '')
+            # The edge TTL is pinned; deploys invalidate what they change.
+            cache_policies[key] = t.add_resource(
+                CachePolicy(
+                    'DocsCachePolicy%s' % suffix,
+                    CachePolicyConfig=CachePolicyConfig(
+                        Name='%s-ttl-%s' % (name, suffix.lower()),
+                        MinTTL=row['ttl'],
+                        DefaultTTL=row['ttl'],
+                        MaxTTL=row['ttl'],
+                        ParametersInCacheKeyAndForwardedToOrigin=(
+                            ParametersInCacheKeyAndForwardedToOrigin(
+                                CookiesConfig=CacheCookiesConfig(
+                                    CookieBehavior='none',
+                                ),
+                                HeadersConfig=CacheHeadersConfig(
+                                    HeaderBehavior='none',
+                                ),
+                                QueryStringsConfig=CacheQueryStringsConfig(
+                                    QueryStringBehavior=(
+                                        'all' if key[1] else 'none'
+                                    ),
+                                ),
+                                EnableAcceptEncodingGzip=True,
+                                EnableAcceptEncodingBrotli=True,
+                            )
                         ),
-                    ],
-                ),
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('cloudfront', 'CreateInvalidation'),
-                    ],
-                    Resource=[
-                        Join(
-                            '',
-                            [
-                                'arn:aws:cloudfront::585487584801:distribution/',
-                                Ref('DocsDistribution'),
+                    ),
+                )
+            )
+        return Ref(cache_policies[key])
+
+    def header_policy_id(row):
+        value = row['cache_control']
+        if value not in header_policies:
+            header_policies[value] = t.add_resource(
+                ResponseHeadersPolicy(
+                    'Docs%sHeadersPolicy' % row['name'].title(),
+                    ResponseHeadersPolicyConfig=ResponseHeadersPolicyConfig(
+                        Name='%s-%s-headers' % (name, row['name']),
+                        CustomHeadersConfig=CustomHeadersConfig(
+                            Items=[
+                                CustomHeader(
+                                    Header='Cache-Control',
+                                    Value=value,
+                                    Override=True,
+                                ),
                             ],
                         ),
-                    ],
-                ),
-            ]
-        ),
-        PolicyName=Sub('voyc-docs-S3'),
-        Roles=[
-            Ref(codebuild_role),
-        ],
-    )
-)
+                    ),
+                )
+            )
+        return Ref(header_policies[value])
 
-###########################################
-#               Cloudfront
-###########################################
+    default_behavior, cache_behaviors = None, []
+    for row in params['cache_table']:
+        if not row['name'].isalnum():
+            raise ValueError('cache_table names must be alphanumeric: %r' % row)
+        settings = dict(
+            TargetOriginId='S3Origin',
+            CachePolicyId=cache_policy_id(row),
+            Compress=True,
+            ViewerProtocolPolicy='redirect-to-https',
+        )
+        if row.get('cache_control'):
+            settings['ResponseHeadersPolicyId'] = header_policy_id(row)
+        if row.get('path'):
+            cache_behaviors.append(CacheBehavior(PathPattern=row['path'], **settings))
+        elif default_behavior:
+            raise ValueError('cache_table has more than one row without a path')
+        else:
+            default_behavior = DefaultCacheBehavior(**settings)
+    if not default_behavior:
+        raise ValueError('cache_table needs a default row without a path')
 
-cloudfront = t.add_resource(
-    Distribution(
-        'DocsDistribution',
-        DistributionConfig=DistributionConfig(
-            Comment='Voyc static docs.',
-            DefaultRootObject='index.html',
-            DefaultCacheBehavior=DefaultCacheBehavior(
-                TargetOriginId='S3Origin',
-                ForwardedValues=ForwardedValues(
-                    QueryString=False,
-                ),
-                ViewerProtocolPolicy='redirect-to-https',
-            ),
-            PriceClass='PriceClass_100',
-            Origins=[
-                Origin(
-                    DomainName=GetAtt(s3_storage, 'DomainName'),
-                    Id='S3Origin',
-                    S3OriginConfig=S3OriginConfig(
-                        OriginAccessIdentity=Join(
-                            '',
-                            [
-                                'origin-access-identity/cloudfront/',
-                                Ref(cloudfront_oai),
-                            ],
+    ###########################################
+    #               Cloudfront
+    ###########################################
+
+    cloudfront = t.add_resource(
+        Distribution(
+            'DocsDistribution',
+            DistributionConfig=DistributionConfig(
+                Comment='Voyc static docs.',
+                DefaultRootObject='index.html',
+                DefaultCacheBehavior=default_behavior,
+                CacheBehaviors=cache_behaviors,
+                HttpVersion='http2',
+                PriceClass='PriceClass_100',
+                Origins=[
+                    Origin(
+                        DomainName=GetAtt(s3_storage, 'DomainName'),
+                        Id='S3Origin',
+                        S3OriginConfig=S3OriginConfig(
+                            OriginAccessIdentity=Join(
+                                '',
+                                [
+                                    'origin-access-identity/cloudfront/',
+                                    Ref(cloudfront_oai),
+                                ],
+                            ),
                         ),
+                        OriginPath='/docs',
                     ),
-                    OriginPath='/docs',
+                ],
+                Enabled=True,
+                WebACLId=Ref(acl_arn),
+                Aliases=Ref(cloudfront_cnames),
+                ViewerCertificate=ViewerCertificate(
+                    AcmCertificateArn=Ref(acm_arn),
+                    SslSupportMethod='sni-only',
                 ),
-            ],
-            Enabled=True,
-            WebACLId=Ref(acl_arn),
-            Aliases=Ref(cloudfront_cnames),
-            ViewerCertificate=ViewerCertificate(
-                AcmCertificateArn=Ref(acm_arn),
-                SslSupportMethod='sni-only',
             ),
+        )
+    )
+
+    ###########################################
+    #               Codebuild
+    ###########################################
+
+    build_source = Source(
+        Auth=SourceAuth(
+            Type='OAUTH',
         ),
+        Location=Ref(git_location),
+        BuildSpec=Ref(buildspec_location_param),
+        GitCloneDepth=1,
+        ReportBuildStatus=True,
+        Type='GITHUB',
     )
-)
 
-###########################################
-#               Codebuild
-###########################################
+    environment = Environment(
+        ComputeType='BUILD_GENERAL1_SMALL',
+        Image=Ref(build_image),
+        Type='LINUX_CONTAINER',
+        EnvironmentVariables=[
+            {
+                'Name': 'AWS_DEFAULT_REGION',
+                'Value': ref_region,
+            },
+            {
+                'Name': 'AWS_ACCOUNT_ID',
+                'Value': ref_account_id,
+            },
+            {
+                'Name': 'DEPLOY_BUCKET',
+                'Value': Ref(s3_storage),
+            },
+            {
+                'Name': 'DISTRIBUTION_ID',
+                'Value': Ref(cloudfront),
+            },
+        ],
+    )
 
-build_source = Source(
-    Auth=SourceAuth(
-        Type='OAUTH',
-    ),
-    Location=Ref(git_location),
-    BuildSpec=Ref(buildspec_location_param),
-    GitCloneDepth=1,
-    ReportBuildStatus=True,
-    Type='GITHUB',
-)
-
-environment = Environment(
-    ComputeType='BUILD_GENERAL1_SMALL',
-    Image=Ref(build_image),
-    Type='LINUX_CONTAINER',
-    EnvironmentVariables=[
-        {
-            'Name': 'AWS_DEFAULT_REGION',
-            'Value': ref_region,
-        },
-        {
-            'Name': 'AWS_ACCOUNT_ID',
-            'Value': ref_account_id,
-        },
-        {
-            'Name': 'DEPLOY_BUCKET',
-            'Value': Ref(s3_storage),
-        },
-        {
-            'Name': 'DISTRIBUTION_ID',
-            'Value': Ref(cloudfront),
-        },
-    ],
-)
-
-codebuild_project = Project(
-    'DocsProject',
-    Artifacts=Artifacts(Type='NO_ARTIFACTS'),
-    BadgeEnabled=True,
-    Description='Voyc documentation build project.',
-    Environment=environment,
-    Name='voyc-docs',
-    ServiceRole=Ref(codebuild_role),
-    Source=build_source,
-    SourceVersion=Ref(branch_name),
-    Triggers=ProjectTriggers(
-        Webhook=True,
-        FilterGroups=[
-            [
-                WebhookFilter(
-                    Type='EVENT',
-                    Pattern='PUSH',
-                ),
-                WebhookFilter(
-                    Type='FILE_PATH',
-                    Pattern='^docs/.*',
-                ),
-                WebhookFilter(
-                    Type='HEAD_REF',
-                    Pattern=Sub('refs/heads/${BranchName}'),
-                ),
+    codebuild_project = Project(
+        'DocsProject',
+        Artifacts=Artifacts(Type='NO_ARTIFACTS'),
+        BadgeEnabled=True,
+        Description='Voyc documentation build project.',
+        Environment=environment,
+        Name=name,
+        ServiceRole=Ref(codebuild_role),
+        Source=build_source,
+        SourceVersion=Ref(branch_name),
+        Triggers=ProjectTriggers(
+            Webhook=True,
+            FilterGroups=[
+                [
+                    WebhookFilter(
+                        Type='EVENT',
+                        Pattern='PUSH',
+                    ),
+                    WebhookFilter(
+                        Type='FILE_PATH',
+                        Pattern='^docs/.*',
+                    ),
+                    WebhookFilter(
+                        Type='HEAD_REF',
+                        Pattern=Sub('refs/heads/${BranchName}'),
+                    ),
+                ],
             ],
-        ],
-    ),
-)
-t.add_resource(codebuild_project)
+        ),
+    )
+    if cache:
+        codebuild_project.Cache = cache
+    t.add_resource(codebuild_project)
+    return t
+
 
 ###########################################
 #                 Output
 ###########################################
 
-with open('docs_ci.json', 'w') as f:
-    f.write(t.to_json())
+if __name__ == '__main__':
+    with open(OUTPUT, 'w') as f:
+        f.write(build().to_json())
@@ -0,0 +1,308 @@
+"""Invalidate only what a docs deploy changed on the CloudFront distribution.
+
+The new build directory is compared with the object ETags under the
+distribution's origin path (``docs/`` in ``voyc-docs``), read in one
+paginated listing. Changed and deleted objects are mapped to viewer paths
+and collapsed into the fewest paths and ``/dir/*`` wildcards that cover
+them, preferring wildcards that flush few unchanged files, within
+CloudFront's per-request limits. The result is one invalidation batch
+instead of ``/*``.
+
+Plan before the new build is uploaded, submit once it is:
+
+    python invalidate.py docs/_build/html --bucket voyc-docs --save plan.json
+    aws s3 sync docs/_build/html s3://voyc-docs/docs
+    python invalidate.py --submit plan.json --distribution-id $DISTRIBUTION_ID
+
+    python invalidate.py build/html --bucket test --endpoint-url http://localhost:5000
+
+``--bucket`` and ``--distribution-id`` default to the ``DEPLOY_BUCKET`` and
+``DISTRIBUTION_ID`` variables set on the docs CodeBuild project. ``sync.py
+--invalidate`` plans from the same diff it uploads, header changes included.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote
+
+import boto3
+
+
+# Per invalidation request; wildcards count towards both.
+MAX_PATHS = 3000
+MAX_WILDCARDS = 15
+# boto3's default multipart chunk size, for multipart ETags.
+PART_SIZE = 8 * 1024 * 1024
+ROOT_OBJECT = 'index.html'
+
+
+###########################################
+#               Hashing
+###########################################
+
+def body_etag(body, remote=None, part_size=PART_SIZE):
+    """S3 ETag of ``body`` bytes, in the same form as the ``remote`` ETag.
+
+    Single part uploads have the MD5 as ETag; multipart uploads have the MD5
+    of the part MD5s followed by ``-<parts>``.
+    """
+    if remote and '-' in remote:
+        digests = [
+            hashlib.md5(body[i:i + part_size]).digest()
+            for i in range(0, len(body), part_size)
+        ]
+        return '%s-%d' % (hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+    return hashlib.md5(body).hexdigest()
+
+
+def etag(path, remote=None, part_size=PART_SIZE):
+    with open(path, 'rb') as f:
+        return body_etag(f.read(), remote, part_size)
+
+
+def local_files(directory):
+    """``{relative key: path}`` for every file under ``directory``."""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, directory).replace(os.sep, '/')] = path
+    return files
+
+
+def remote_etags(client, bucket, prefix=''):
+    """``{relative key: ETag}`` under ``prefix``, from one paginated listing.
+
+    Directory markers, keys ending in ``/``, are not files and are left out.
+    """
+    prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+    etags = {}
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):
+                continue
+            etags[obj['Key'][len(prefix):]] = obj['ETag'].strip('"')
+    return etags
+
+
+def compare(files, etags, local_etag=etag):
+    """Split keys into ``(added, modified, deleted)`` sorted lists."""
+    added = sorted(set(files) - set(etags))
+    deleted = sorted(set(etags) - set(files))
+    modified = sorted(
+        key for key in set(files) & set(etags)
+        if local_etag(files[key], etags[key]) != etags[key]
+    )
+    return added, modified, deleted
+
+
+###########################################
+#               Planning
+###########################################
+
+def _parents(parts):
+    """Directories containing ``parts``, from the root down, as tuples."""
+    return [parts[:i] for i in range(len(parts))]
+
+
+def _path(parts, wildcard=False):
+    path = '/' + '/'.join(parts)
+    if wildcard:
+        path = path.rstrip('/') + '/*'
+    return quote(path, safe='/*~')
+
+
+def collapse(changed, universe, max_paths=MAX_PATHS, max_wildcards=MAX_WILDCARDS):
+    """Cover ``changed`` keys with few invalidation paths.
+
+    ``universe`` is every key the distribution may have cached. A directory
+    whose files all changed becomes one wildcard. While the plan is over
+    either limit, the directory whose wildcard saves the most entries per
+    unchanged file it flushes replaces the entries beneath it, the narrower
+    one on a tie; at worst this ends at ``/*``. Returns sorted viewer paths.
+    """
+    changed = {tuple(k.split('/')) for k in changed}
+    if not changed:
+        return []
+    total, dirty = Counter(), Counter()
+    for parts in {tuple(k.split('/')) for k in universe} | changed:
+        total.update(_parents(parts))
+    for parts in changed:
+        dirty.update(_parents(parts))
+
+    files, wildcards = set(), set()
+    for parts in changed:
+        full = next(
+            (d for d in _parents(parts) if total[d] > 1 and dirty[d] == total[d]),
+            None,
+        )
+        if full is None:
+            files.add(parts)
+        else:
+            wildcards.add(full)
+    # Drop wildcards nested in another one.
+    wildcards = {
+        w for w in wildcards if not any(w[:i] in wildcards for i in range(len(w)))
+    }
+
+    def covered(d):
+        return (
+            [f for f in files if f[:len(d)] == d and len(f) > len(d)],
+            [w for w in wildcards if w[:len(d)] == d],
+        )
+
+    def count():
+        # The root object is also invalidated as "/", which needs a slot
+        # for as long as no wildcard covers it.
+        return len(files) + len(wildcards) + ((ROOT_OBJECT,) in files)
+
+    max_paths = max(max_paths, 1)
+    while count() > max_paths or len(wildcards) > max_wildcards:
+        best, best_score = None, None
+        for d in sorted({p for item in files | wildcards for p in _parents(item)}):
+            if d in wildcards:
+                continue
+            f, w = covered(d)
+            after = len(wildcards) - len(w) + 1
+            if after > max_wildcards and after >= len(wildcards):
+                continue
+            saved = len(f) + len(w) - 1
+            if saved <= 0:
+                continue
+            flushed = total[d] - dirty[d]
+            # Ties go to the narrower wildcard: fewer unchanged files
+            # flushed, then the deeper directory.
+            score = (saved / (flushed + 1), -flushed, len(d), saved)
+            if best_score is None or score > best_score:
+                best, best_score = d, score
+        if best is None:
+            best = ()
+        f, w = covered(best)
+        files.difference_update(f)
+        wildcards.difference_update(w)
+        wildcards.add(best)
+        if best == ():
+            # "/*" covers everything: there is nothing left to collapse.
+            break
+
+    paths = {_path(parts) for parts in files} | {
+        _path(parts, wildcard=True) for parts in wildcards
+    }
+    if (ROOT_OBJECT,) in files:
+        paths.add('/')
+    return sorted(paths)
+
+
+def plan(directory, bucket, prefix='docs', client=None, max_paths=MAX_PATHS,
+         max_wildcards=MAX_WILDCARDS, local_etag=etag):
+    """Compare ``directory`` with the bucket and return an invalidation plan.
+
+    The plan is a dict with the ``added``, ``modified`` and ``deleted`` keys
+    and the viewer ``paths`` to invalidate. New keys need no invalidation.
+    ``local_etag(path, remote ETag)`` gives the ETag a local file would have
+    once uploaded.
+    """
+    client = client or boto3.client('s3')
+    files = local_files(directory)
+    etags = remote_etags(client, bucket, prefix)
+    added, modified, deleted = compare(files, etags, local_etag)
+    return {
+        'added': added,
+        'modified': modified,
+        'deleted': deleted,
+        'paths': collapse(
+            modified + deleted, set(files) | set(etags), max_paths, max_wildcards
+        ),
+    }
+
+
+def submit(client, distribution_id, paths, reference=None):
+    """Submit ``paths`` as one invalidation batch; returns its id or None."""
+    if not paths:
+        return None
+    if reference is None:
+        # Same paths within one build => same reference, so retries are no-ops.
+        seed = os.environ.get('CODEBUILD_BUILD_ID') or str(time.time())
+        reference = hashlib.sha256(
+            json.dumps([seed] + list(paths)).encode('utf-8')
+        ).hexdigest()[:32]
+    response = client.create_invalidation(
+        DistributionId=distribution_id,
+        InvalidationBatch={
+            'Paths': {'Quantity': len(paths), 'Items': list(paths)},
+            'CallerReference': reference,
+        },
+    )
+    return response['Invalidation']['Id']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', help='The new docs build.')
+    parser.add_argument('--bucket', default=os.environ.get('DEPLOY_BUCKET'))
+    parser.add_argument(
+        '--prefix', default='docs', help='The distribution origin path.'
+    )
+    parser.add_argument(
+        '--distribution-id', default=os.environ.get('DISTRIBUTION_ID')
+    )
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url', help='S3 endpoint, eg: a local moto server.'
+    )
+    parser.add_argument('--max-paths', type=int, default=MAX_PATHS)
+    parser.add_argument('--max-wildcards', type=int, default=MAX_WILDCARDS)
+    parser.add_argument('--save', metavar='PLAN', help='Write the plan as JSON.')
+    parser.add_argument(
+        '--submit', metavar='PLAN', help='Submit a plan saved earlier.'
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true', help='Print the plan only.'
+    )
+    args = parser.parse_args(argv)
+
+    if args.submit:
+        with open(args.submit) as f:
+            result = json.load(f)
+    else:
+        if not args.directory or not args.bucket:
+            parser.error('a directory and --bucket (or $DEPLOY_BUCKET) are required')
+        s3 = boto3.client(
+            's3', region_name=args.region, endpoint_url=args.endpoint_url
+        )
+        result = plan(
+            args.directory,
+            args.bucket,
+            args.prefix,
+            client=s3,
+            max_paths=args.max_paths,
+            max_wildcards=args.max_wildcards,
+        )
+        print(
+            '%d added, %d modified, %d deleted'
+            % tuple(len(result[k]) for k in ('added', 'modified', 'deleted')),
+            file=sys.stderr,
+        )
+    for path in result['paths']:
+        print(path)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        return
+    if args.dry_run or not result['paths']:
+        return
+    if not args.distribution_id:
+        parser.error('--distribution-id (or $DISTRIBUTION_ID) is required')
+    cloudfront = boto3.client('cloudfront', region_name=args.region)
+    invalidation = submit(cloudfront, args.distribution_id, result['paths'])
+    print(f'Invalidation {invalidation} submitted', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
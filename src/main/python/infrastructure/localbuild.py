@@ -0,0 +1,381 @@
+"""Run a buildspec locally in the CodeBuild image, through the docker SDK.
+
+The ``install``, ``pre_build``, ``build`` and ``post_build`` phases run in
+order in one container from the project's ``BuildImage`` (the public ECR copy
+of ``aws/codebuild/...`` images), on a copy of the working tree at
+``CODEBUILD_SRC_DIR``. As on CodeBuild, the working directory and exported
+variables carry over from one command and phase to the next, a failing
+install or pre_build ends the build, and post_build runs after a failed
+build.
+
+The finished install phase is committed as an image tagged with the hash of
+the base image, the phase's commands and the values of the variables they
+use, so later runs with the same install phase start from that image and
+skip it. Each phase's duration is reported at the end.
+
+    python localbuild.py
+    python localbuild.py --env BUCKET=voyclib --env SECRET=hello \\
+        --s3-endpoint http://localhost:5000
+    python localbuild.py --buildspec buildspec-test.yml --env PYTHON_VERSION=3.8
+    python localbuild.py --no-cache --keep
+
+``--s3-endpoint`` points the build's S3 calls at a local stand-in (eg:
+``moto_server``) through ``AWS_ENDPOINT_URL_S3``, with test credentials
+unless real ones are passed. ``localhost`` is rewritten to the docker host.
+The ``batch`` section is not run; run its buildspecs one at a time.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import time
+import uuid
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit
+
+import docker
+import yaml
+
+import voyclib
+
+
+PHASES = ('install', 'pre_build', 'build', 'post_build')
+# A failure in these phases skips the rest of the build, post_build included.
+FATAL_PHASES = ('install', 'pre_build')
+
+SRC_DIR = '/codebuild/output/src'
+STATE_DIR = '/codebuild/localbuild'
+CACHE_REPOSITORY = 'localbuild-install'
+
+# CodeBuild's own images are published on the public ECR gallery.
+IMAGE_REGISTRIES = {'aws/codebuild/': 'public.ecr.aws/codebuild/'}
+DOCKER_HOST = 'host.docker.internal'
+# $NAME or ${NAME} in a command.
+VARIABLE = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+
+PhaseResult = namedtuple('PhaseResult', ['phase', 'status', 'seconds'])
+
+
+###########################################
+#               Buildspecs
+###########################################
+
+def load_buildspec(path):
+    with open(path) as f:
+        spec = yaml.safe_load(f)
+    if str(spec.get('version')) != '0.2':
+        raise ValueError('%s: only buildspec version 0.2 is supported' % path)
+    return spec
+
+
+def image_name(image):
+    for prefix, registry in IMAGE_REGISTRIES.items():
+        if image.startswith(prefix):
+            return registry + image[len(prefix):]
+    return image
+
+
+def runtime_commands(runtimes):
+    """Select ``runtime-versions`` with the image's version managers.
+
+    Only python (pyenv) is selected; other runtimes keep the image default.
+    """
+    commands = []
+    for runtime, version in (runtimes or {}).items():
+        if runtime == 'python':
+            commands.append(
+                'command -v pyenv > /dev/null && pyenv global '
+                '"$(pyenv versions --bare | grep "^%s" | tail -1)"' % version
+            )
+        else:
+            print(f'runtime-versions: {runtime} is not selected locally',
+                  file=sys.stderr)
+    return commands
+
+
+def phase_script(commands, given=()):
+    """A bash script running ``commands`` the way CodeBuild does.
+
+    Execution stops at the first failing command. The working directory and
+    exported variables are restored from the previous phase and saved for
+    the next one, whether the phase passes or not. The ``given`` variables
+    are passed to every phase, so they are not saved; a cached install image
+    must not pin them.
+    """
+    save = 'export -p'
+    if given:
+        save = '(unset %s; export -p)' % ' '.join(sorted(given))
+    return '\n'.join([
+        '[ -f {0}/env.sh ] && . {0}/env.sh'.format(STATE_DIR),
+        'cd "$(cat {0}/cwd 2>/dev/null || echo "$CODEBUILD_SRC_DIR")"'.format(
+            STATE_DIR
+        ),
+        "trap '{1} > {0}/env.sh; pwd > {0}/cwd' EXIT".format(STATE_DIR, save),
+        'set -e',
+    ] + [str(c) for c in commands]) + '\n'
+
+
+def install_key(image_id, spec, environment=None):
+    """Cache key of the install phase: base image, its commands and variables.
+
+    The phase is hashed as written, so the values of the variables it refers
+    to, eg: ``python: $PYTHON_VERSION`` in ``runtime-versions``, are taken
+    from ``environment``, the build's resolved variables.
+    """
+    install = (spec.get('phases') or {}).get('install') or {}
+    environment = environment or {}
+    used = set(VARIABLE.findall(json.dumps(install, default=str)))
+    return hashlib.sha256(json.dumps(
+        [
+            image_id,
+            install,
+            (spec.get('env') or {}).get('variables') or {},
+            {name: environment.get(name) for name in used},
+        ],
+        sort_keys=True,
+        default=str,
+    ).encode('utf-8')).hexdigest()
+
+
+def source_archive(root):
+    """The working tree as a tar, without ignored files.
+
+    Like CodeBuild's checkout, only files git tracks or would track are
+    included; outside a git repository everything under ``root`` is.
+    """
+    try:
+        names = subprocess.run(
+            ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+            cwd=root,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode('utf-8').split('\0')
+    except (OSError, subprocess.CalledProcessError):
+        names = [
+            os.path.relpath(os.path.join(d, n), root)
+            for d, _, files in os.walk(root) for n in files
+        ]
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name in sorted(n for n in names if n):
+            if os.path.isfile(os.path.join(root, name)):
+                tar.add(os.path.join(root, name), arcname=name)
+    return buffer.getvalue()
+
+
+def s3_environment(endpoint_url):
+    """Variables pointing the build's S3 calls at ``endpoint_url``.
+
+    Returns ``(variables, extra_hosts)`` for the container.
+    """
+    parts = urlsplit(endpoint_url)
+    extra_hosts = {}
+    if parts.hostname in ('localhost', '127.0.0.1'):
+        netloc = DOCKER_HOST + (':%d' % parts.port if parts.port else '')
+        parts = parts._replace(netloc=netloc)
+        extra_hosts[DOCKER_HOST] = 'host-gateway'
+    variables = {
+        'AWS_ENDPOINT_URL_S3': urlunsplit(parts),
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'testing'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get(
+            'AWS_SECRET_ACCESS_KEY', 'testing'
+        ),
+    }
+    return variables, extra_hosts
+
+
+###########################################
+#               Running
+###########################################
+
+class LocalBuild(object):
+
+    def __init__(self, spec, source_root, image, client=None, env=None,
+                 extra_hosts=None, cache=True, out=sys.stdout):
+        self.spec = spec
+        self.source_root = source_root
+        self.image = image_name(image)
+        self.client = client or docker.from_env()
+        self.cache = cache
+        self.out = out
+        self.extra_hosts = extra_hosts or {}
+        self.environment = dict(
+            (spec.get('env') or {}).get('variables') or {},
+            CODEBUILD_SRC_DIR=SRC_DIR,
+            CODEBUILD_BUILD_ID='local:%s' % uuid.uuid4(),
+            CODEBUILD_LOCAL='true',
+        )
+        self.environment.update(env or {})
+        self.environment = {k: str(v) for k, v in self.environment.items()}
+        for kind in ('parameter-store', 'secrets-manager'):
+            if (spec.get('env') or {}).get(kind):
+                print(f'env: {kind} variables are not resolved locally',
+                      file=sys.stderr)
+
+    def _base_image(self):
+        try:
+            return self.client.images.get(self.image)
+        except docker.errors.ImageNotFound:
+            print(f'Pulling {self.image}', file=self.out)
+            return self.client.images.pull(self.image)
+
+    def _cached_image(self, tag):
+        try:
+            return self.client.images.get('%s:%s' % (CACHE_REPOSITORY, tag))
+        except docker.errors.ImageNotFound:
+            return None
+
+    def _exec(self, container, script):
+        """Run ``script`` with bash in the container; returns the exit code."""
+        api = self.client.api
+        exec_id = api.exec_create(
+            container.id,
+            ['bash', '-c', script],
+            environment=self.environment,
+            workdir=SRC_DIR,
+        )['Id']
+        for chunk in api.exec_start(exec_id, stream=True):
+            self.out.write(chunk.decode('utf-8', 'replace'))
+            self.out.flush()
+        return api.exec_inspect(exec_id)['ExitCode']
+
+    def _put_source(self, container):
+        self._exec(container, 'mkdir -p %s %s' % (SRC_DIR, STATE_DIR))
+        container.put_archive(SRC_DIR, source_archive(self.source_root))
+
+    def _phase(self, container, name):
+        phase = (self.spec.get('phases') or {}).get(name) or {}
+        commands = list(phase.get('commands') or [])
+        if name == 'install':
+            commands = runtime_commands(phase.get('runtime-versions')) + commands
+        if not commands and not phase.get('finally'):
+            return 'skipped'
+
+        print(f'[{name}]', file=self.out)
+        given = list(self.environment)
+        code = 0
+        if commands:
+            code = self._exec(container, phase_script(commands, given))
+        if phase.get('finally'):
+            self._exec(container, phase_script(phase['finally'], given))
+        if code and phase.get('on-failure') == 'CONTINUE':
+            return 'continued (%d)' % code
+        return 'failed (%d)' % code if code else 'ok'
+
+    def run(self, keep=False):
+        """Run the phases; returns ``[PhaseResult]``."""
+        base = self._base_image()
+        key = install_key(base.id, self.spec, self.environment)[:16]
+        cached = self._cached_image(key) if self.cache else None
+
+        container = self.client.containers.run(
+            cached or base,
+            ['-c', 'while sleep 3600; do :; done'],
+            entrypoint=['/bin/sh'],
+            detach=True,
+            extra_hosts=self.extra_hosts,
+        )
+        results = []
+        try:
+            self._put_source(container)
+            for name in PHASES:
+                if name == 'install' and cached is not None:
+                    results.append(PhaseResult(name, 'cached', 0.0))
+                    continue
+                if results and results[-1].status.startswith('failed') and (
+                    results[-1].phase in FATAL_PHASES
+                ):
+                    break
+
+                start = time.time()
+                status = self._phase(container, name)
+                results.append(PhaseResult(name, status, time.time() - start))
+
+                if name == 'install' and status == 'ok' and self.cache:
+                    # Cache the installed tools, not this copy of the source.
+                    self._exec(container, 'rm -rf %s' % SRC_DIR)
+                    container.commit(repository=CACHE_REPOSITORY, tag=key)
+                    self._put_source(container)
+        finally:
+            if keep:
+                print(f'Container {container.short_id} kept', file=self.out)
+            else:
+                container.remove(force=True)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--source',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '..', '..'),
+        help='Source root; defaults to this repository.',
+    )
+    parser.add_argument(
+        '--buildspec',
+        default='buildspec.yml',
+        help='Buildspec path, relative to the source root.',
+    )
+    parser.add_argument('--image', default=voyclib.defaults['build_image'])
+    parser.add_argument(
+        '--env',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help='Project environment variable; repeatable.',
+    )
+    parser.add_argument(
+        '--s3-endpoint', help='Send S3 calls here, eg: a local moto server.'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Run the install phase even if a cached image exists.',
+    )
+    parser.add_argument(
+        '--keep', action='store_true', help='Leave the container running.'
+    )
+    args = parser.parse_args(argv)
+
+    env = {}
+    for item in args.env:
+        name, sep, value = item.partition('=')
+        if not sep:
+            parser.error('--env expects NAME=VALUE, got %r' % item)
+        env[name] = value
+    extra_hosts = {}
+    if args.s3_endpoint:
+        variables, extra_hosts = s3_environment(args.s3_endpoint)
+        env = dict(variables, **env)
+
+    source = os.path.abspath(args.source)
+    spec = load_buildspec(os.path.join(source, args.buildspec))
+    build = LocalBuild(
+        spec,
+        source,
+        args.image,
+        env=env,
+        extra_hosts=extra_hosts,
+        cache=not args.no_cache,
+    )
+    results = build.run(keep=args.keep)
+
+    print()
+    for result in results:
+        print(f'{result.phase:<12}{result.status:<20}{result.seconds:8.1f}s')
+    print(f'{"total":<32}{sum(r.seconds for r in results):8.1f}s')
+    if any(r.status.startswith('failed') for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Render every template module for many (account, region, app_name) targets.
+
+Targets come from a JSON file or ``--target`` flags:
+
+    [
+        {"account_id": "585487584801", "region": "eu-west-1", "app_name": "docs"},
+        {"account_id": "714249467706", "region": "eu-west-1", "app_name": "voyclib",
+         "templates": ["voyclib", "codebuild"]}
+    ]
+
+Any other keys in a target override matching template ``defaults``. Outputs
+are written to ``<out-dir>/<account_id>/<region>/<app_name>/<OUTPUT>``, each
+target directory keeping its own compiler fingerprint cache. Variants that
+resolve to the same fingerprint are rendered once and copied to every target,
+and the remaining renders run in a process pool.
+
+    python matrix.py --targets targets.json --out-dir build/
+    python matrix.py --target 585487584801:eu-west-1:docs -t 1111:us-east-1:docs
+"""
+import argparse
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import compiler
+
+
+TARGET_KEYS = ('account_id', 'region', 'app_name')
+
+
+def parse_target(spec):
+    parts = spec.split(':')
+    if len(parts) != len(TARGET_KEYS) or not all(parts):
+        raise argparse.ArgumentTypeError(
+            'Expected ACCOUNT:REGION:APP_NAME, got %r' % spec
+        )
+    return dict(zip(TARGET_KEYS, parts))
+
+
+def load_targets(path):
+    with open(path) as f:
+        targets = json.load(f)
+    for target in targets:
+        missing = [k for k in TARGET_KEYS if not target.get(k)]
+        if missing:
+            raise ValueError('Target %r is missing %s' % (target, ', '.join(missing)))
+    return targets
+
+
+def target_dir(out_dir, target):
+    return os.path.join(out_dir, *(str(target[k]) for k in TARGET_KEYS))
+
+
+def fan_out(targets, out_dir, names=None, directory=compiler.HERE, force=False,
+            workers=None, **options):
+    """Render each template for each target.
+
+    Returns ``(target dir, module name, output path, status)`` tuples in target
+    order, with the same statuses as ``compiler.compile_templates``. Extra
+    keyword arguments are ``compiler.render`` options (``minify``, ``nested``).
+    """
+    modules = compiler.select(compiler.discover(directory), names)
+
+    caches = OrderedDict()
+    results = []
+    # (module path, fingerprint) -> [module, params, [target dir]]
+    jobs = OrderedDict()
+    for target in targets:
+        tdir = target_dir(out_dir, target)
+        cache = caches[tdir] = compiler.load_cache(
+            os.path.join(tdir, compiler.CACHE_FILE)
+        )
+        overrides = {k: v for k, v in target.items() if k != 'templates'}
+        selected = [
+            m for m in modules
+            if not target.get('templates') or m.name in target['templates']
+        ]
+        for module, params, key, fresh in compiler.plan(
+            selected, tdir, overrides, cache, force, options
+        ):
+            if fresh:
+                output = os.path.join(tdir, module.output)
+                results.append((tdir, module.name, output, 'fresh'))
+                continue
+            job = jobs.setdefault((module.path, key), [module, params, []])
+            job[2].append(tdir)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for (_, key), (module, params, tdirs) in jobs.items():
+            future = pool.submit(
+                compiler.render_to, module, params, tdirs, **options
+            )
+            futures.append((module, key, tdirs, future))
+
+        for module, key, tdirs, future in futures:
+            files, statuses = future.result()
+            for tdir, status in zip(tdirs, statuses):
+                compiler.record(caches[tdir], module, key, files, tdir)
+                output = os.path.join(tdir, module.output)
+                results.append((tdir, module.name, output, status))
+
+    for tdir, cache in caches.items():
+        compiler.save_cache(os.path.join(tdir, compiler.CACHE_FILE), cache)
+
+    order = {tdir: i for i, tdir in enumerate(caches)}
+    results.sort(key=lambda r: (order[r[0]], r[1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', help='Template modules to render.')
+    parser.add_argument('--targets', help='JSON file with a list of targets.')
+    parser.add_argument(
+        '-t',
+        '--target',
+        dest='target_specs',
+        action='append',
+        type=parse_target,
+        default=[],
+        metavar='ACCOUNT:REGION:APP_NAME',
+    )
+    parser.add_argument('--out-dir', default='build', help='Output tree root.')
+    parser.add_argument('--workers', type=int, help='Process pool size.')
+    parser.add_argument(
+        '--force', action='store_true', help='Ignore the fingerprint caches.'
+    )
+    parser.add_argument(
+        '--minify', action='store_true', help='Write JSON without whitespace.'
+    )
+    parser.add_argument(
+        '--nested',
+        action='store_true',
+        help='Split templates over the CloudFormation limits into nested stacks.',
+    )
+    args = parser.parse_args(argv)
+
+    targets = (load_targets(args.targets) if args.targets else []) + args.target_specs
+    if not targets:
+        parser.error('at least one of --targets or --target is required')
+
+    for _, _, output, status in fan_out(
+        targets,
+        args.out_dir,
+        args.modules,
+        force=args.force,
+        workers=args.workers,
+        minify=args.minify,
+        nested=args.nested,
+    ):
+        print(f'{status:>9}  {os.path.relpath(output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,30 @@
-from troposphere import Template
-from troposphere.s3 import Bucket, PublicRead, WebsiteConfiguration
+OUTPUT = 's3.json'
 
 
-t = Template()
+def build():
+    from troposphere import Template
+    from troposphere.s3 import Bucket, PublicRead, WebsiteConfiguration
 
-t.set_description(
-    "S3 test troposphere template"
-)
+    t = Template()
 
-s3bucket = t.add_resource(
-    Bucket(
-        'TestBucket',
-        BucketName='test-bucket'
-        AccessControl=PublicRead,
-        WebsiteConfiguration=WebsiteConfiguration(
-            IndexDocument="index.html",
-            ErrorDocument="error.html"
+    t.set_description(
+        "S3 test troposphere template"
+    )
+
+    t.add_resource(
+        Bucket(
+            'TestBucket',
+            BucketName='test-bucket',
+            AccessControl=PublicRead,
+            WebsiteConfiguration=WebsiteConfiguration(
+                IndexDocument="index.html",
+                ErrorDocument="error.html"
+            )
         )
     )
-)
 
-print(t.to_json())
\ No newline at end of file
+    return t
+
+
+if __name__ == '__main__':
+    print(build().to_json())
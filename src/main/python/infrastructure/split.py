@@ -0,0 +1,494 @@
+"""Split templates that exceed CloudFormation limits into nested stacks.
+
+Resources are ordered along their ``Ref``/``Fn::GetAtt``/``Fn::Sub``/
+``DependsOn`` graph (dependencies first, connected resources kept together)
+and packed greedily into child stacks that stay under the inline body and
+resource limits. Because every reference then points at the same or an
+earlier child, cross-stack values are wired one way: the producing child
+exports them as ``Outputs`` and the parent passes them into consumers as
+``Parameters`` with ``Fn::GetAtt [Child, Outputs.X]``. Parent parameters
+are passed through with their own definitions; list-valued attributes cross
+as comma-joined outputs into ``CommaDelimitedList`` parameters.
+
+``AWS::StackName`` and ``AWS::StackId`` in a child would resolve to the
+child stack, so the parent passes its own in as the ``ParentStackName`` and
+``ParentStackId`` parameters the child refers to instead.
+
+Children are referenced by a relative ``TemplateURL`` (``<stem>.<n>.json``),
+the same convention as ``aws cloudformation package``; ``artifacts.py``
+replaces them with S3 URLs at upload time.
+"""
+import json
+import re
+from collections import OrderedDict, defaultdict
+
+
+MAX_BODY_BYTES = 51200
+MAX_RESOURCES = 500
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+
+# Head room for the parameters, outputs and conditions each child gains.
+FILL_RATIO = 0.8
+
+SUB_VARIABLE = re.compile(r'\$\{([A-Za-z0-9]+)(?:\.([A-Za-z0-9.]+))?\}')
+LIST_PARAMETER = re.compile(r'^(CommaDelimitedList|List<.*>)$')
+# Pseudo parameters that differ between the parent and a child stack.
+STACK_PSEUDO = OrderedDict([
+    ('AWS::StackName', 'ParentStackName'),
+    ('AWS::StackId', 'ParentStackId'),
+])
+PSEUDO_VARIABLE = re.compile(r'\$\{(AWS::Stack(?:Name|Id))\}')
+# (resource type, attribute) of the attributes whose value is a list.
+LIST_ATTRIBUTES = {
+    ('AWS::EC2::Subnet', 'Ipv6CidrBlocks'),
+    ('AWS::EC2::VPC', 'CidrBlockAssociations'),
+    ('AWS::EC2::VPC', 'Ipv6CidrBlocks'),
+    ('AWS::EC2::VPCEndpoint', 'DnsEntries'),
+    ('AWS::EC2::VPCEndpoint', 'NetworkInterfaceIds'),
+    ('AWS::ElasticLoadBalancingV2::LoadBalancer', 'SecurityGroups'),
+    ('AWS::Route53::HostedZone', 'NameServers'),
+}
+
+
+def minified(template):
+    return json.dumps(template, sort_keys=True, separators=(',', ':'))
+
+
+def fits(template):
+    return (
+        len(minified(template).encode('utf-8')) <= MAX_BODY_BYTES
+        and len(template.get('Resources', {})) <= MAX_RESOURCES
+    )
+
+
+###########################################
+#             References
+###########################################
+
+def references(value):
+    """Yield ``(kind, name, attribute)`` for every reference in ``value``.
+
+    ``kind`` is ``ref``, ``getatt``, ``depends``, ``condition`` or ``mapping``;
+    ``attribute`` is only set for ``getatt``.
+    """
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == 'Ref' and isinstance(child, str):
+                yield 'ref', child, None
+            elif key == 'Fn::GetAtt':
+                if isinstance(child, str):
+                    child = child.split('.', 1)
+                if isinstance(child[0], str):
+                    yield 'getatt', child[0], child[1]
+                yield from references(child[1:])
+            elif key == 'Fn::Sub':
+                text = child if isinstance(child, str) else child[0]
+                local = set(child[1]) if isinstance(child, list) else set()
+                for name, attribute in SUB_VARIABLE.findall(text):
+                    if name in local:
+                        continue
+                    if attribute:
+                        yield 'getatt', name, attribute
+                    else:
+                        yield 'ref', name, None
+                if isinstance(child, list):
+                    yield from references(child[1])
+            elif key == 'DependsOn':
+                for name in [child] if isinstance(child, str) else child:
+                    yield 'depends', name, None
+            elif key == 'Condition' and isinstance(child, str):
+                yield 'condition', child, None
+            elif key == 'Fn::If':
+                yield 'condition', child[0], None
+                yield from references(child[1:])
+            elif key == 'Fn::FindInMap':
+                if isinstance(child[0], str):
+                    yield 'mapping', child[0], None
+                yield from references(child[1:])
+            else:
+                yield from references(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from references(child)
+
+
+def stack_pseudo(value):
+    """Yield the ``STACK_PSEUDO`` parameters ``value`` refers to."""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == 'Ref' and isinstance(child, str) and child in STACK_PSEUDO:
+                yield child
+            elif key == 'Fn::Sub':
+                text = child if isinstance(child, str) else child[0]
+                yield from PSEUDO_VARIABLE.findall(text)
+                if isinstance(child, list):
+                    yield from stack_pseudo(child[1])
+            else:
+                yield from stack_pseudo(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from stack_pseudo(child)
+
+
+def dependency_graph(resources):
+    return {
+        name: {
+            ref for kind, ref, _ in references(resource)
+            if kind in ('ref', 'getatt', 'depends') and ref in resources
+            and ref != name
+        }
+        for name, resource in resources.items()
+    }
+
+
+def ordered(resources):
+    """Topological order that keeps connected resources adjacent."""
+    graph = dependency_graph(resources)
+    undirected = defaultdict(set)
+    for name, deps in graph.items():
+        undirected[name] |= deps
+        for dep in deps:
+            undirected[dep].add(name)
+
+    seen, components = set(), []
+    for name in resources:
+        if name in seen:
+            continue
+        stack, component = [name], []
+        seen.add(name)
+        while stack:
+            node = stack.pop()
+            component.append(node)
+            for other in undirected[node]:
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        components.append(set(component))
+
+    order, done = [], set()
+
+    def visit(node, trail=()):
+        if node in done:
+            return
+        if node in trail:
+            raise ValueError('Circular dependency through %s' % node)
+        for dep in sorted(graph[node]):
+            visit(dep, trail + (node,))
+        done.add(node)
+        order.append(node)
+
+    for component in components:
+        for name in resources:
+            if name in component:
+                visit(name)
+    return order
+
+
+###########################################
+#               Splitting
+###########################################
+
+def _output_name(name, attribute):
+    return name + (re.sub(r'[^A-Za-z0-9]', '', attribute) if attribute else 'Ref')
+
+
+def _is_list(resources, name, attribute):
+    return (resources[name].get('Type'), attribute) in LIST_ATTRIBUTES
+
+
+def _rewrite(value, local, external):
+    """Point references to resources outside ``local``, and to the stack
+    pseudo parameters, at child parameters."""
+    if isinstance(value, dict):
+        if set(value) == {'Ref'} and value['Ref'] in external:
+            return {'Ref': _output_name(value['Ref'], None)}
+        if set(value) == {'Ref'} and value['Ref'] in STACK_PSEUDO:
+            return {'Ref': STACK_PSEUDO[value['Ref']]}
+        if set(value) == {'Fn::GetAtt'}:
+            target = value['Fn::GetAtt']
+            parts = target.split('.', 1) if isinstance(target, str) else target
+            if parts[0] in external and isinstance(parts[1], str):
+                return {'Ref': _output_name(parts[0], parts[1])}
+        rewritten = {}
+        for key, child in value.items():
+            if key == 'DependsOn':
+                deps = [child] if isinstance(child, str) else child
+                deps = [d for d in deps if d in local]
+                if deps:
+                    rewritten[key] = deps if len(deps) > 1 else deps[0]
+            elif key == 'Fn::Sub':
+                rewritten[key] = _rewrite_sub(child, local, external)
+            else:
+                rewritten[key] = _rewrite(child, local, external)
+        return rewritten
+    if isinstance(value, list):
+        return [_rewrite(child, local, external) for child in value]
+    return value
+
+
+def _rewrite_sub(value, local, external):
+    def replace(match):
+        name, attribute = match.groups()
+        if name in external:
+            return '${%s}' % _output_name(name, attribute)
+        return match.group(0)
+
+    def rewrite(text):
+        text = PSEUDO_VARIABLE.sub(
+            lambda m: '${%s}' % STACK_PSEUDO[m.group(1)], text
+        )
+        return SUB_VARIABLE.sub(replace, text)
+
+    if isinstance(value, str):
+        return rewrite(value)
+    return [rewrite(value[0]), _rewrite(value[1], local, external)]
+
+
+def _closure(template, names):
+    """Conditions and mappings (and the parameters they use) needed by ``names``."""
+    resources = template.get('Resources', {})
+    conditions = template.get('Conditions', {})
+    wanted = defaultdict(set)
+    pending = [resources[n] for n in names]
+    while pending:
+        for kind, name, attribute in references(pending.pop()):
+            if name in wanted[kind]:
+                continue
+            wanted[kind].add(name)
+            if kind == 'condition' and name in conditions:
+                pending.append(conditions[name])
+    return wanted
+
+
+def _chunks(template, order):
+    resources = template['Resources']
+    budget = MAX_BODY_BYTES * FILL_RATIO
+    chunks, current, size = [], [], 0
+    for name in order:
+        cost = len(minified({name: resources[name]}))
+        if cost > budget:
+            raise ValueError(
+                'Resource %s alone is %d bytes, over the %d byte budget'
+                % (name, cost, budget)
+            )
+        if current and (size + cost > budget or len(current) >= MAX_RESOURCES):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(name)
+        size += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split(template, stem):
+    """Partition ``template`` into a parent and child templates.
+
+    Returns an ``OrderedDict`` of ``{filename: template}``, the parent first
+    under ``stem + '.json'``. Templates that already fit are returned as is.
+    """
+    if fits(template):
+        return OrderedDict([(stem + '.json', template)])
+
+    resources = template['Resources']
+    parameters = template.get('Parameters', {})
+    chunks = _chunks(template, ordered(resources))
+    owner = {name: i for i, chunk in enumerate(chunks) for name in chunk}
+    stack_names = ['Stack%d' % (i + 1) for i in range(len(chunks))]
+    filenames = ['%s.%d.json' % (stem, i + 1) for i in range(len(chunks))]
+
+    def wire(kind, name, attribute=None):
+        """Parent-side value for a reference a child consumes."""
+        if kind == 'param':
+            if LIST_PARAMETER.match(parameters[name].get('Type', '')):
+                return {'Fn::Join': [',', {'Ref': name}]}
+            return {'Ref': name}
+        return {
+            'Fn::GetAtt': [
+                stack_names[owner[name]], 'Outputs.' + _output_name(name, attribute)
+            ]
+        }
+
+    # What each child exports for the others and for the parent outputs.
+    exports = defaultdict(OrderedDict)
+    children = []
+    for i, chunk in enumerate(chunks):
+        local = set(chunk)
+        wanted = _closure(template, chunk)
+        external = {
+            name for kind in ('ref', 'getatt', 'depends')
+            for name in wanted[kind] if name in owner and owner[name] != i
+        }
+        child = OrderedDict([
+            ('AWSTemplateFormatVersion', '2010-09-09'),
+            ('Description', '%s (part %d of %d)' % (
+                template.get('Description', stem), i + 1, len(chunks)
+            )),
+        ])
+        child_params, stack_params, depends = OrderedDict(), OrderedDict(), set()
+
+        used = sorted(wanted['ref'] & set(parameters))
+        for name in used:
+            child_params[name] = parameters[name]
+            stack_params[name] = wire('param', name)
+        conditions = template.get('Conditions', {})
+        pseudo = set(stack_pseudo(
+            [resources[n] for n in chunk]
+            + [conditions[n] for n in wanted['condition'] if n in conditions]
+        ))
+        for name in STACK_PSEUDO:
+            if name in pseudo:
+                child_params[STACK_PSEUDO[name]] = {'Type': 'String'}
+                stack_params[STACK_PSEUDO[name]] = {'Ref': name}
+
+        for kind, name, attribute in sorted(
+            (k, n, a) for k, n, a in _refs(resources, chunk) if n in external
+        ):
+            depends.add(stack_names[owner[name]])
+            if kind == 'depends':
+                continue
+            key = _output_name(name, attribute)
+            exports[owner[name]][key] = (name, attribute)
+            child_params[key] = {'Type': (
+                'CommaDelimitedList' if _is_list(resources, name, attribute)
+                else 'String'
+            )}
+            stack_params[key] = wire(kind, name, attribute)
+
+        if child_params:
+            child['Parameters'] = child_params
+        for section, kind in (('Mappings', 'mapping'), ('Conditions', 'condition')):
+            names = sorted(wanted[kind] & set(template.get(section, {})))
+            if names:
+                child[section] = {
+                    n: _rewrite(template[section][n], local, external)
+                    for n in names
+                }
+        child['Resources'] = OrderedDict(
+            (name, _rewrite(resources[name], local, external)) for name in chunk
+        )
+        children.append((child, stack_params, depends))
+
+    parent = OrderedDict(
+        (key, value) for key, value in template.items()
+        if key not in ('Resources', 'Outputs')
+    )
+    parent['Resources'] = OrderedDict()
+
+    outputs = OrderedDict()
+    for key, output in template.get('Outputs', {}).items():
+        wanted = {
+            (kind, name, attribute) for kind, name, attribute in references(output)
+            if name in owner and kind in ('ref', 'getatt')
+        }
+        for kind, name, attribute in wanted:
+            exports[owner[name]][_output_name(name, attribute)] = (name, attribute)
+        outputs[key] = _rewrite_parent(output, owner, stack_names, resources)
+
+    for i, (child, stack_params, depends) in enumerate(children):
+        if exports[i]:
+            child['Outputs'] = OrderedDict(
+                (key, {'Value': _export(resources, name, attribute)})
+                for key, (name, attribute) in exports[i].items()
+            )
+        if (
+            len(child.get('Parameters', {})) > MAX_PARAMETERS
+            or len(child.get('Outputs', {})) > MAX_OUTPUTS
+        ):
+            raise ValueError('%s needs too many cross-stack values' % filenames[i])
+
+        stack = OrderedDict([('Type', 'AWS::CloudFormation::Stack')])
+        if depends:
+            stack['DependsOn'] = sorted(depends)
+        stack['Properties'] = OrderedDict([('TemplateURL', filenames[i])])
+        if stack_params:
+            stack['Properties']['Parameters'] = stack_params
+        parent['Resources'][stack_names[i]] = stack
+
+    if outputs:
+        parent['Outputs'] = outputs
+
+    files = OrderedDict([(stem + '.json', parent)])
+    files.update((filenames[i], child) for i, (child, _, _) in enumerate(children))
+    for filename, part in files.items():
+        # The head room left by FILL_RATIO is a guess; check what it built.
+        if not fits(part):
+            raise ValueError(
+                '%s is still over the limits after splitting: %d bytes '
+                '(max %d), %d resources (max %d)' % (
+                    filename,
+                    len(minified(part).encode('utf-8')),
+                    MAX_BODY_BYTES,
+                    len(part.get('Resources', {})),
+                    MAX_RESOURCES,
+                )
+            )
+    return files
+
+
+def _export(resources, name, attribute):
+    """The child output value of a reference; lists are joined."""
+    if not attribute:
+        return {'Ref': name}
+    value = {'Fn::GetAtt': [name, attribute]}
+    if _is_list(resources, name, attribute):
+        return {'Fn::Join': [',', value]}
+    return value
+
+
+def _refs(resources, chunk):
+    for name in chunk:
+        for kind, ref, attribute in references(resources[name]):
+            if kind in ('ref', 'getatt', 'depends'):
+                yield kind, ref, attribute
+
+
+def _rewrite_parent(value, owner, stack_names, resources):
+    """Resolve parent output references through the child stacks' outputs."""
+    if isinstance(value, dict):
+        if set(value) == {'Ref'} and value['Ref'] in owner:
+            name = value['Ref']
+            return {'Fn::GetAtt': [
+                stack_names[owner[name]], 'Outputs.' + _output_name(name, None)
+            ]}
+        if set(value) == {'Fn::GetAtt'}:
+            target = value['Fn::GetAtt']
+            parts = target.split('.', 1) if isinstance(target, str) else target
+            if parts[0] in owner:
+                output = {'Fn::GetAtt': [
+                    stack_names[owner[parts[0]]],
+                    'Outputs.' + _output_name(parts[0], parts[1]),
+                ]}
+                if _is_list(resources, parts[0], parts[1]):
+                    return {'Fn::Split': [',', output]}
+                return output
+        if 'Fn::Sub' in value and len(value) == 1:
+            sub = value['Fn::Sub']
+            text = sub if isinstance(sub, str) else sub[0]
+            variables = OrderedDict() if isinstance(sub, str) else OrderedDict(sub[1])
+            for name, attribute in SUB_VARIABLE.findall(text):
+                if name in owner and name not in variables:
+                    key = _output_name(name, attribute or None)
+                    variables[key] = {'Fn::GetAtt': [
+                        stack_names[owner[name]], 'Outputs.' + key
+                    ]}
+            text = SUB_VARIABLE.sub(
+                lambda m: (
+                    '${%s}' % _output_name(m.group(1), m.group(2))
+                    if m.group(1) in owner else m.group(0)
+                ),
+                text,
+            )
+            if variables:
+                return {'Fn::Sub': [text, _rewrite_parent(
+                    dict(variables), owner, stack_names, resources
+                )]}
+            return {'Fn::Sub': text}
+        return {
+            k: _rewrite_parent(v, owner, stack_names, resources)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_rewrite_parent(v, owner, stack_names, resources) for v in value]
+    return value
@@ -0,0 +1,181 @@
+"""Import-time report and cold-start budget for the template tooling.
+
+Each scenario is a snippet run in a fresh interpreter, the way CI runs the
+compiler. ``report`` aggregates ``python -X importtime`` for a scenario and
+``bench`` times cold starts and fails when the median exceeds the budget or
+when a scenario loads a module it is meant to keep lazy.
+
+    python startup.py report render
+    python startup.py bench --runs 7 --budget discover=120
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import OrderedDict, defaultdict
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = OrderedDict([
+    ('discover', 'import compiler; compiler.discover()'),
+    (
+        'render',
+        'import compiler; [compiler.render(m, {}) for m in compiler.discover()]',
+    ),
+])
+
+# Median cold start in milliseconds, interpreter start included.
+BUDGETS_MS = {
+    'discover': 150,
+    'render': 1500,
+}
+
+# Modules a scenario must not import.
+LAZY = {
+    'discover': ('troposphere', 'awacs'),
+}
+
+
+def _run(args):
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=HERE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+###########################################
+#             Import report
+###########################################
+
+def importtime(code):
+    """Return ``(module, self us, cumulative us, depth)`` for each import."""
+    rows = []
+    for line in _run(['-X', 'importtime', '-c', code]).stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def report(code, top=15, out=sys.stdout):
+    rows = importtime(code)
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split('.')[0]] += self_us
+    total = sum(by_package.values())
+
+    print(f'{"package":<32}{"self ms":>10}{"share":>8}', file=out)
+    ranked = sorted(by_package.items(), key=lambda item: -item[1])
+    for package, self_us in ranked[:top]:
+        print(
+            f'{package:<32}{self_us / 1000:>10.1f}{self_us / total:>8.0%}', file=out
+        )
+    print(f'{"total":<32}{total / 1000:>10.1f}', file=out)
+
+    print(f'\n{"slowest top-level imports":<32}{"cum ms":>10}', file=out)
+    top_level = sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])
+    for name, _, cumulative_us, _ in top_level[:top]:
+        print(f'{name:<32}{cumulative_us / 1000:>10.1f}', file=out)
+
+
+###########################################
+#             Cold-start bench
+###########################################
+
+def cold_start(code, runs=5):
+    """Median and best wall time in milliseconds of ``python -c code``."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        _run(['-c', code])
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def loaded(code, modules):
+    check = (
+        '%s\nimport sys\nprint(" ".join(m for m in %r if m in sys.modules))'
+        % (code, tuple(modules))
+    )
+    return _run(['-c', check]).stdout.split()
+
+
+def bench(names=None, runs=5, budgets=None, out=sys.stdout):
+    budgets = dict(BUDGETS_MS, **(budgets or {}))
+    failures = []
+    for name in names or SCENARIOS:
+        code = SCENARIOS[name]
+        median, best = cold_start(code, runs)
+        budget = budgets[name]
+        ok = median <= budget
+        print(
+            f'{name:<12}median {median:7.1f} ms  best {best:7.1f} ms  '
+            f'budget {budget} ms  {"ok" if ok else "OVER BUDGET"}',
+            file=out,
+        )
+        if not ok:
+            failures.append(f'{name}: {median:.1f} ms > {budget} ms')
+        eager = loaded(code, LAZY.get(name, ()))
+        if eager:
+            failures.append(f'{name}: imported {", ".join(eager)} eagerly')
+            print(f'{"":<12}imports {", ".join(eager)} eagerly', file=out)
+    return failures
+
+
+def _parse_budgets(pairs):
+    budgets = {}
+    for pair in pairs or []:
+        name, _, ms = pair.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError('unknown scenario %r' % name)
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    report_parser = sub.add_parser('report', help='Aggregate -X importtime.')
+    report_parser.add_argument('scenario', choices=list(SCENARIOS))
+    report_parser.add_argument('--top', type=int, default=15)
+
+    bench_parser = sub.add_parser('bench', help='Check cold starts against budget.')
+    bench_parser.add_argument(
+        'scenarios', nargs='*', help='One of %s.' % ', '.join(SCENARIOS)
+    )
+    bench_parser.add_argument('--runs', type=int, default=5)
+    bench_parser.add_argument(
+        '--budget', action='append', metavar='SCENARIO=MS',
+        help='Override a budget from BUDGETS_MS.',
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        report(SCENARIOS[args.scenario], top=args.top)
+        return
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(sorted(unknown)))
+    try:
+        budgets = _parse_budgets(args.budget)
+    except ValueError as e:
+        parser.error(str(e))
+    failures = bench(args.scenarios, args.runs, budgets)
+    if failures:
+        sys.exit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Upload only the changed files of a docs build to the deploy bucket.
+
+Each object gets its ``Content-Type`` and a ``Cache-Control`` taken from the
+docs ``cache_table`` in ``eg.py``, and a digest of those headers in its
+``x-amz-meta-headers`` metadata. Bodies are stored uncompressed: the
+distribution compresses them per viewer, with brotli or gzip as its cache
+policy negotiates.
+
+Local ETags are compared with one paginated listing of the bucket. The
+header digests of the objects are kept in one manifest object, outside the
+origin path, read once per sync and rewritten after it; only objects the
+manifest has no entry for at their current ETag are checked with a HEAD.
+Only new or changed objects are uploaded, through a bounded thread pool, so
+deploy time follows the size of the change, not of the site.
+
+    python sync.py docs/_build/html --bucket voyc-docs
+    python sync.py docs/_build/html --delete --invalidate
+    python sync.py build/html --bucket test --endpoint-url http://localhost:5000
+
+``--invalidate`` submits one minimal CloudFront invalidation for what was
+replaced or deleted (see ``invalidate.py``). ``--bucket`` and
+``--distribution-id`` default to ``DEPLOY_BUCKET`` and ``DISTRIBUTION_ID``.
+"""
+import argparse
+import fnmatch
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+import eg
+import invalidate
+
+
+CONTENT_TYPES = {
+    '.html': 'text/html',
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+    '.mjs': 'application/javascript',
+    '.json': 'application/json',
+    '.map': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.xml': 'application/xml',
+    '.txt': 'text/plain',
+    '.woff': 'font/woff',
+    '.woff2': 'font/woff2',
+    '.ttf': 'font/ttf',
+    '.eot': 'application/vnd.ms-fontobject',
+    '.ico': 'image/x-icon',
+}
+# Metadata key of the header digest, stored as x-amz-meta-headers.
+HEADERS_META = 'headers'
+# ``{relative key: {"etag": ..., "headers": digest}}`` of a synced prefix.
+MANIFEST = '.sync/%smanifest.json'
+
+# Same part size as invalidate.body_etag assumes for multipart ETags.
+TRANSFER = TransferConfig(
+    multipart_threshold=invalidate.PART_SIZE,
+    multipart_chunksize=invalidate.PART_SIZE,
+)
+
+Encoded = namedtuple('Encoded', ['body', 'headers'])
+
+
+def content_type(key):
+    _, ext = os.path.splitext(key)
+    kind = CONTENT_TYPES.get(ext.lower()) or mimetypes.guess_type(key)[0]
+    kind = kind or 'application/octet-stream'
+    if kind.startswith('text/') or kind in ('application/javascript',
+                                            'application/json'):
+        kind += '; charset=utf-8'
+    return kind
+
+
+def cache_control(key, table):
+    """The ``cache_control`` of the first ``cache_table`` row matching ``key``.
+
+    Rows match like CloudFront path patterns; the row without a path is the
+    fallback.
+    """
+    default = None
+    for row in table:
+        if not row.get('path'):
+            default = row
+        elif fnmatch.fnmatchcase(key, row['path'].lstrip('/')):
+            return row.get('cache_control')
+    return default.get('cache_control') if default else None
+
+
+def header_digest(headers):
+    return hashlib.sha256(
+        json.dumps(headers, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:32]
+
+
+def object_headers(key, table=()):
+    """The headers ``key`` is stored with, their digest in ``Metadata``."""
+    headers = {'ContentType': content_type(key)}
+    control = cache_control(key, table)
+    if control:
+        headers['CacheControl'] = control
+    headers['Metadata'] = {HEADERS_META: header_digest(headers)}
+    return headers
+
+
+def encode(path, key, table=()):
+    """The body and headers ``key`` is stored with."""
+    with open(path, 'rb') as f:
+        body = f.read()
+    return Encoded(body, object_headers(key, table))
+
+
+class Syncer(object):
+
+    def __init__(self, bucket, prefix='docs', client=None, region=None,
+                 endpoint_url=None, workers=16, cache_table=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = client or boto3.client(
+            's3',
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=workers),
+        )
+        self.workers = workers
+        self.cache_table = (
+            eg.defaults['cache_table'] if cache_table is None else cache_table
+        )
+
+        self.manifest_key = MANIFEST % self.prefix
+
+    def encode(self, path, key):
+        return encode(path, key, self.cache_table)
+
+    def read_manifest(self):
+        try:
+            body = self.client.get_object(
+                Bucket=self.bucket, Key=self.manifest_key
+            )['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return {}
+        return json.loads(body.decode('utf-8'))
+
+    def write_manifest(self, manifest):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.manifest_key,
+            Body=json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'),
+            ContentType='application/json',
+        )
+
+    def _manifest(self, previous, files, etags, uploaded, kept):
+        """The manifest after a sync: an entry for each file of the build,
+        and the still valid entries of objects ``kept`` outside it."""
+        manifest = {
+            key: previous[key] for key in kept
+            if key in previous and previous[key]['etag'] == etags[key]
+        }
+        for key in files:
+            headers = object_headers(key, self.cache_table)
+            manifest[key] = {
+                'etag': uploaded.get(key) or etags[key],
+                'headers': headers['Metadata'][HEADERS_META],
+            }
+        return manifest
+
+    def _check(self, item):
+        key, path, remote, entry = item
+        encoded = self.encode(path, key)
+        digest = encoded.headers['Metadata'][HEADERS_META]
+        if remote and invalidate.body_etag(encoded.body, remote) == remote:
+            if entry and entry['etag'] == remote:
+                stored = entry['headers']
+            else:
+                # Written without a manifest entry: a HEAD tells whether the
+                # headers changed.
+                stored = self.client.head_object(
+                    Bucket=self.bucket, Key=self.prefix + key
+                ).get('Metadata', {}).get(HEADERS_META)
+            if stored == digest:
+                return key, None
+        return key, encoded
+
+    def upload(self, key, encoded):
+        """Upload ``key``; returns its new ETag."""
+        if len(encoded.body) < invalidate.PART_SIZE:
+            return self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.prefix + key,
+                Body=encoded.body,
+                **encoded.headers
+            )['ETag'].strip('"')
+        self.client.upload_fileobj(
+            io.BytesIO(encoded.body),
+            self.bucket,
+            self.prefix + key,
+            ExtraArgs=encoded.headers,
+            Config=TRANSFER,
+        )
+        # Uploaded in parts of PART_SIZE, so the ETag has the multipart form.
+        return invalidate.body_etag(encoded.body, '-')
+
+    def delete(self, keys):
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    'Objects': [{'Key': self.prefix + k} for k in keys[i:i + 1000]],
+                    'Quiet': True,
+                },
+            )
+
+    def sync(self, directory, delete=False, dry_run=False):
+        """Make the bucket prefix match ``directory``.
+
+        Returns a dict of sorted key lists: ``added``, ``modified``,
+        ``unchanged``, and remote keys missing from the build as ``deleted``
+        (with ``delete``) or ``kept``.
+        """
+        files = invalidate.local_files(directory)
+        etags = invalidate.remote_etags(self.client, self.bucket, self.prefix)
+        if self.manifest_key.startswith(self.prefix):
+            # Only when syncing to the bucket root: it is not a docs page.
+            etags.pop(self.manifest_key[len(self.prefix):], None)
+        manifest = self.read_manifest()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            checked = dict(pool.map(self._check, [
+                (key, path, etags.get(key), manifest.get(key))
+                for key, path in files.items()
+            ]))
+            changed = {k: v for k, v in checked.items() if v is not None}
+            if not dry_run:
+                uploaded = dict(zip(changed, pool.map(
+                    lambda item: self.upload(*item), changed.items()
+                )))
+
+        extra = sorted(set(etags) - set(files))
+        if delete and extra and not dry_run:
+            self.delete(extra)
+        if not dry_run:
+            synced = self._manifest(
+                manifest, files, etags, uploaded, [] if delete else extra
+            )
+            if synced != manifest:
+                self.write_manifest(synced)
+        return {
+            'added': sorted(k for k in changed if k not in etags),
+            'modified': sorted(k for k in changed if k in etags),
+            'deleted': extra if delete else [],
+            'kept': [] if delete else extra,
+            'unchanged': sorted(k for k, v in checked.items() if v is None),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='The docs build to upload.')
+    parser.add_argument('--bucket', default=os.environ.get('DEPLOY_BUCKET'))
+    parser.add_argument(
+        '--prefix', default='docs', help='The distribution origin path.'
+    )
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url', help='S3 endpoint, eg: a local moto server.'
+    )
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument(
+        '--delete', action='store_true', help='Remove objects not in the build.'
+    )
+    parser.add_argument(
+        '--invalidate',
+        action='store_true',
+        help='Invalidate modified and deleted paths on the distribution.',
+    )
+    parser.add_argument(
+        '--distribution-id', default=os.environ.get('DISTRIBUTION_ID')
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true', help='Compare without uploading.'
+    )
+    args = parser.parse_args(argv)
+    if not args.bucket:
+        parser.error('--bucket (or $DEPLOY_BUCKET) is required')
+    if args.invalidate and not args.distribution_id:
+        parser.error('--invalidate needs --distribution-id (or $DISTRIBUTION_ID)')
+
+    syncer = Syncer(
+        args.bucket,
+        args.prefix,
+        region=args.region,
+        endpoint_url=args.endpoint_url,
+        workers=args.workers,
+    )
+    result = syncer.sync(args.directory, delete=args.delete, dry_run=args.dry_run)
+    for status in ('added', 'modified', 'deleted'):
+        for key in result[status]:
+            print(f'{status:>9}  {key}')
+    print(
+        ', '.join('%d %s' % (len(keys), status) for status, keys in result.items()),
+        file=sys.stderr,
+    )
+
+    if args.invalidate:
+        paths = invalidate.collapse(
+            result['modified'] + result['deleted'],
+            {key for keys in result.values() for key in keys},
+        )
+        for path in paths:
+            print(f'invalidate  {path}')
+        if paths and not args.dry_run:
+            cloudfront = boto3.client('cloudfront', region_name=args.region)
+            invalidation = invalidate.submit(
+                cloudfront, args.distribution_id, paths
+            )
+            print(f'Invalidation {invalidation} submitted', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
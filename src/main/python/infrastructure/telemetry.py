@@ -0,0 +1,418 @@
+"""Collect CodeBuild phase durations into SQLite and report regressions.
+
+``collect`` lists each project's builds newest first, back to the last
+build it stored, and reads the new ones with ``BatchGetBuilds`` (100 at a
+time), oldest first. Finished builds and the duration of each of their
+phases are kept in a local SQLite file. A project's cursor only moves past
+builds that have finished, so builds still running are read again next
+time, and ``--limit`` stores the oldest new builds, leaving the rest for the
+next run.
+
+``report`` prints p50 and p95 per project and phase over the latest builds.
+It flags a phase as a regression when its median over the ``--recent``
+successful builds exceeds the median of the ``--baseline`` builds before
+them by more than ``--threshold`` and ``--min-seconds``.
+
+    python telemetry.py collect
+    python telemetry.py report --recent 10 --baseline 50
+    python telemetry.py report --fail-on-regression
+
+``--record FILE`` saves the API responses ``collect`` reads as JSON, and
+``--fixtures FILE`` replays such a file instead of calling AWS, so the
+collector and the report can be exercised offline.
+"""
+import argparse
+import datetime
+import json
+import sqlite3
+import sys
+from collections import OrderedDict
+
+import boto3
+
+import eg
+import voyclib
+
+
+PROJECTS = [
+    'voyc-%s-build' % voyclib.defaults['app_name'],
+    'voyc-%s' % eg.defaults['app_name'],
+]
+DATABASE = 'build-telemetry.sqlite'
+BATCH_SIZE = 100
+# The whole build, next to its phases in the report.
+TOTAL = 'TOTAL'
+ISO_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    number INTEGER,
+    status TEXT,
+    started REAL,
+    ended REAL,
+    duration REAL,
+    source_version TEXT,
+    batch_arn TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_project ON builds (project, started);
+CREATE TABLE IF NOT EXISTS phases (
+    build_id TEXT NOT NULL REFERENCES builds (id),
+    phase TEXT NOT NULL,
+    status TEXT,
+    duration REAL,
+    PRIMARY KEY (build_id, phase)
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    project TEXT PRIMARY KEY,
+    build_id TEXT NOT NULL
+);
+"""
+
+
+###########################################
+#               Fixtures
+###########################################
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _parse_isoformat(value):
+    """The datetime written by ``datetime.isoformat``.
+
+    ``datetime.fromisoformat`` is Python 3.7+, and before 3.7 ``%z`` does not
+    take the colon of ``+00:00``.
+    """
+    if value[-3:-2] == ':' and value[-6:-5] in '+-':
+        value = value[:-3] + value[-2:]
+    for fmt in ISO_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Not an ISO timestamp: %r' % value)
+
+
+def _timestamp(value):
+    """Seconds since the epoch of a boto3 datetime or a recorded ISO string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = _parse_isoformat(value)
+    return value.timestamp()
+
+
+class FixtureClient(object):
+    """Replays recorded ``list_builds_for_project`` and ``batch_get_builds``.
+
+    A fixture is ``{"projects": {name: [build ids, newest first]},
+    "builds": [build, ...]}``, as written by ``Recorder``.
+    """
+
+    def __init__(self, fixture):
+        self.projects = fixture['projects']
+        self.builds = {b['id']: b for b in fixture['builds']}
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def get_paginator(self, operation):
+        if operation != 'list_builds_for_project':
+            raise ValueError('No fixtures for %s' % operation)
+        return self
+
+    def paginate(self, projectName, sortOrder='DESCENDING'):
+        ids = list(self.projects.get(projectName, []))
+        if sortOrder == 'ASCENDING':
+            ids.reverse()
+        for i in range(0, max(len(ids), 1), BATCH_SIZE):
+            yield {'ids': ids[i:i + BATCH_SIZE]}
+
+    def batch_get_builds(self, ids):
+        return {
+            'builds': [self.builds[i] for i in ids if i in self.builds],
+            'buildsNotFound': [i for i in ids if i not in self.builds],
+        }
+
+
+class Recorder(object):
+    """Wraps a CodeBuild client and keeps what it returns as a fixture."""
+
+    def __init__(self, client):
+        self.client = client
+        self.fixture = {'projects': {}, 'builds': []}
+
+    def get_paginator(self, operation):
+        paginator = self.client.get_paginator(operation)
+        recorder = self
+
+        class Paginator(object):
+            def paginate(self, projectName, **kwargs):
+                ids = recorder.fixture['projects'].setdefault(projectName, [])
+                for page in paginator.paginate(projectName=projectName, **kwargs):
+                    ids.extend(page['ids'])
+                    yield page
+
+        return Paginator()
+
+    def batch_get_builds(self, ids):
+        response = self.client.batch_get_builds(ids=ids)
+        self.fixture['builds'].extend(response['builds'])
+        return response
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.fixture, f, indent=2, default=_json_default)
+
+
+###########################################
+#               Collecting
+###########################################
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def _store(db, build):
+    start = _timestamp(build.get('startTime'))
+    end = _timestamp(build.get('endTime'))
+    db.execute(
+        'INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+            build['id'],
+            build['projectName'],
+            build.get('buildNumber'),
+            build.get('buildStatus'),
+            start,
+            end,
+            end - start if start is not None and end is not None else None,
+            build.get('resolvedSourceVersion') or build.get('sourceVersion'),
+            build.get('buildBatchArn'),
+        ),
+    )
+    db.execute('DELETE FROM phases WHERE build_id = ?', (build['id'],))
+    db.executemany(
+        'INSERT INTO phases VALUES (?, ?, ?, ?)',
+        [
+            (
+                build['id'],
+                phase['phaseType'],
+                phase.get('phaseStatus'),
+                phase['durationInSeconds'],
+            )
+            for phase in build.get('phases', [])
+            if phase.get('durationInSeconds') is not None
+        ],
+    )
+
+
+def new_build_ids(client, project, cursor=None, limit=None):
+    """Build ids newer than ``cursor``, newest first.
+
+    With a ``limit``, only the oldest ``limit`` of them: the cursor moves to
+    the newest build stored, so the newer ones are read next time instead
+    of being skipped.
+    """
+    ids = []
+    paginator = client.get_paginator('list_builds_for_project')
+    for page in paginator.paginate(projectName=project, sortOrder='DESCENDING'):
+        if cursor in page['ids']:
+            ids.extend(page['ids'][:page['ids'].index(cursor)])
+            break
+        ids.extend(page['ids'])
+    if limit:
+        ids = ids[-limit:]
+    return ids
+
+
+def collect(db, client, projects=PROJECTS, limit=None):
+    """Store the builds finished since the last run; returns ``{project: n}``."""
+    stored = OrderedDict()
+    for project in projects:
+        row = db.execute(
+            'SELECT build_id FROM cursors WHERE project = ?', (project,)
+        ).fetchone()
+        ids = new_build_ids(client, project, row[0] if row else None, limit)
+
+        builds = {}
+        for i in range(0, len(ids), BATCH_SIZE):
+            response = client.batch_get_builds(ids=ids[i:i + BATCH_SIZE])
+            builds.update((b['id'], b) for b in response['builds'])
+
+        cursor, count = None, 0
+        with db:
+            # Oldest first: the cursor stops before the first unfinished build.
+            for build_id in reversed(ids):
+                build = builds.get(build_id)
+                if build is not None and not build.get('buildComplete'):
+                    break
+                if build is not None:
+                    _store(db, build)
+                    count += 1
+                cursor = build_id
+            if cursor:
+                db.execute(
+                    'INSERT OR REPLACE INTO cursors VALUES (?, ?)', (project, cursor)
+                )
+        stored[project] = count
+    return stored
+
+
+###########################################
+#               Reporting
+###########################################
+
+def percentile(values, q):
+    """Linearly interpolated ``q`` percentile (0-100) of ``values``."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def durations(db, project, window):
+    """``{phase: [seconds]}`` of the last ``window`` successful builds,
+    oldest first, with the whole build under ``TOTAL``."""
+    rows = db.execute(
+        'SELECT id, duration FROM builds'
+        ' WHERE project = ? AND status = ? AND duration IS NOT NULL'
+        ' ORDER BY started DESC LIMIT ?',
+        (project, 'SUCCEEDED', window),
+    ).fetchall()
+    rows.reverse()
+    series = OrderedDict([(TOTAL, [])])
+    for build_id, duration in rows:
+        series[TOTAL].append(duration)
+        for phase, seconds in db.execute(
+            'SELECT phase, duration FROM phases WHERE build_id = ?', (build_id,)
+        ):
+            series.setdefault(phase, []).append(seconds)
+    return series
+
+
+def report(db, projects=PROJECTS, recent=10, baseline=50, threshold=0.25,
+           min_seconds=10, out=sys.stdout):
+    """Print p50/p95 per phase and flag regressions; returns the flagged
+    ``(project, phase, baseline p50, recent p50)`` tuples."""
+    regressions = []
+    for project in projects:
+        series = durations(db, project, recent + baseline)
+        if not series[TOTAL]:
+            print(f'{project}: no finished builds', file=out)
+            continue
+        print(f'{project} ({len(series[TOTAL])} builds)', file=out)
+        print(
+            f'  {"phase":<18}{"p50":>8}{"p95":>8}{"base p50":>10}'
+            f'{"recent p50":>12}',
+            file=out,
+        )
+        for phase, values in series.items():
+            old, new = values[:-recent], values[-recent:]
+            old_p50, new_p50 = percentile(old, 50), percentile(new, 50)
+            flag = ''
+            if (
+                old_p50 is not None
+                and len(new) >= min(recent, 3)
+                and new_p50 > old_p50 * (1 + threshold)
+                and new_p50 - old_p50 >= min_seconds
+            ):
+                flag = '  REGRESSION'
+                regressions.append((project, phase, old_p50, new_p50))
+            print(
+                f'  {phase:<18}{percentile(values, 50):8.1f}'
+                f'{percentile(values, 95):8.1f}'
+                f'{old_p50 if old_p50 is not None else float("nan"):10.1f}'
+                f'{new_p50:12.1f}{flag}',
+                file=out,
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=DATABASE, help='SQLite file.')
+    parser.add_argument(
+        '--project',
+        action='append',
+        dest='projects',
+        help='CodeBuild project; repeatable. Defaults to %s.' % ', '.join(PROJECTS),
+    )
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    collect_parser = sub.add_parser('collect', help='Store new builds.')
+    collect_parser.add_argument('--region')
+    collect_parser.add_argument(
+        '--limit', type=int, help='At most this many new builds per project.'
+    )
+    collect_parser.add_argument(
+        '--fixtures', help='Replay recorded responses instead of calling AWS.'
+    )
+    collect_parser.add_argument(
+        '--record', metavar='FILE', help='Save the responses read as a fixture.'
+    )
+
+    report_parser = sub.add_parser('report', help='Percentiles and regressions.')
+    report_parser.add_argument('--recent', type=int, default=10)
+    report_parser.add_argument('--baseline', type=int, default=50)
+    report_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='Relative slowdown of the median that counts as a regression.',
+    )
+    report_parser.add_argument('--min-seconds', type=float, default=10)
+    report_parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    projects = args.projects or PROJECTS
+    db = connect(args.db)
+    if args.command == 'collect':
+        if args.fixtures:
+            client = FixtureClient.load(args.fixtures)
+        else:
+            client = boto3.client('codebuild', region_name=args.region)
+        if args.record:
+            client = Recorder(client)
+        stored = collect(db, client, projects, args.limit)
+        for project, count in stored.items():
+            print(f'{project}: {count} builds stored')
+        if args.record:
+            client.save(args.record)
+        return
+
+    regressions = report(
+        db,
+        projects,
+        recent=args.recent,
+        baseline=args.baseline,
+        threshold=args.threshold,
+        min_seconds=args.min_seconds,
+    )
+    if regressions and args.fail_on_regression:
+        sys.exit(
+            '\n'.join(
+                '%s %s: p50 %.1fs -> %.1fs' % regression
+                for regression in regressions
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
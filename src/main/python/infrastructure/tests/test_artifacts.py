@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+import boto3
+import pytest
+
+import artifacts
+
+
+BUCKET = 'voyc-templates-tests'
+
+
+def template(resources):
+    return json.dumps({'Resources': resources}, indent=1)
+
+
+def stack(url):
+    return {
+        'Type': 'AWS::CloudFormation::Stack',
+        'Properties': {'TemplateURL': url},
+    }
+
+
+CHILD = template({'Topic': {'Type': 'AWS::SNS::Topic'}})
+OTHER = template({'Queue': {'Type': 'AWS::SQS::Queue'}})
+PARENT = template({
+    'Child': stack('parent-child.json'),
+    'Other': stack('parent-other.json'),
+    'External': stack('https://example.com/external.json'),
+})
+FILES = {
+    'parent.json': PARENT,
+    'parent-child.json': CHILD,
+    'parent-other.json': OTHER,
+}
+
+
+@pytest.fixture
+def client(mock_aws):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+@pytest.fixture
+def store(client):
+    return artifacts.ArtifactStore(BUCKET, client=client, workers=2)
+
+
+def read(client, url):
+    key = url.split('.amazonaws.com/', 1)[1]
+    return client.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+
+def test_publish_is_content_addressed(client, store):
+    urls, uploaded = store.publish(FILES)
+    assert list(urls) == list(FILES)
+    assert uploaded == 3
+    child = read(client, urls['parent-child.json'])
+    assert child == CHILD.encode('utf-8')
+    assert urls['parent-child.json'] == (
+        'https://%s.s3.us-east-1.amazonaws.com/templates/%s.json'
+        % (BUCKET, hashlib.sha256(child).hexdigest())
+    )
+    for url in urls.values():
+        body = read(client, url)
+        assert url.endswith('/%s.json' % hashlib.sha256(body).hexdigest())
+
+
+def test_parent_points_at_its_children(client, store):
+    urls, _ = store.publish(FILES)
+    resources = json.loads(read(client, urls['parent.json']))['Resources']
+    assert resources['Child']['Properties']['TemplateURL'] == urls[
+        'parent-child.json'
+    ]
+    assert resources['Other']['Properties']['TemplateURL'] == urls[
+        'parent-other.json'
+    ]
+    assert resources['External']['Properties']['TemplateURL'] == (
+        'https://example.com/external.json'
+    )
+
+
+def test_republish_uploads_nothing(client, store):
+    urls, _ = store.publish(FILES)
+    puts = []
+    client.meta.events.register(
+        'before-parameter-build.s3.PutObject',
+        lambda **kwargs: puts.append(kwargs),
+    )
+    assert store.publish(FILES) == (urls, 0)
+    assert puts == []
+
+    # A changed child changes its own URL and its parent's, nothing else.
+    changed = dict(FILES, **{'parent-child.json': template({})})
+    new_urls, uploaded = store.publish(changed)
+    assert uploaded == 2
+    assert new_urls['parent-other.json'] == urls['parent-other.json']
+    assert new_urls['parent.json'] != urls['parent.json']
+
+
+def test_circular_references(store):
+    with pytest.raises(ValueError, match='Circular'):
+        store.publish({
+            'a.json': template({'B': stack('b.json')}),
+            'b.json': template({'A': stack('a.json')}),
+        })
+
+
+def test_collect(tmp_path):
+    for name, text in FILES.items():
+        (tmp_path / name).write_text(text)
+    (tmp_path / 'unrelated.json').write_text(CHILD)
+    assert artifacts.collect(str(tmp_path / 'parent.json')) == FILES
+
+
+def test_url():
+    store = artifacts.ArtifactStore(
+        BUCKET, client=object(), region='eu-west-1',
+        endpoint_url='http://localhost:5000/',
+    )
+    assert store.url('templates/x.json') == (
+        'http://localhost:5000/%s/templates/x.json' % BUCKET
+    )
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+
+import pytest
+
+import compiler
+import matrix
+
+
+TOPICS = '''import os
+
+import names
+
+OUTPUT = 'topics.json'
+defaults = {'app_name': 'app', 'topics': 1}
+
+
+def build(**params):
+    from troposphere import Template
+    from troposphere.sns import Topic
+
+    params = dict(defaults, **params)
+    with open(os.environ['RENDER_LOG'], 'a') as f:
+        f.write('topics\\n')
+    t = Template()
+    for i in range(params['topics']):
+        t.add_resource(Topic(names.topic(i), TopicName=params['app_name']))
+    return t
+'''
+NAMES = '''def topic(i):
+    return 'Topic%d' % i
+'''
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    directory = tmp_path / 'templates'
+    directory.mkdir()
+    (directory / 'topics.py').write_text(TOPICS)
+    (directory / 'names.py').write_text(NAMES)
+    # Neither OUTPUT nor build: not a template module.
+    (directory / 'helper.py').write_text('OUTPUT = None\n')
+    monkeypatch.setenv('RENDER_LOG', str(tmp_path / 'renders.log'))
+    return directory
+
+
+def renders(directory):
+    log = directory.parent / 'renders.log'
+    return log.read_text().count('\n') if log.exists() else 0
+
+
+@pytest.mark.parametrize('pairs, overrides', [
+    (None, {}),
+    (['app_name=voyclib'], {'app_name': 'voyclib'}),
+    (['batch=false', 'index_ttl=300'], {'batch': False, 'index_ttl': 300}),
+    (['test_matrix=[["3.8", "BUILD_GENERAL1_SMALL"]]'],
+     {'test_matrix': [['3.8', 'BUILD_GENERAL1_SMALL']]}),
+    (['cache={"type": "S3"}'], {'cache': {'type': 'S3'}}),
+    (['branch=feature/x=y'], {'branch': 'feature/x=y'}),
+    (['empty='], {'empty': ''}),
+])
+def test_parse_overrides(pairs, overrides):
+    assert compiler.parse_overrides(pairs) == overrides
+
+
+def test_parse_overrides_needs_a_value():
+    with pytest.raises(ValueError, match='key=value'):
+        compiler.parse_overrides(['app_name'])
+
+
+def test_discover(directory):
+    module, = compiler.discover(str(directory))
+    assert (module.name, module.output) == ('topics', 'topics.json')
+    assert module.defaults == {'app_name': 'app', 'topics': 1}
+    assert [os.path.basename(p) for p in module.sources] == ['names.py', 'topics.py']
+    with pytest.raises(ValueError, match='missing'):
+        compiler.select([module], ['missing'])
+
+
+def test_fingerprint_cache(directory, tmp_path):
+    out = str(tmp_path / 'out')
+
+    def compile(**kwargs):
+        return [(name, os.path.relpath(path, out), status) for name, path, status
+                in compiler.compile_templates(directory=str(directory),
+                                              out_dir=out, **kwargs)]
+
+    assert compile() == [('topics', 'topics.json', 'written')]
+    assert compile() == [('topics', 'topics.json', 'fresh')]
+    assert renders(directory) == 1
+    assert compile(force=True) == [('topics', 'topics.json', 'unchanged')]
+    assert renders(directory) == 2
+
+    # Overrides are typed, and only the module's own keys count.
+    assert compile(overrides={'unknown': 1}) == [
+        ('topics', 'topics.json', 'fresh')
+    ]
+    assert compile(overrides={'topics': 2}) == [
+        ('topics', 'topics.json', 'written')
+    ]
+    with open(os.path.join(out, 'topics.json')) as f:
+        assert sorted(json.load(f)['Resources']) == ['Topic0', 'Topic1']
+
+    # An imported sibling is part of the fingerprint.
+    (directory / 'names.py').write_text(NAMES + '\n# Changed.\n')
+    assert compile(overrides={'topics': 2})[0][2] == 'unchanged'
+    # So are the outputs themselves.
+    os.remove(os.path.join(out, 'topics.json'))
+    assert compile(overrides={'topics': 2})[0][2] == 'written'
+    assert compile(overrides={'topics': 2}, minify=True)[0][2] == 'written'
+    assert renders(directory) == 6
+
+
+def test_fan_out(directory, tmp_path):
+    out = str(tmp_path / 'build')
+    targets = [
+        {'account_id': '111', 'region': 'eu-west-1', 'app_name': 'docs'},
+        {'account_id': '222', 'region': 'eu-west-1', 'app_name': 'docs'},
+        {'account_id': '111', 'region': 'us-east-1', 'app_name': 'voyclib',
+         'topics': 2},
+        {'account_id': '333', 'region': 'eu-west-1', 'app_name': 'skipped',
+         'templates': ['other']},
+    ]
+    results = matrix.fan_out(targets, out, directory=str(directory), workers=2)
+    assert [(os.path.relpath(tdir, out), status)
+            for tdir, _, _, status in results] == [
+        ('111/eu-west-1/docs', 'written'),
+        ('222/eu-west-1/docs', 'written'),
+        ('111/us-east-1/voyclib', 'written'),
+    ]
+    # The two docs targets share a fingerprint and are rendered once.
+    assert renders(directory) == 2
+    with open(os.path.join(out, '222/eu-west-1/docs/topics.json')) as f:
+        docs = json.load(f)
+    assert docs['Resources']['Topic0']['Properties']['TopicName'] == 'docs'
+
+    results = matrix.fan_out(targets, out, directory=str(directory))
+    assert {status for _, _, _, status in results} == {'fresh'}
+    assert renders(directory) == 2
+
+
+def test_parse_target():
+    assert matrix.parse_target('111:eu-west-1:docs') == {
+        'account_id': '111', 'region': 'eu-west-1', 'app_name': 'docs'
+    }
+    with pytest.raises(argparse.ArgumentTypeError, match='ACCOUNT:REGION:APP_NAME'):
+        matrix.parse_target('111::docs')
@@ -0,0 +1,102 @@
+import io
+import json
+
+import pytest
+
+import deploy
+
+
+def template(*queues):
+    return {'Resources': {q: {'Type': 'AWS::SQS::Queue'} for q in queues}}
+
+
+def stack(tmp_path, name, body, **kwargs):
+    path = tmp_path / ('%s.json' % name)
+    path.write_text(json.dumps(body))
+    return dict({'name': name, 'template': str(path), 'parameters': {},
+                 'depends_on': []}, **kwargs)
+
+
+@pytest.fixture
+def client(mock_aws, monkeypatch):
+    import boto3
+
+    monkeypatch.setattr(deploy.Backoff, 'sleep', lambda self, progressed: None)
+    return boto3.client('cloudformation')
+
+
+def deployer(client, **kwargs):
+    return deploy.Deployer(client=client, out=io.StringIO(), **kwargs)
+
+
+def test_ordered():
+    stacks = [
+        {'name': 'app', 'depends_on': ['network', 'docs']},
+        {'name': 'docs', 'depends_on': []},
+        {'name': 'network', 'depends_on': []},
+    ]
+    assert [s['name'] for s in deploy.ordered(stacks)] == ['network', 'docs', 'app']
+    with pytest.raises(ValueError, match='Unknown'):
+        deploy.ordered([{'name': 'app', 'depends_on': ['missing']}])
+    with pytest.raises(ValueError, match='Circular'):
+        deploy.ordered([
+            {'name': 'a', 'depends_on': ['b']}, {'name': 'b', 'depends_on': ['a']}
+        ])
+
+
+def test_deploy(client, tmp_path):
+    queues = stack(tmp_path, 'queues', template('Queue'))
+    d = deployer(client)
+    assert d.deploy(queues) == 'CREATE_COMPLETE'
+    assert d.deploy(queues) == 'unchanged'
+    assert '[queues] Add Queue (AWS::SQS::Queue)' in d.out.getvalue()
+    assert '[queues] no changes' in d.out.getvalue()
+
+
+def test_dry_run_removes_the_stack_it_created(client, tmp_path):
+    queues = stack(tmp_path, 'queues', template('Queue'))
+    assert deployer(client, dry_run=True).deploy(queues) == 'planned'
+    assert deployer(client).status('queues') is None
+
+    # Existing stacks are left alone.
+    deployer(client).deploy(queues)
+    change_sets = client.list_change_sets(StackName='queues')['Summaries']
+    queues = stack(tmp_path, 'queues', template('Queue', 'Other'))
+    assert deployer(client, dry_run=True).deploy(queues) == 'planned'
+    assert deployer(client).status('queues') == 'CREATE_COMPLETE'
+    assert client.list_change_sets(StackName='queues')['Summaries'] == change_sets
+
+
+def test_changes_are_paginated(client, tmp_path):
+    queues = stack(tmp_path, 'queues', template('A', 'B', 'C'))
+    d = deployer(client, dry_run=True)
+    describe = client.describe_change_set
+
+    def paged(ChangeSetName, NextToken=None):
+        """Serve the changes one per page, like CloudFormation does past 100."""
+        described = describe(ChangeSetName=ChangeSetName)
+        start = int(NextToken or 0)
+        described['Changes'] = described['Changes'][start:start + 1]
+        if start + 1 < 3:
+            described['NextToken'] = str(start + 1)
+        return described
+
+    client.describe_change_set = paged
+    assert d.deploy(queues) == 'planned'
+    assert [line.split()[2] for line in d.out.getvalue().splitlines()] == [
+        'A', 'B', 'C'
+    ]
+
+
+def test_dependents_of_failures_are_skipped(client, tmp_path):
+    broken = stack(tmp_path, 'broken', template('Queue'))
+    broken['template'] = str(tmp_path / 'missing.json')
+    stacks = [
+        stack(tmp_path, 'app', template('Queue'), depends_on=['broken']),
+        broken,
+        stack(tmp_path, 'docs', template('Queue')),
+    ]
+    results = deployer(client).deploy_all(stacks, max_parallel=2)
+    assert results['broken'].startswith('failed: ')
+    assert results['app'] == 'skipped'
+    assert results['docs'] == 'CREATE_COMPLETE'
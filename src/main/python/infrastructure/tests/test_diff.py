@@ -0,0 +1,84 @@
+import io
+
+import compiler
+import diff
+import voyclib
+
+
+BUILDSPEC = '''version: 0.2
+batch:
+  build-graph:
+    - identifier: test_py38
+      buildspec: buildspec-test.yml
+      env:
+        compute-type: BUILD_GENERAL1_SMALL
+        variables:
+          PYTHON_VERSION: '3.8'
+    - identifier: publish
+      depend-on:
+        - test_py38
+'''
+
+
+def test_changes():
+    old = {'a': 1, 'b': {'c': [1, 2]}, 'd': 'x'}
+    new = {'a': 1, 'b': {'c': [1, 3, 4]}, 'e': 'y'}
+    assert list(diff.changes(old, new)) == [
+        (('b', 'c', 1), 2, 3),
+        (('b', 'c', 2), None, 4),
+        (('d',), 'x', None),
+        (('e',), None, 'y'),
+    ]
+
+
+def test_diff_plain_and_indexed():
+    old = diff.synthetic_template(20)
+    new = diff.synthetic_template(20)
+    new['Description'] = 'changed'
+    new['Resources']['Bucket3']['Properties']['Tags'][0]['Value'] = 'x'
+    del new['Outputs']['Bucket4Arn']
+    for result in (diff.diff(old, new), diff.diff(diff.Index(old), diff.Index(new))):
+        assert sorted(result) == ['Outputs', 'Resources', 'Template']
+        assert result['Outputs'].removed == ['Bucket4Arn']
+        (path, _, value), = result['Resources'].changed['Bucket3']
+        assert (path, value) == (('Properties', 'Tags', 0, 'Value'), 'x')
+    assert diff.diff(diff.Index(old), diff.Index(old)) == {}
+
+
+def voyclib_module():
+    module, = compiler.select(compiler.discover(), ['voyclib'])
+    return module
+
+
+def test_build_graph_matches(tmp_path):
+    (tmp_path / 'buildspec.yml').write_text(BUILDSPEC)
+    params = dict(voyclib.defaults, test_matrix=[('3.8', 'BUILD_GENERAL1_SMALL')])
+    out = io.StringIO()
+    assert diff.check_build_graph(
+        voyclib_module(), params, voyclib.build_graph, str(tmp_path), out
+    )
+    assert out.getvalue() == 'buildspec.yml build-graph matches voyclib.py\n'
+
+
+def test_build_graph_out_of_date(tmp_path):
+    (tmp_path / 'buildspec.yml').write_text(BUILDSPEC)
+    params = dict(voyclib.defaults, test_matrix=[
+        ('3.8', 'BUILD_GENERAL1_SMALL'), ('3.9', 'BUILD_GENERAL1_MEDIUM'),
+    ])
+    out = io.StringIO()
+    assert not diff.check_build_graph(
+        voyclib_module(), params, voyclib.build_graph, str(tmp_path), out
+    )
+    assert 'out of date' in out.getvalue()
+    assert 'identifier: test_py39' in out.getvalue()
+    # Without batches there is no graph to keep in step.
+    assert diff.check_build_graph(
+        voyclib_module(), dict(params, batch=False), voyclib.build_graph,
+        str(tmp_path), out
+    )
+
+
+def test_check_includes_the_build_graph():
+    out = io.StringIO()
+    assert diff.check(['voyclib'], out=out) == []
+    assert 'buildspec.yml build-graph matches voyclib.py' in out.getvalue()
@@ -0,0 +1,132 @@
+import hashlib
+
+import boto3
+import pytest
+
+import invalidate
+
+
+BUCKET = 'voyc-docs-tests'
+UNIVERSE = [
+    'index.html', 'search.html', 'my file.html',
+    'api/a.html', 'api/b.html',
+    'guide/x.html', 'guide/y.html', 'guide/z.html', 'guide/deep/q.html',
+]
+API = ['api/a.html', 'api/b.html']
+GUIDE = ['guide/x.html', 'guide/y.html', 'guide/z.html', 'guide/deep/q.html']
+
+
+def test_body_etag():
+    assert invalidate.body_etag(b'x') == hashlib.md5(b'x').hexdigest()
+    parts = [hashlib.md5(b'xxxx').digest()] * 2 + [hashlib.md5(b'xx').digest()]
+    assert invalidate.body_etag(b'x' * 10, 'abc-2', part_size=4) == '%s-3' % (
+        hashlib.md5(b''.join(parts)).hexdigest()
+    )
+
+
+def test_compare():
+    files = {'same': 'a', 'changed': 'b', 'new': 'c'}
+    etags = {'same': 'a', 'changed': 'x', 'gone': 'y'}
+    assert invalidate.compare(files, etags, lambda path, remote: path) == (
+        ['new'], ['changed'], ['gone']
+    )
+
+
+@pytest.mark.parametrize('changed, kwargs, paths', [
+    ([], {}, []),
+    (API, {}, ['/api/*']),
+    (['api/a.html'], {}, ['/api/a.html']),
+    (['my file.html'], {}, ['/my%20file.html']),
+    # The root object is invalidated as "/" too.
+    (['index.html', 'guide/x.html'], {}, ['/', '/guide/x.html', '/index.html']),
+    # guide/* flushes guide/z.html only.
+    (GUIDE[:2] + GUIDE[3:], {'max_paths': 2}, ['/guide/*']),
+    (['guide/x.html', 'guide/y.html', 'api/a.html'], {'max_paths': 2},
+     ['/api/a.html', '/guide/*']),
+    (['guide/x.html', 'api/a.html'], {'max_paths': 2, 'max_wildcards': 0},
+     ['/api/a.html', '/guide/x.html']),
+    (API + GUIDE, {}, ['/api/*', '/guide/*']),
+    (API + GUIDE, {'max_wildcards': 1}, ['/*']),
+    (['index.html', 'api/a.html'], {'max_paths': 2}, ['/*']),
+    # Not even "/" and "/index.html" fit: "/*" needs no "/" slot.
+    (['index.html'], {'max_paths': 1}, ['/*']),
+    (['index.html'], {'max_paths': 0}, ['/*']),
+    (['index.html'], {'max_paths': 2}, ['/', '/index.html']),
+])
+def test_collapse(changed, kwargs, paths):
+    assert invalidate.collapse(changed, UNIVERSE, **kwargs) == paths
+
+
+@pytest.fixture
+def s3(mock_aws):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    for key in ['index.html', 'api/a.html', 'api/b.html', 'old.html']:
+        client.put_object(
+            Bucket=BUCKET, Key='docs/' + key, Body=key.encode('utf-8')
+        )
+    # Outside the origin path.
+    client.put_object(Bucket=BUCKET, Key='other/index.html', Body=b'other')
+    # Directory markers have no file to compare.
+    for key in ('docs/', 'docs/api/'):
+        client.put_object(Bucket=BUCKET, Key=key, Body=b'')
+    return client
+
+
+def test_plan(s3, tmp_path):
+    build = tmp_path / 'html'
+    (build / 'api').mkdir(parents=True)
+    (build / 'index.html').write_bytes(b'index.html')
+    (build / 'api' / 'a.html').write_bytes(b'changed')
+    (build / 'api' / 'b.html').write_bytes(b'changed')
+    (build / 'new.html').write_bytes(b'new')
+
+    assert invalidate.plan(str(build), BUCKET, client=s3) == {
+        'added': ['new.html'],
+        'modified': ['api/a.html', 'api/b.html'],
+        'deleted': ['old.html'],
+        'paths': ['/api/*', '/old.html'],
+    }
+
+
+@pytest.fixture
+def cloudfront(mock_aws):
+    return boto3.client('cloudfront', region_name='us-east-1')
+
+
+@pytest.fixture
+def distribution_id(cloudfront):
+    origin = BUCKET + '.s3.amazonaws.com'
+    response = cloudfront.create_distribution(DistributionConfig={
+        'CallerReference': 'tests',
+        'Comment': '',
+        'Enabled': True,
+        'Origins': {'Quantity': 1, 'Items': [{
+            'Id': 'docs',
+            'DomainName': origin,
+            'OriginPath': '/docs',
+            'S3OriginConfig': {'OriginAccessIdentity': ''},
+        }]},
+        'DefaultCacheBehavior': {
+            'TargetOriginId': 'docs',
+            'ViewerProtocolPolicy': 'redirect-to-https',
+            'MinTTL': 0,
+            'ForwardedValues': {
+                'QueryString': False, 'Cookies': {'Forward': 'none'}
+            },
+            'TrustedSigners': {'Enabled': False, 'Quantity': 0},
+        },
+    })
+    return response['Distribution']['Id']
+
+
+def test_submit(cloudfront, distribution_id):
+    assert invalidate.submit(cloudfront, distribution_id, []) is None
+
+    paths = ['/', '/api/*', '/index.html']
+    invalidation = invalidate.submit(cloudfront, distribution_id, paths)
+    batch = cloudfront.get_invalidation(
+        DistributionId=distribution_id, Id=invalidation
+    )['Invalidation']['InvalidationBatch']
+    assert batch['Paths'] == {'Quantity': 3, 'Items': paths}
+    assert len(batch['CallerReference']) == 32
@@ -0,0 +1,217 @@
+import json
+
+import pytest
+
+import split
+
+
+def queue(i):
+    properties = {
+        'QueueName': {'Fn::Sub': '${AWS::StackName}-queue-%d' % i},
+        'DelaySeconds': {'Ref': 'Delay'},
+        'Tags': [{'Key': 'padding', 'Value': 'x' * 200}],
+    }
+    if i:
+        properties['Tags'].append(
+            {'Key': 'previous', 'Value': {'Fn::GetAtt': ['Queue%d' % (i - 1), 'Arn']}}
+        )
+    return {'Type': 'AWS::SQS::Queue', 'Properties': properties}
+
+
+def template(queues=12):
+    resources = {
+        'Zone': {
+            'Type': 'AWS::Route53::HostedZone',
+            'Properties': {'Name': 'example.com'},
+        },
+    }
+    for i in range(queues):
+        resources['Queue%d' % i] = queue(i)
+    resources['Queue%d' % (queues // 2)]['Properties']['Tags'].append(
+        {'Key': 'subnets', 'Value': {'Fn::Join': [',', {'Ref': 'Subnets'}]}}
+    )
+    resources['Delegation'] = {
+        'Type': 'AWS::Route53::RecordSet',
+        'Condition': 'Delegate',
+        'DependsOn': 'Queue%d' % (queues - 1),
+        'Properties': {
+            'HostedZoneName': 'example.org.',
+            'Name': 'example.com.',
+            'Type': 'NS',
+            'TTL': '300',
+            'ResourceRecords': {'Fn::GetAtt': ['Zone', 'NameServers']},
+        },
+    }
+    return {
+        'Description': 'Test stack',
+        'Parameters': {
+            'Delay': {'Type': 'Number', 'Default': 0, 'MinValue': 0},
+            'Subnets': {'Type': 'List<AWS::EC2::Subnet::Id>'},
+        },
+        'Conditions': {
+            'Delegate': {'Fn::Equals': [{'Ref': 'AWS::StackName'}, 'prod']},
+        },
+        'Resources': resources,
+        'Outputs': {
+            'NameServers': {'Value': {'Fn::Join': [
+                ',', {'Fn::GetAtt': ['Zone', 'NameServers']}
+            ]}},
+            'LastQueue': {'Value': {'Ref': 'Queue%d' % (queues - 1)}},
+            'Url': {'Value': {'Fn::Sub': 'https://${Zone}/${AWS::StackName}'}},
+        },
+    }
+
+
+@pytest.fixture
+def small(monkeypatch):
+    monkeypatch.setattr(split, 'MAX_BODY_BYTES', 3000)
+
+
+def test_references():
+    value = {
+        'A': {'Ref': 'Param'},
+        'B': {'Fn::GetAtt': 'Bucket.Arn'},
+        'C': {'Fn::Sub': ['${Queue.Arn}/${Local}/${AWS::Region}',
+                          {'Local': {'Ref': 'Other'}}]},
+        'DependsOn': ['Role'],
+        'D': {'Fn::If': ['IsProd', {'Fn::FindInMap': ['Sizes', 'a', 'b']}, 1]},
+    }
+    assert sorted(split.references(value)) == [
+        ('condition', 'IsProd', None),
+        ('depends', 'Role', None),
+        ('getatt', 'Bucket', 'Arn'),
+        ('getatt', 'Queue', 'Arn'),
+        ('mapping', 'Sizes', None),
+        ('ref', 'Other', None),
+        ('ref', 'Param', None),
+    ]
+    assert sorted(split.stack_pseudo(value)) == []
+    assert sorted(split.stack_pseudo({
+        'A': {'Ref': 'AWS::StackName'},
+        'B': {'Fn::Sub': ['${AWS::StackId}-${AWS::Region}', {}]},
+    })) == ['AWS::StackId', 'AWS::StackName']
+
+
+def test_ordered():
+    resources = {
+        'C': {'DependsOn': ['B']},
+        'Alone': {},
+        'B': {'Properties': {'X': {'Ref': 'A'}}},
+        'A': {},
+    }
+    assert split.ordered(resources) == ['A', 'B', 'C', 'Alone']
+    with pytest.raises(ValueError, match='Circular'):
+        split.ordered({'A': {'DependsOn': 'B'}, 'B': {'DependsOn': 'A'}})
+
+
+def test_fitting_template_is_kept():
+    small = template(queues=2)
+    assert split.split(small, 'stack') == {'stack.json': small}
+
+
+def test_split(small):
+    files = split.split(template(), 'stack')
+    names = list(files)
+    parent, children = files['stack.json'], {n: files[n] for n in names[1:]}
+    assert names[0] == 'stack.json' and len(children) > 2
+    assert all(split.fits(part) for part in files.values())
+    assert list(parent['Resources']) == [
+        'Stack%d' % (i + 1) for i in range(len(children))
+    ]
+    # Every resource is in exactly one child.
+    placed = [name for child in children.values() for name in child['Resources']]
+    assert sorted(placed) == sorted(template()['Resources'])
+    for i, name in enumerate(children):
+        stack = parent['Resources']['Stack%d' % (i + 1)]
+        assert stack['Properties']['TemplateURL'] == name
+
+
+def child_of(files, resource):
+    for name, child in list(files.items())[1:]:
+        if resource in child['Resources']:
+            stack = 'Stack%s' % name.split('.')[1]
+            return child, files['stack.json']['Resources'][stack]
+    raise KeyError(resource)
+
+
+def test_parent_parameters_keep_their_types(small):
+    files = split.split(template(), 'stack')
+    child, stack = child_of(files, 'Queue0')
+    assert child['Parameters']['Delay'] == {
+        'Type': 'Number', 'Default': 0, 'MinValue': 0
+    }
+    assert stack['Properties']['Parameters']['Delay'] == {'Ref': 'Delay'}
+    assert 'Subnets' not in child['Parameters']
+
+    # List parameters are joined by the parent and keep their list type.
+    child, stack = child_of(files, 'Queue6')
+    assert child['Parameters']['Subnets'] == {'Type': 'List<AWS::EC2::Subnet::Id>'}
+    assert stack['Properties']['Parameters']['Subnets'] == {
+        'Fn::Join': [',', {'Ref': 'Subnets'}]
+    }
+
+
+def test_stack_name_is_the_parents(small):
+    files = split.split(template(), 'stack')
+    for name, child in list(files.items())[1:]:
+        text = split.minified(child)
+        assert 'AWS::StackName' not in text and 'AWS::StackId' not in text
+
+    child, stack = child_of(files, 'Queue3')
+    assert child['Parameters']['ParentStackName'] == {'Type': 'String'}
+    assert 'ParentStackId' not in child['Parameters']
+    assert stack['Properties']['Parameters']['ParentStackName'] == {
+        'Ref': 'AWS::StackName'
+    }
+    assert child['Resources']['Queue3']['Properties']['QueueName'] == {
+        'Fn::Sub': '${ParentStackName}-queue-3'
+    }
+
+    # Conditions copied into a child are rewritten too.
+    child, _ = child_of(files, 'Delegation')
+    assert child['Conditions']['Delegate'] == {
+        'Fn::Equals': [{'Ref': 'ParentStackName'}, 'prod']
+    }
+    # The parent keeps its own outputs as they were.
+    url = files['stack.json']['Outputs']['Url']['Value']['Fn::Sub']
+    assert url[0] == 'https://${ZoneRef}/${AWS::StackName}'
+
+
+def test_cross_stack_values(small):
+    files = split.split(template(), 'stack')
+    zone, zone_stack = child_of(files, 'Zone')
+    child, stack = child_of(files, 'Delegation')
+    assert zone is not child
+
+    # Lists cross joined, into a list parameter.
+    assert zone['Outputs']['ZoneNameServers'] == {'Value': {
+        'Fn::Join': [',', {'Fn::GetAtt': ['Zone', 'NameServers']}]
+    }}
+    assert child['Parameters']['ZoneNameServers'] == {
+        'Type': 'CommaDelimitedList'
+    }
+    properties = child['Resources']['Delegation']['Properties']
+    assert properties['ResourceRecords'] == {'Ref': 'ZoneNameServers'}
+    assert stack['Properties']['Parameters']['ZoneNameServers'] == {
+        'Fn::GetAtt': ['Stack1', 'Outputs.ZoneNameServers']
+    }
+    assert 'Stack1' in stack['DependsOn']
+
+    previous, _ = child_of(files, 'Queue5')
+    consumer, _ = child_of(files, 'Queue6')
+    if previous is not consumer:
+        assert consumer['Parameters']['Queue5Arn'] == {'Type': 'String'}
+
+    outputs = files['stack.json']['Outputs']
+    assert outputs['NameServers'] == {'Value': {'Fn::Join': [',', {
+        'Fn::Split': [',', {'Fn::GetAtt': ['Stack1', 'Outputs.ZoneNameServers']}]
+    }]}}
+    assert outputs['LastQueue']['Value']['Fn::GetAtt'][1] == 'Outputs.Queue11Ref'
+    json.dumps(files)
+
+
+def test_oversized_resource(small):
+    big = template(queues=1)
+    big['Resources']['Queue0']['Properties']['Tags'][0]['Value'] = 'x' * 5000
+    with pytest.raises(ValueError, match='Queue0 alone'):
+        split.split(big, 'stack')
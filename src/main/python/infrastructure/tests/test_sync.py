@@ -0,0 +1,172 @@
+import json
+import os
+
+import boto3
+import pytest
+
+import invalidate
+import sync
+
+
+BUCKET = 'voyc-docs-tests'
+TABLE = [
+    {'path': '/_static/*', 'cache_control': 'max-age=31536000'},
+    {'cache_control': 'max-age=300'},
+]
+
+
+@pytest.mark.parametrize('key, kind', [
+    ('index.html', 'text/html; charset=utf-8'),
+    ('_static/app.js', 'application/javascript; charset=utf-8'),
+    ('_static/font.woff2', 'font/woff2'),
+    ('_images/logo.PNG', 'image/png'),
+    ('objects.inv', 'application/octet-stream'),
+])
+def test_content_type(key, kind):
+    assert sync.content_type(key) == kind
+
+
+def test_cache_control():
+    assert sync.cache_control('_static/app.js', TABLE) == 'max-age=31536000'
+    assert sync.cache_control('index.html', TABLE) == 'max-age=300'
+    assert sync.cache_control('index.html', TABLE[:1]) is None
+
+
+def test_object_headers():
+    headers = sync.object_headers('_static/app.js', TABLE)
+    digest = headers.pop('Metadata')[sync.HEADERS_META]
+    assert headers == {
+        'ContentType': 'application/javascript; charset=utf-8',
+        'CacheControl': 'max-age=31536000',
+    }
+    assert digest == sync.header_digest(headers)
+    assert digest != sync.object_headers('_static/app.js')['Metadata']
+
+
+@pytest.fixture
+def client(mock_aws):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+@pytest.fixture
+def calls(client):
+    """The names of the S3 operations ``client`` sends."""
+    calls = []
+    client.meta.events.register(
+        'before-parameter-build.s3',
+        lambda model, **kwargs: calls.append(model.name),
+    )
+    return calls
+
+
+@pytest.fixture
+def build(tmp_path):
+    build = tmp_path / 'html'
+    (build / '_static').mkdir(parents=True)
+    (build / 'index.html').write_bytes(b'<p>index</p>')
+    (build / 'search.html').write_bytes(b'<p>search</p>')
+    (build / '_static' / 'app.js').write_bytes(b'app()')
+    return build
+
+
+def syncer(client, **kwargs):
+    return sync.Syncer(BUCKET, client=client, workers=4, cache_table=TABLE,
+                       **kwargs)
+
+
+def manifest(client, key='.sync/docs/manifest.json'):
+    body = client.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+    return json.loads(body.decode('utf-8'))
+
+
+def test_sync(client, calls, build):
+    result = syncer(client).sync(str(build))
+    assert result['added'] == ['_static/app.js', 'index.html', 'search.html']
+    head = client.head_object(Bucket=BUCKET, Key='docs/_static/app.js')
+    assert head['CacheControl'] == 'max-age=31536000'
+    assert head['ContentType'] == 'application/javascript; charset=utf-8'
+    entry = manifest(client)['_static/app.js']
+    assert entry == {
+        'etag': head['ETag'].strip('"'),
+        'headers': head['Metadata'][sync.HEADERS_META],
+    }
+
+    # Nothing changed: one listing and one manifest read, whatever the size.
+    del calls[:]
+    result = syncer(client).sync(str(build))
+    assert result['unchanged'] == ['_static/app.js', 'index.html', 'search.html']
+    assert sorted(calls) == ['GetObject', 'ListObjectsV2']
+
+    (build / 'index.html').write_bytes(b'<p>changed</p>')
+    (build / 'new.html').write_bytes(b'<p>new</p>')
+    os.remove(str(build / 'search.html'))
+    del calls[:]
+    result = syncer(client).sync(str(build), delete=True)
+    assert (result['added'], result['modified'], result['deleted']) == (
+        ['new.html'], ['index.html'], ['search.html']
+    )
+    assert 'HeadObject' not in calls
+    assert sorted(manifest(client)) == ['_static/app.js', 'index.html', 'new.html']
+    assert syncer(client).sync(str(build))['unchanged'] == [
+        '_static/app.js', 'index.html', 'new.html'
+    ]
+
+
+def test_header_changes_are_uploaded(client, calls, build):
+    syncer(client).sync(str(build))
+    del calls[:]
+    result = sync.Syncer(BUCKET, client=client, cache_table=[]).sync(str(build))
+    assert result['modified'] == ['_static/app.js', 'index.html', 'search.html']
+    assert 'HeadObject' not in calls
+    head = client.head_object(Bucket=BUCKET, Key='docs/index.html')
+    assert 'CacheControl' not in head
+
+
+def test_objects_without_entries_are_checked(client, calls, build):
+    syncer(client).sync(str(build))
+    client.delete_object(Bucket=BUCKET, Key='.sync/docs/manifest.json')
+    # Replaced outside sync: the manifest entry is out of date.
+    client.put_object(Bucket=BUCKET, Key='docs/search.html', Body=b'<p>search</p>')
+    del calls[:]
+    result = syncer(client).sync(str(build))
+    assert result['unchanged'] == ['_static/app.js', 'index.html']
+    assert result['modified'] == ['search.html']
+    assert calls.count('HeadObject') == 3
+    assert sorted(manifest(client)) == ['_static/app.js', 'index.html', 'search.html']
+
+
+def test_kept_objects_keep_their_entries(client, build):
+    syncer(client).sync(str(build))
+    os.remove(str(build / 'search.html'))
+    result = syncer(client).sync(str(build))
+    assert result['kept'] == ['search.html']
+    assert 'search.html' in manifest(client)
+
+
+def test_dry_run(client, build):
+    result = syncer(client).sync(str(build), dry_run=True)
+    assert result['added'] == ['_static/app.js', 'index.html', 'search.html']
+    assert 'Contents' not in client.list_objects_v2(Bucket=BUCKET)
+
+
+def test_bucket_root(client, build):
+    root = syncer(client, prefix='')
+    root.sync(str(build), delete=True)
+    assert sorted(manifest(client, '.sync/manifest.json')) == [
+        '_static/app.js', 'index.html', 'search.html'
+    ]
+    result = root.sync(str(build), delete=True)
+    assert result['deleted'] == [] and len(result['unchanged']) == 3
+
+
+def test_multipart_etag(client, tmp_path):
+    build = tmp_path / 'html'
+    build.mkdir()
+    (build / 'large.bin').write_bytes(os.urandom(invalidate.PART_SIZE + 1))
+    syncer(client).sync(str(build))
+    etag = client.head_object(Bucket=BUCKET, Key='docs/large.bin')['ETag']
+    assert etag.strip('"').endswith('-2')
+    assert manifest(client)['large.bin']['etag'] == etag.strip('"')
+    assert syncer(client).sync(str(build))['unchanged'] == ['large.bin']
@@ -0,0 +1,111 @@
+import datetime
+import io
+import os
+
+import pytest
+
+import telemetry
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'telemetry.json')
+PROJECT = 'voyc-voyclib-build'
+PROJECTS = [PROJECT, 'voyc-docs']
+
+
+@pytest.fixture
+def client():
+    return telemetry.FixtureClient.load(FIXTURE)
+
+
+@pytest.fixture
+def db():
+    db = telemetry.connect(':memory:')
+    yield db
+    db.close()
+
+
+def numbers(db, project=PROJECT):
+    return [n for n, in db.execute(
+        'SELECT number FROM builds WHERE project = ? ORDER BY number', (project,)
+    )]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2021-01-05T14:01:00+00:00', datetime.datetime(2021, 1, 5, 14, 1)),
+    ('2021-01-05T14:01:00.250000+00:00',
+     datetime.datetime(2021, 1, 5, 14, 1, 0, 250000)),
+    ('2021-01-05T15:01:00+01:00', datetime.datetime(2021, 1, 5, 14, 1)),
+])
+def test_timestamp(value, expected):
+    utc = expected.replace(tzinfo=datetime.timezone.utc)
+    assert telemetry._timestamp(value) == utc.timestamp()
+
+
+@pytest.mark.parametrize('batch_size', [2, telemetry.BATCH_SIZE])
+def test_new_build_ids(client, monkeypatch, batch_size):
+    monkeypatch.setattr(telemetry, 'BATCH_SIZE', batch_size)
+    ids = client.projects[PROJECT]
+
+    assert telemetry.new_build_ids(client, PROJECT) == ids
+    assert telemetry.new_build_ids(client, PROJECT, cursor=ids[3]) == ids[:3]
+    assert telemetry.new_build_ids(client, PROJECT, cursor=ids[0]) == []
+    # The oldest new builds, so the newer ones are left for the next run.
+    assert telemetry.new_build_ids(client, PROJECT, limit=2) == ids[-2:]
+    assert telemetry.new_build_ids(client, PROJECT, ids[3], limit=2) == ids[1:3]
+
+
+def test_collect(client, db):
+    assert telemetry.collect(db, client, PROJECTS) == {PROJECT: 6, 'voyc-docs': 3}
+    # Build 7 is still running: the cursor stops before it.
+    assert numbers(db) == [1, 2, 3, 4, 5, 6]
+    cursor = db.execute(
+        'SELECT build_id FROM cursors WHERE project = ?', (PROJECT,)
+    ).fetchone()[0]
+    assert cursor == client.projects[PROJECT][1]
+
+    status, duration = db.execute(
+        'SELECT status, duration FROM builds WHERE project = ? AND number = 1',
+        ('voyc-docs',),
+    ).fetchone()
+    assert status == 'SUCCEEDED'
+    assert duration == 87
+    phases = dict(db.execute(
+        'SELECT phase, duration FROM phases WHERE build_id = ?',
+        (client.projects['voyc-docs'][-1],),
+    ))
+    assert phases['BUILD'] == 31
+    assert 'COMPLETED' not in phases
+
+    assert telemetry.collect(db, client, PROJECTS) == {PROJECT: 0, 'voyc-docs': 0}
+
+
+def test_collect_limit_skips_nothing(client, db):
+    counts = [telemetry.collect(db, client, [PROJECT], limit=2)[PROJECT]
+              for _ in range(4)]
+    assert counts == [2, 2, 2, 0]
+    assert numbers(db) == [1, 2, 3, 4, 5, 6]
+
+
+def test_record_replays(client, db, tmp_path):
+    recorder = telemetry.Recorder(client)
+    telemetry.collect(db, recorder, PROJECTS)
+    path = str(tmp_path / 'recorded.json')
+    recorder.save(path)
+
+    replayed = telemetry.connect(':memory:')
+    assert telemetry.collect(replayed, telemetry.FixtureClient.load(path),
+                             PROJECTS) == {PROJECT: 6, 'voyc-docs': 3}
+    query = 'SELECT * FROM phases ORDER BY build_id, phase'
+    assert replayed.execute(query).fetchall() == db.execute(query).fetchall()
+
+
+def test_report_flags_regressions(client, db):
+    telemetry.collect(db, client, PROJECTS)
+    out = io.StringIO()
+    regressions = telemetry.report(
+        db, [PROJECT], recent=2, baseline=3, threshold=0.1, min_seconds=5,
+        out=out,
+    )
+    # BUILD took 42, 44, 46 then 48, 52 seconds; build 5 failed.
+    assert (PROJECT, 'BUILD', 44, 50) in regressions
+    assert 'REGRESSION' in out.getvalue()
@@ -1,36 +1,4 @@
-from troposphere import (
-    Template,
-    Parameter,
-    Ref,
-    Join,
-    Sub,
-    GetAtt
-)
-from troposphere.codebuild import (
-    Artifacts,
-    Environment,
-    Source,
-    Project,
-    SourceAuth,
-    ProjectTriggers, 
-    WebhookFilter
-)
-from troposphere.iam import PolicyType, Role
-from troposphere.s3 import Bucket, PublicRead, WebsiteConfiguration
-
-import awacs
-from awacs.aws import Allow, Principal, Statement, PolicyDocument
-from awacs.sts import AssumeRole
-
-
-
-t = Template()
-t.set_description(
-    'Voyclib CloudFormation template generation'
-)
-
-account_id = Ref('AWS::AccountId')
-region = Ref('AWS::Region')
+OUTPUT = 'voyclib.json'
 
 defaults = {
     'app_name': 'voyclib',
@@ -39,261 +7,607 @@ defaults = {
     'buildspec_path': 'buildspec.yml',
     'build_image': 'aws/codebuild/amazonlinux2-x86_64-standard:3.0',
     'build_name': 'voyclib_build',
-    'bucket_name': 'voyclib'
+    'bucket_name': 'voyclib',
+    # Serve the index through CloudFront from a private bucket.
+    'cdn': False,
+    'index_ttl': 60,
+    # See buildcache.py.
+    'cache': {'type': 'LOCAL', 'modes': ['source', 'custom']},
+    # Only pushes touching these paths (a FILE_PATH regex) start a build.
+    'trigger_paths': r'^(src/main/python/voyclib/|buildspec(-test)?\.yml$)',
+    # Run builds as batches: the build-graph in buildspec.yml tests on each
+    # (python, compute type) below in parallel, then publishes.
+    'batch': True,
+    'test_matrix': [
+        ('3.8', 'BUILD_GENERAL1_SMALL'),
+        ('3.9', 'BUILD_GENERAL1_SMALL'),
+    ],
+    'batch_timeout': 30,
 }
 
+# Published wheels and sdists are immutable, so edges keep them for a year.
+FILE_TTL = 31536000
+FILE_PATTERNS = ('*.whl', '*.tar.gz', '*.zip', '*.metadata')
 
-#############################
-#  Parameters
-#############################
 
-app_name = t.add_parameter(
-    Parameter(
-        'AppName',
-        Description='Name of the application',
-        Type='String',
-        Default=defaults['app_name'],
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Git URL is required')
+def build_graph(test_matrix):
+    """The ``batch.build-graph`` of buildspec.yml for ``test_matrix``: a test
+    build per entry, then the publish build once they have all passed.
+    ``diff.py --check`` fails when the buildspec's differs."""
+    tests = [
+        {
+            'identifier': 'test_py%s' % python.replace('.', ''),
+            'buildspec': 'buildspec-test.yml',
+            'env': {
+                'compute-type': compute,
+                'variables': {'PYTHON_VERSION': python},
+            },
+        }
+        for python, compute in test_matrix
+    ]
+    return tests + [{
+        'identifier': 'publish',
+        'depend-on': [test['identifier'] for test in tests],
+    }]
+
+
+def build(**params):
+    from troposphere import (
+        Template,
+        Parameter,
+        Output,
+        Ref,
+        Join,
+        Sub,
+        GetAtt
     )
-)
-t.set_parameter_label(app_name, 'Application Name')
-
-github_location = t.add_parameter(
-    Parameter(
-        'GithubLocation',
-        Description='Github repo URL',
-        Type='String',
-        Default=defaults['github_location'],
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Git URL is required')
+    from troposphere.cloudfront import (
+        CacheBehavior,
+        CacheCookiesConfig,
+        CacheHeadersConfig,
+        CachePolicy,
+        CachePolicyConfig,
+        CacheQueryStringsConfig,
+        CloudFrontOriginAccessIdentity,
+        CloudFrontOriginAccessIdentityConfig,
+        DefaultCacheBehavior,
+        Distribution,
+        DistributionConfig,
+        Origin,
+        ParametersInCacheKeyAndForwardedToOrigin,
+        S3OriginConfig,
     )
-)
-t.set_parameter_label(github_location, 'Github location')
-
-github_branch = t.add_parameter(
-    Parameter(
-        'GithubBranch',
-        Description='Github branch to track',
-        Type='String',
-        Default=defaults['github_branch'],
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Git branch is required')
+    from troposphere.codebuild import (
+        Artifacts,
+        BatchRestrictions,
+        Environment,
+        Source,
+        Project,
+        ProjectBuildBatchConfig,
+        SourceAuth,
+        WebhookFilter
     )
-)
-t.set_parameter_label(github_branch, 'Github branch')
-
-buildspec_path = t.add_parameter(
-    Parameter(
-        'Buildspec',
-        Description='Path to buildspec.yml',
-        Type='String',
-        Default=defaults['buildspec_path'],
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('buildspec.yml must exist')
+    from troposphere.iam import PolicyType, Role
+    from troposphere.s3 import (
+        Bucket,
+        BucketPolicy,
+        PublicAccessBlockConfiguration,
+        PublicRead,
+        WebsiteConfiguration
     )
-)
-t.set_parameter_label(buildspec_path, 'Buildspec Path')
-
-build_image = t.add_parameter(
-    Parameter(
-        'BuildImage',
-        Description='The Codebuild build image.',
-        Type='String',
-        Default=defaults['build_image'],
-        MinLength='1',
-        MaxLength='256',
-        ConstraintDescription=('Build image is required.'),
+    import awacs
+    import buildcache
+    from codebuild_ext import ProjectTriggers
+    from awacs.aws import Allow, Principal, Statement, PolicyDocument
+    from awacs.sts import AssumeRole
+
+    params = dict(defaults, **params)
+
+    t = Template()
+    t.set_description(
+        'Voyclib CloudFormation template generation'
     )
-)
-t.set_parameter_label(build_image, 'Build Image')
-
-s3_bucket_name = t.add_parameter(
-    Parameter(
-        'S3BucketName',
-        Description='Name of s3 voyclib bucket',
-        Type='String',
-        Default=defaults['bucket_name'],
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Bucket name must be provided'),
+
+    account_id = Ref('AWS::AccountId')
+    region = Ref('AWS::Region')
+
+    #############################
+    #  Parameters
+    #############################
+
+    app_name = t.add_parameter(
+        Parameter(
+            'AppName',
+            Description='Name of the application',
+            Type='String',
+            Default=params['app_name'],
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Git URL is required')
+        )
     )
-)
-t.set_parameter_label(s3_bucket_name, 'S3 Bucket Name')
-
-s3_bucket_secret = t.add_parameter(
-    Parameter(
-        'S3BucketSecret',
-        Description='Name of s3 voyclib secret file',
-        Type='String',
-        MinLength='1',
-        MaxLength='128',
-        ConstraintDescription=('Bucket secret directoty must be provided'),
+    t.set_parameter_label(app_name, 'Application Name')
+
+    github_location = t.add_parameter(
+        Parameter(
+            'GithubLocation',
+            Description='Github repo URL',
+            Type='String',
+            Default=params['github_location'],
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Git URL is required')
+        )
+    )
+    t.set_parameter_label(github_location, 'Github location')
+
+    github_branch = t.add_parameter(
+        Parameter(
+            'GithubBranch',
+            Description='Github branch to track',
+            Type='String',
+            Default=params['github_branch'],
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Git branch is required')
+        )
+    )
+    t.set_parameter_label(github_branch, 'Github branch')
+
+    buildspec_path = t.add_parameter(
+        Parameter(
+            'Buildspec',
+            Description='Path to buildspec.yml',
+            Type='String',
+            Default=params['buildspec_path'],
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('buildspec.yml must exist')
+        )
+    )
+    t.set_parameter_label(buildspec_path, 'Buildspec Path')
+
+    build_image = t.add_parameter(
+        Parameter(
+            'BuildImage',
+            Description='The Codebuild build image.',
+            Type='String',
+            Default=params['build_image'],
+            MinLength='1',
+            MaxLength='256',
+            ConstraintDescription=('Build image is required.'),
+        )
+    )
+    t.set_parameter_label(build_image, 'Build Image')
+
+    s3_bucket_name = t.add_parameter(
+        Parameter(
+            'S3BucketName',
+            Description='Name of s3 voyclib bucket',
+            Type='String',
+            Default=params['bucket_name'],
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Bucket name must be provided'),
+        )
     )
-)
-t.set_parameter_label(s3_bucket_secret, 'S3 Bucket Secret')
-
-for p in [github_branch, github_location]:
-    t.add_parameter_to_group(p, 'Git')
-
-for p in [buildspec_path, build_image]:
-    t.add_parameter_to_group(p, 'Codebuild')
-
-for p in [s3_bucket_name, s3_bucket_secret]:
-    t.add_parameter_to_group(p, 'S3')
-
-#############################
-#  S3
-#############################
-
-s3bucket = t.add_resource(
-    Bucket(
-        'VoyclibBucket',
-        BucketName=Ref('S3BucketName'),
-        AccessControl=PublicRead,
-        WebsiteConfiguration=WebsiteConfiguration(
-            IndexDocument='index.html',
-            ErrorDocument='error.html'
+    t.set_parameter_label(s3_bucket_name, 'S3 Bucket Name')
+
+    s3_bucket_secret = t.add_parameter(
+        Parameter(
+            'S3BucketSecret',
+            Description='Name of s3 voyclib secret file',
+            Type='String',
+            MinLength='1',
+            MaxLength='128',
+            ConstraintDescription=('Bucket secret directoty must be provided'),
         )
     )
-)
-
-#############################
-#  Codebuild - Roles and Policies
-#############################
-
-codebuild_role = t.add_resource(
-    Role(
-        'CodebuildRole',
-        AssumeRolePolicyDocument=PolicyDocument(
-            Statement=[
-                Statement(
-                    Principal=Principal('Service', ['codebuild.amazonaws.com']),
-                    Effect=Allow,
-                    Action=[AssumeRole]
+    t.set_parameter_label(s3_bucket_secret, 'S3 Bucket Secret')
+
+    for p in [github_branch, github_location]:
+        t.add_parameter_to_group(p, 'Git')
+
+    for p in [buildspec_path, build_image]:
+        t.add_parameter_to_group(p, 'Codebuild')
+
+    for p in [s3_bucket_name, s3_bucket_secret]:
+        t.add_parameter_to_group(p, 'S3')
+
+    cache, cache_statements = buildcache.add(t, params['cache'])
+
+    #############################
+    #  S3
+    #############################
+
+    if params['cdn']:
+        s3bucket = t.add_resource(
+            Bucket(
+                'VoyclibBucket',
+                BucketName=Ref('S3BucketName'),
+                PublicAccessBlockConfiguration=PublicAccessBlockConfiguration(
+                    BlockPublicAcls=True,
+                    BlockPublicPolicy=True,
+                    IgnorePublicAcls=True,
+                    RestrictPublicBuckets=True
+                )
+            )
+        )
+    else:
+        s3bucket = t.add_resource(
+            Bucket(
+                'VoyclibBucket',
+                BucketName=Ref('S3BucketName'),
+                AccessControl=PublicRead,
+                WebsiteConfiguration=WebsiteConfiguration(
+                    IndexDocument='index.html',
+                    ErrorDocument='error.html'
+                )
+            )
+        )
+
+    #############################
+    #  Cloudfront
+    #############################
+
+    if params['cdn']:
+        cloudfront_oai = t.add_resource(
+            CloudFrontOriginAccessIdentity(
+                'VoyclibOAI',
+                CloudFrontOriginAccessIdentityConfig=(
+                    CloudFrontOriginAccessIdentityConfig(
+                        Comment='OAI to private voyclib package index bucket.'
+                    )
+                )
+            )
+        )
+
+        t.add_resource(
+            BucketPolicy(
+                'VoyclibBucketPolicy',
+                Bucket=Ref(s3bucket),
+                PolicyDocument=awacs.aws.Policy(
+                    Statement=[
+                        Statement(
+                            Effect=Allow,
+                            Action=[awacs.aws.Action('s3', 'GetObject')],
+                            Resource=[
+                                Join('', [GetAtt('VoyclibBucket', 'Arn'), '/*'])
+                            ],
+                            Principal=Principal(
+                                'AWS',
+                                Join('', [
+                                    'arn:aws:iam::cloudfront:user/'
+                                    'CloudFront Origin Access Identity ',
+                                    Ref(cloudfront_oai)
+                                ])
+                            )
+                        )
+                    ]
+                )
+            )
+        )
+
+        def cache_policy(title, policy_name, ttl, comment):
+            return t.add_resource(
+                CachePolicy(
+                    title,
+                    CachePolicyConfig=CachePolicyConfig(
+                        Name=Sub('voyc-${AppName}-%s' % policy_name),
+                        Comment=comment,
+                        MinTTL=ttl,
+                        DefaultTTL=ttl,
+                        MaxTTL=ttl,
+                        ParametersInCacheKeyAndForwardedToOrigin=(
+                            ParametersInCacheKeyAndForwardedToOrigin(
+                                CookiesConfig=CacheCookiesConfig(
+                                    CookieBehavior='none'
+                                ),
+                                HeadersConfig=CacheHeadersConfig(
+                                    HeaderBehavior='none'
+                                ),
+                                QueryStringsConfig=CacheQueryStringsConfig(
+                                    QueryStringBehavior='none'
+                                ),
+                                EnableAcceptEncodingGzip=True,
+                                EnableAcceptEncodingBrotli=True
+                            )
+                        )
+                    )
                 )
+            )
+
+        # Index pages tell clients to revalidate every time (max-age=0), so
+        # the edge TTL is pinned rather than taken from Cache-Control.
+        index_policy = cache_policy(
+            'VoyclibIndexCachePolicy',
+            'index',
+            params['index_ttl'],
+            'Package index pages, cached briefly at the edge.'
+        )
+        file_policy = cache_policy(
+            'VoyclibFileCachePolicy',
+            'files',
+            FILE_TTL,
+            'Immutable wheels, sdists and their metadata.'
+        )
+
+        cloudfront = t.add_resource(
+            Distribution(
+                'VoyclibDistribution',
+                DistributionConfig=DistributionConfig(
+                    Comment='Voyclib package index.',
+                    DefaultCacheBehavior=DefaultCacheBehavior(
+                        TargetOriginId='S3Origin',
+                        CachePolicyId=Ref(index_policy),
+                        Compress=True,
+                        ViewerProtocolPolicy='redirect-to-https'
+                    ),
+                    CacheBehaviors=[
+                        CacheBehavior(
+                            PathPattern=pattern,
+                            TargetOriginId='S3Origin',
+                            CachePolicyId=Ref(file_policy),
+                            Compress=True,
+                            ViewerProtocolPolicy='redirect-to-https'
+                        )
+                        for pattern in FILE_PATTERNS
+                    ],
+                    HttpVersion='http2',
+                    IPV6Enabled=True,
+                    PriceClass='PriceClass_100',
+                    Origins=[
+                        Origin(
+                            DomainName=GetAtt(s3bucket, 'RegionalDomainName'),
+                            Id='S3Origin',
+                            S3OriginConfig=S3OriginConfig(
+                                OriginAccessIdentity=Join('', [
+                                    'origin-access-identity/cloudfront/',
+                                    Ref(cloudfront_oai)
+                                ])
+                            )
+                        )
+                    ],
+                    Enabled=True
+                )
+            )
+        )
+
+        t.add_output(
+            Output(
+                'IndexUrl',
+                Description='Package index URL for pip and poetry sources.',
+                Value=Join('', [
+                    'https://',
+                    GetAtt(cloudfront, 'DomainName'),
+                    '/',
+                    Ref(s3_bucket_secret),
+                    '/'
+                ])
+            )
+        )
+
+    #############################
+    #  Codebuild - Roles and Policies
+    #############################
+
+    codebuild_role = t.add_resource(
+        Role(
+            'CodebuildRole',
+            AssumeRolePolicyDocument=PolicyDocument(
+                Statement=[
+                    Statement(
+                        Principal=Principal('Service', ['codebuild.amazonaws.com']),
+                        Effect=Allow,
+                        Action=[AssumeRole]
+                    )
+                ]
+            ),
+            RoleName=Sub('voyc-${AppName}')
+        )
+    )
+
+    codebuild_policy = t.add_resource(
+        PolicyType(
+            'CodebuildPolicy',
+            DependsOn=[
+               'CodebuildRole',
+               'VoyclibBucket',
+            ],
+            PolicyDocument=awacs.aws.Policy(
+                Statement=[
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('logs', 'CreateLogStream'),
+                            awacs.aws.Action('logs', 'CreateLogGroup'),
+                            awacs.aws.Action('logs', 'PutLogEvents')
+                        ],
+                        Resource=[
+                            Join(
+                                ':',
+                                [
+                                    'arn:aws:logs',
+                                    region,
+                                    account_id,
+                                    'log-group',
+                                    Sub(
+                                        '/aws/codebuild/voyc-${AppName}-build'
+                                    ),
+                                    'log-stream',
+                                    '*'
+                                ]
+                            )
+                        ]
+                    ),
+                    Statement(
+                        Effect=Allow,
+                        Action=[
+                            awacs.aws.Action('s3', 'GetObject'),
+                            awacs.aws.Action('s3', 'PutObject'),
+                            awacs.aws.Action('s3', 'PutObjectAcl')
+                        ],
+                        Resource=[
+                            Join("", [GetAtt('VoyclibBucket', 'Arn'), '/*'])
+                        ]
+                    ),
+                    Statement(
+                        Effect=Allow,
+                        Action=[awacs.aws.Action('s3', 'ListBucket')],
+                        Resource=[GetAtt('VoyclibBucket', 'Arn')]
+                    )
+                ] + cache_statements
+            ),
+            PolicyName='CodebuildVoyclibPolicy',
+            Roles=[
+                Ref(codebuild_role)
             ]
-        ),
-        RoleName=Sub('voyc-${AppName}')
+        )
     )
-)
-
-codebuild_policy = t.add_resource(
-    PolicyType(
-        'CodebuildPolicy',
-        DependsOn=[
-           'CodebuildRole',
-           'VoyclibBucket',
-        ],
-        PolicyDocument=awacs.aws.Policy(
-            Statement=[
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('logs', 'CreateLogStream'),
-                        awacs.aws.Action('logs', 'CreateLogGroup'),
-                        awacs.aws.Action('logs', 'PutLogEvents')
-                    ],
-                    Resource=[
-                        Join(
-                            ':',
-                            [
-                                'arn:aws:logs',
-                                region,
-                                account_id,
-                                'log-group',
-                                Sub(
-                                    '/aws/codebuild/voyc-${AppName}-build'
-                                ),
-                                'log-stream',
-                                '*'
-                            ]
+
+    if params['batch']:
+        # CodeBuild starts the builds of a batch with this role.
+        batch_role = t.add_resource(
+            Role(
+                'CodebuildBatchRole',
+                AssumeRolePolicyDocument=PolicyDocument(
+                    Statement=[
+                        Statement(
+                            Principal=Principal(
+                                'Service', ['codebuild.amazonaws.com']
+                            ),
+                            Effect=Allow,
+                            Action=[AssumeRole]
                         )
                     ]
                 ),
-                Statement(
-                    Effect=Allow,
-                    Action=[
-                        awacs.aws.Action('s3', 'PutObject'),
-                        awacs.aws.Action('s3', 'PutObjectAcl')
-                    ],
-                    Resource=[
-                        Join("", [GetAtt('VoyclibBucket', 'Arn'), '/*'])
+                RoleName=Sub('voyc-${AppName}-batch')
+            )
+        )
+
+        t.add_resource(
+            PolicyType(
+                'CodebuildBatchPolicy',
+                PolicyDocument=awacs.aws.Policy(
+                    Statement=[
+                        Statement(
+                            Effect=Allow,
+                            Action=[
+                                awacs.aws.Action('codebuild', 'StartBuild'),
+                                awacs.aws.Action('codebuild', 'StopBuild'),
+                                awacs.aws.Action('codebuild', 'RetryBuild')
+                            ],
+                            Resource=[
+                                Join(':', [
+                                    'arn:aws:codebuild',
+                                    region,
+                                    account_id,
+                                    Sub('project/voyc-${AppName}-build')
+                                ])
+                            ]
+                        )
                     ]
-                )
-            ]
+                ),
+                PolicyName='CodebuildVoyclibBatchPolicy',
+                Roles=[
+                    Ref(batch_role)
+                ]
+            )
+        )
+
+    #############################
+    #  Codebuild
+    #############################
+
+    artifacts = Artifacts(Type='NO_ARTIFACTS')
+
+    source = Source(
+        Auth=SourceAuth(
+            Type='OAUTH'
         ),
-        PolicyName='CodebuildVoyclibPolicy',
-        Roles=[
-            Ref(codebuild_role)
-        ]
+        Location=Ref(github_location),
+        BuildSpec=Ref(buildspec_path),
+        GitCloneDepth=1,
+        ReportBuildStatus=True,
+        Type='GITHUB'
     )
-)
-
-#############################
-#  Codebuild
-#############################
-
-artifacts = Artifacts(Type='NO_ARTIFACTS')
-
-source = Source(
-    Auth=SourceAuth(
-        Type='OAUTH'
-    ),
-    Location=Ref(github_location),
-    BuildSpec=Ref(buildspec_path),
-    GitCloneDepth=1,
-    ReportBuildStatus=True,
-    Type='GITHUB'
-)
-
-environment = Environment(
-    ComputeType='BUILD_GENERAL1_SMALL',
-    Image=Ref(build_image),
-    Type='LINUX_CONTAINER',
-    EnvironmentVariables=[
-        {
-            'Name': 'SECRET',
-            'Value': Ref(s3_bucket_secret)
-        },
-        {
-            'Name': 'BUCKET',
-            'Value': Ref(s3_bucket_name)
-        }
-    ]
-)
-
-project = Project(
-    'VoyclibProject',
-    Artifacts=artifacts,
-    Description='Voyclib build project',
-    Name=Sub("voyc-${AppName}-build"),
-    Source=source,
-    SourceVersion=Ref(github_branch),
-    Environment=environment,
-    ServiceRole=Ref(codebuild_role),
-    Triggers=ProjectTriggers(
-        Webhook=True,
-        FilterGroups=[
-            [
-                WebhookFilter(
-                    Type='EVENT',
-                    Pattern='PUSH,PULL_REQUEST_MERGED'
-                ),
-                WebhookFilter(
-                    Type='HEAD_REF',
-                    Pattern=Sub('refs/heads/${GithubBranch}')
+
+    environment = Environment(
+        ComputeType='BUILD_GENERAL1_SMALL',
+        Image=Ref(build_image),
+        Type='LINUX_CONTAINER',
+        EnvironmentVariables=[
+            {
+                'Name': 'SECRET',
+                'Value': Ref(s3_bucket_secret)
+            },
+            {
+                'Name': 'BUCKET',
+                'Value': Ref(s3_bucket_name)
+            }
+        ] + (
+            # Public ACLs are blocked on the private bucket.
+            [{'Name': 'ACL', 'Value': 'private'}] if params['cdn'] else []
+        )
+    )
+
+    batch_config = None
+    if params['batch']:
+        compute_types = sorted(
+            {'BUILD_GENERAL1_SMALL'}
+            | {compute for _, compute in params['test_matrix']}
+        )
+        batch_config = ProjectBuildBatchConfig(
+            ServiceRole=GetAtt(batch_role, 'Arn'),
+            TimeoutInMins=params['batch_timeout'],
+            Restrictions=BatchRestrictions(
+                ComputeTypesAllowed=compute_types,
+                # A test build per matrix entry, and the publish build.
+                MaximumBuildsAllowed=len(params['test_matrix']) + 1
+            )
+        )
+
+    project = Project(
+        'VoyclibProject',
+        Artifacts=artifacts,
+        Description='Voyclib build project',
+        Name=Sub("voyc-${AppName}-build"),
+        Source=source,
+        SourceVersion=Ref(github_branch),
+        Environment=environment,
+        ServiceRole=Ref(codebuild_role),
+        Triggers=ProjectTriggers(
+            Webhook=True,
+            BuildType='BUILD_BATCH' if params['batch'] else 'BUILD',
+            FilterGroups=[
+                [
+                    WebhookFilter(
+                        Type='EVENT',
+                        Pattern='PUSH,PULL_REQUEST_MERGED'
+                    ),
+                    WebhookFilter(
+                        Type='HEAD_REF',
+                        Pattern=Sub('refs/heads/${GithubBranch}')
+                    )
+                ] + (
+                    [WebhookFilter(
+                        Type='FILE_PATH',
+                        Pattern=params['trigger_paths']
+                    )] if params['trigger_paths'] else []
                 )
             ]
-        ]
+        )
     )
-)
+    if cache:
+        project.Cache = cache
+    if batch_config:
+        project.BuildBatchConfig = batch_config
+
+    t.add_resource(project)
+
+    return t
 
-t.add_resource(project)
 
-with open('voyclib.json', 'w') as f:
-    f.write(t.to_json())
\ No newline at end of file
+if __name__ == '__main__':
+    with open(OUTPUT, 'w') as f:
+        f.write(build().to_json())
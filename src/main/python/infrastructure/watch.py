@@ -0,0 +1,217 @@
+"""Re-render template modules as they are edited.
+
+Keeps troposphere and awacs imported, watches this directory with inotify
+(falling back to polling off Linux) and, when a module changes, re-executes
+only the template modules whose sources include it. Each render is written
+through the compiler cache and followed by a ``diff.py`` structural diff
+against the previous output.
+
+    python watch.py
+    python watch.py voyclib --set app_name=voyclib
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+import compiler
+from diff import diff, format_diff
+
+
+WARM_MODULES = (
+    'awacs.aws',
+    'awacs.sts',
+    'troposphere',
+    'troposphere.cloudfront',
+    'troposphere.codebuild',
+    'troposphere.iam',
+    'troposphere.s3',
+)
+
+DEBOUNCE = 0.05
+POLL_INTERVAL = 0.3
+
+
+def warm():
+    import importlib
+
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+
+###########################################
+#             File events
+###########################################
+
+class Inotify(object):
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.directory = directory
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+
+    def _read(self):
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            names.add(data[offset:offset + length].rstrip(b'\0').decode())
+            offset += length
+        return names
+
+    def __iter__(self):
+        while True:
+            select.select([self.fd], [], [])
+            names = self._read()
+            # Editors save in bursts (backup, write, rename); coalesce them.
+            while select.select([self.fd], [], [], DEBOUNCE)[0]:
+                names |= self._read()
+            yield {os.path.join(self.directory, n) for n in names if n}
+
+
+class Poller(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.mtimes = self._scan()
+
+    def _scan(self):
+        return {
+            entry.path: entry.stat().st_mtime_ns
+            for entry in os.scandir(self.directory)
+            if entry.is_file()
+        }
+
+    def __iter__(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            mtimes = self._scan()
+            changed = {
+                path for path in set(mtimes) | set(self.mtimes)
+                if mtimes.get(path) != self.mtimes.get(path)
+            }
+            self.mtimes = mtimes
+            if changed:
+                yield changed
+
+
+def events(directory):
+    try:
+        return Inotify(directory)
+    except (AttributeError, OSError, TypeError):
+        return Poller(directory)
+
+
+###########################################
+#                 Watch
+###########################################
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def rebuild(module, params, out_dir, cache, previous, out=sys.stdout):
+    start = time.perf_counter()
+    output = os.path.join(out_dir, module.output)
+    try:
+        files, [status] = compiler.render_to(module, params, [out_dir])
+    except Exception:
+        traceback.print_exc()
+        return
+    compiler.record(
+        cache, module, compiler.fingerprint(module, params), files, out_dir
+    )
+    rendered = _read_json(output)
+    changed = diff(previous.get(module.name, {}), rendered)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f'{module.name}: {status} {module.output} in {elapsed:.0f} ms', file=out)
+    for line in format_diff(changed, rendered):
+        print('  ' + line, file=out)
+    previous[module.name] = rendered
+
+
+def watch(names=None, directory=compiler.HERE, out_dir=None, overrides=None,
+          out=sys.stdout):
+    out_dir = out_dir or directory
+    cache_path = os.path.join(out_dir, compiler.CACHE_FILE)
+    warm()
+
+    previous = {
+        m.name: _read_json(os.path.join(out_dir, m.output))
+        for m in compiler.select(compiler.discover(directory), names)
+    }
+    print(f'Watching {directory} ({", ".join(sorted(previous))})', file=out)
+
+    for changed in events(directory):
+        changed = {p for p in changed if p.endswith('.py')}
+        if not changed:
+            continue
+        # Sibling helper modules are imported normally; drop them so the
+        # next render picks up their new source.
+        for path in changed:
+            sys.modules.pop(os.path.basename(path)[:-3], None)
+
+        modules = compiler.select(compiler.discover(directory), names)
+        cache = compiler.load_cache(cache_path)
+        for module in modules:
+            if changed & set(module.sources):
+                rebuild(
+                    module,
+                    compiler.module_params(module, overrides),
+                    out_dir,
+                    cache,
+                    previous,
+                    out,
+                )
+        compiler.save_cache(cache_path, cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', help='Template modules to watch.')
+    parser.add_argument(
+        '--out-dir', help='Output directory (default: alongside sources).'
+    )
+    parser.add_argument(
+        '--set',
+        dest='overrides',
+        action='append',
+        metavar='KEY=VALUE',
+        help='Override a template default, eg: app_name=voyclib',
+    )
+    args = parser.parse_args(argv)
+    try:
+        overrides = compiler.parse_overrides(args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        watch(args.modules, out_dir=args.out_dir, overrides=overrides)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
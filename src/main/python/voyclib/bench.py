@@ -0,0 +1,288 @@
+"""Benchmarks for voyclib against local stand-ins of its backends.
+
+``bulk`` loads the same generated rows into a scratch PostgreSQL table with
+``executemany`` and with ``voyclib.bulk.copy_rows``, then reads them back
+with ``fetchall`` and with ``voyclib.bulk.iter_rows``, reporting time,
+rows per second and the peak Python memory of each. Memory is traced
+(``tracemalloc``) in a second, untimed run, since tracing slows Python code.
+
+    python bench.py bulk --dsn 'host=127.0.0.1 port=5432 user=postgres'
+    python bench.py bulk --rows 1000000 --skip executemany
+
+``s3`` uploads, lists and downloads a tree of small objects and one large
+object, serially with plain boto3 calls and with ``voyclib.s3``. It runs
+against moto in process unless ``--endpoint-url`` names a local S3 stand-in
+(eg: ``moto_server``); ``--latency`` adds a delay to every request, as a
+stand-in for the round trip to S3 that local servers do not have.
+
+    python bench.py s3 --objects 2000 --latency 20
+    python bench.py s3 --endpoint-url http://localhost:5000
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from voyclib import aws, bulk, s3
+
+
+TABLE = 'voyclib_bench_bulk'
+
+
+def _measure(func, setup=None):
+    """``(seconds, peak bytes, result)`` of ``func()``, run twice: timed,
+    then with ``tracemalloc``. ``setup()`` runs before each run."""
+    if setup:
+        setup()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+###########################################
+#               bulk
+###########################################
+
+def generate(count):
+    base = datetime.datetime(2021, 1, 1)
+    for i in range(count):
+        yield (
+            i,
+            'event %d\twith a tab' % i,
+            base + datetime.timedelta(seconds=i),
+            None if i % 7 else i * 0.5,
+        )
+
+
+def bench_bulk(conn, rows, skip=(), batch_size=bulk.BATCH_SIZE, out=sys.stdout):
+    """Run each case and return ``{case: (seconds, peak bytes, rows)}``."""
+    with conn.cursor() as cur:
+        cur.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS %s '
+            '(id bigint, name text, created timestamp, score double precision)'
+            % TABLE
+        )
+
+    def truncate():
+        with conn.cursor() as cur:
+            cur.execute('TRUNCATE %s' % TABLE)
+
+    def executemany():
+        with conn.cursor() as cur:
+            cur.executemany(
+                'INSERT INTO %s VALUES (%%s, %%s, %%s, %%s)' % TABLE,
+                generate(rows),
+            )
+        return rows
+
+    def copy():
+        return bulk.copy_rows(conn, TABLE, generate(rows))
+
+    def fetchall():
+        with conn.cursor() as cur:
+            cur.execute('SELECT * FROM %s' % TABLE)
+            return len(cur.fetchall())
+
+    def iterate():
+        return sum(1 for _ in bulk.iter_rows(
+            conn, 'SELECT * FROM %s' % TABLE, batch_size=batch_size
+        ))
+
+    results = OrderedDict()
+    for name, func in [
+        ('executemany', executemany),
+        ('copy_rows', copy),
+        ('fetchall', fetchall),
+        ('iter_rows', iterate),
+    ]:
+        if name in skip:
+            continue
+        loads = name in ('executemany', 'copy_rows')
+        seconds, peak, count = _measure(func, truncate if loads else None)
+        conn.commit()
+        results[name] = (seconds, peak, count)
+        print(
+            f'{name:<12}{count:>10} rows{seconds:9.2f}s'
+            f'{count / seconds:>12,.0f} rows/s{peak / 1024 / 1024:9.1f} MiB peak',
+            file=out,
+        )
+    return results
+
+
+###########################################
+#               s3
+###########################################
+
+def _timed(name, count, func, out):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print(f'{name:<22}{count:>8} objects{seconds:9.2f}s'
+          f'{count / seconds:>10,.0f} objects/s', file=out)
+    return seconds
+
+
+def make_tree(directory, objects, size, large_size):
+    """``objects`` files of ``size`` bytes spread over two levels of
+    directories, and one file of ``large_size`` bytes."""
+    data = os.urandom(size)
+    for i in range(objects):
+        path = os.path.join(directory, 'tree', 'p%02d' % (i % 16),
+                            'q%02d' % (i // 16 % 8), '%06d.bin' % i)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    with open(os.path.join(directory, 'large.bin'), 'wb') as f:
+        for _ in range(large_size // s3.MB):
+            f.write(os.urandom(s3.MB))
+
+
+def bench_s3(client, bucket, objects=1000, size=1024, large_size=64 * s3.MB,
+             workers=16, out=sys.stdout):
+    """Time serial boto3 calls against ``voyclib.s3`` on ``bucket``."""
+    scratch = tempfile.mkdtemp()
+    try:
+        source = os.path.join(scratch, 'source')
+        make_tree(source, objects, size, large_size)
+        files = list(s3.walk(os.path.join(source, 'tree'), 'serial/'))
+
+        def serial_upload():
+            for path, key in files:
+                client.upload_file(path, bucket, key)
+
+        def serial_list():
+            paginator = client.get_paginator('list_objects_v2')
+            return sum(
+                len(page.get('Contents', []))
+                for page in paginator.paginate(Bucket=bucket, Prefix='serial/')
+            )
+
+        def serial_download():
+            target = os.path.join(scratch, 'serial')
+            for path, key in files:
+                path = s3.local_path(target, key, 'serial/')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                client.download_file(bucket, key, path)
+
+        large = os.path.join(source, 'large.bin')
+        _timed('upload serial', objects, serial_upload, out)
+        with s3.Transfers(client, max_concurrency=workers) as transfers:
+            _timed('upload voyclib', objects, lambda: list(transfers.upload(
+                bucket, s3.walk(os.path.join(source, 'tree'), 'parallel/')
+            )), out)
+            _timed('list serial', objects, serial_list, out)
+            _timed('list voyclib', objects, lambda: list(s3.iter_objects(
+                bucket, 'parallel/', max_workers=workers, client=client
+            )), out)
+            _timed('download serial', objects, serial_download, out)
+            _timed('download voyclib', objects, lambda: list(transfers.download(
+                bucket,
+                s3.iter_objects(bucket, 'parallel/', max_workers=workers,
+                                client=client),
+                os.path.join(scratch, 'parallel'),
+                prefix='parallel/',
+            )), out)
+
+            client.put_object(Bucket=bucket, Key='large.bin',
+                              Body=open(large, 'rb'))
+            _timed('large get_object', 1, lambda: shutil.copyfileobj(
+                client.get_object(Bucket=bucket, Key='large.bin')['Body'],
+                open(os.path.join(scratch, 'large-serial.bin'), 'wb'),
+            ), out)
+            _timed('large ranged GETs', 1, lambda: list(transfers.download(
+                bucket, ['large.bin'], os.path.join(scratch, 'ranged'),
+            )), out)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def add_latency(client, seconds):
+    """Sleep ``seconds`` before each request ``client`` sends."""
+    client.meta.events.register_first(
+        'before-send', lambda **kwargs: time.sleep(seconds)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    bulk_parser = sub.add_parser('bulk', help='COPY and server-side cursors.')
+    bulk_parser.add_argument(
+        '--dsn',
+        default='host=127.0.0.1 port=5432 user=postgres dbname=postgres',
+        help='libpq connection string of a scratch database.',
+    )
+    bulk_parser.add_argument('--rows', type=int, default=200000)
+    bulk_parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE)
+    bulk_parser.add_argument(
+        '--skip',
+        action='append',
+        default=[],
+        choices=['executemany', 'copy_rows', 'fetchall', 'iter_rows'],
+    )
+
+    s3_parser = sub.add_parser('s3', help='Concurrent listing and transfers.')
+    s3_parser.add_argument(
+        '--endpoint-url', help='A local S3 stand-in; moto in process if unset.'
+    )
+    s3_parser.add_argument('--bucket', default='voyclib-bench')
+    s3_parser.add_argument('--objects', type=int, default=1000)
+    s3_parser.add_argument('--size', type=int, default=1024, help='Bytes.')
+    s3_parser.add_argument('--large-mb', type=int, default=64)
+    s3_parser.add_argument('--workers', type=int, default=16)
+    s3_parser.add_argument(
+        '--latency', type=float, default=0, help='Milliseconds per request.'
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == 's3':
+        mock = None
+        if not args.endpoint_url:
+            from moto import mock_aws
+
+            for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+                os.environ.setdefault(name, 'testing')
+            mock = mock_aws()
+            mock.start()
+        try:
+            client = aws.ClientFactory(max_pool_connections=args.workers).client(
+                's3', region='us-east-1', endpoint_url=args.endpoint_url
+            )
+            if args.latency:
+                add_latency(client, args.latency / 1000.0)
+            client.create_bucket(Bucket=args.bucket)
+            bench_s3(client, args.bucket, args.objects, args.size,
+                     args.large_mb * s3.MB, args.workers)
+        finally:
+            if mock is not None:
+                mock.stop()
+        return
+
+    import psycopg2
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        bench_bulk(conn, args.rows, args.skip, args.batch_size)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
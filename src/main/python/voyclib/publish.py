@@ -0,0 +1,362 @@
+"""Build voyclib and publish it to the S3 package index.
+
+The sdist and wheel are built once into a scratch directory and hashed, then
+compared with the package's index page (``<secret>/<package>/``, the layout
+s3pypi used). Only files that are not published yet are uploaded, in
+parallel and with multipart transfers for large files, and only index pages
+whose contents change are rewritten (see ``pypi_index.py``). Files are never
+overwritten in place: a rebuilt file whose hash differs from the published
+one is reported and skipped, and the run fails, unless ``--force`` is given.
+
+Once a source tree is published, a marker named after the hash of its
+sources (the package, ``setup.py``, ``pyproject.toml`` and the README) is
+stored under ``<secret>/.published/``. ``--check`` exits 0 when the marker
+for the current tree exists, so the build can skip commits that did not
+change what is published; a publish run with the same sources stops there
+too.
+
+    python publish.py --bucket $BUCKET --secret $SECRET
+    python publish.py --check && echo already published
+    python publish.py --bucket voyclib --endpoint-url http://localhost:5000
+    python publish.py --dry-run
+
+``--bucket``, ``--secret`` and ``--acl`` default to the ``BUCKET``,
+``SECRET`` and ``ACL`` environment variables set on the CodeBuild project.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tarfile
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+
+import pypi_index
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TRANSFER = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+)
+
+# What the published files are built from; see source_hash.
+SOURCES = ('voyclib', 'setup.py', 'pyproject.toml', 'README.rst')
+MARKERS = '.published'
+
+POETRY_VERSION = re.compile(r'^\[tool\.poetry\][^\[]*?^version\s*=\s*"([^"]+)"',
+                            re.MULTILINE | re.DOTALL)
+
+
+###########################################
+#               Building
+###########################################
+
+def _setup(*args, project_dir=HERE, env=None):
+    return subprocess.run(
+        [sys.executable, 'setup.py'] + list(args),
+        cwd=project_dir,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.strip()
+
+
+def check_version(project_dir=HERE):
+    """Fail if setup.py has drifted from pyproject.toml.
+
+    setup.py is generated from pyproject.toml with ``dephell deps convert``;
+    the build no longer regenerates it, so a stale one must not be published.
+    Returns ``(name, version)``.
+    """
+    name, version = _setup('--name', '--version', project_dir=project_dir).split()
+    with open(os.path.join(project_dir, 'pyproject.toml')) as f:
+        match = POETRY_VERSION.search(f.read())
+    if match and match.group(1) != version:
+        raise ValueError(
+            'setup.py is at version %s but pyproject.toml is at %s; '
+            'regenerate it with `dephell deps convert`' % (version, match.group(1))
+        )
+    return name, version
+
+
+def source_date_epoch(project_dir=HERE):
+    """Last commit touching the project, so an unchanged tree rebuilds the
+    same wheel."""
+    try:
+        return subprocess.run(
+            ['git', 'log', '-1', '--format=%ct', '--', '.'],
+            cwd=project_dir,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def source_hash(project_dir=HERE, sources=SOURCES):
+    """sha256 over the relative paths and contents of ``sources``.
+
+    Bytecode and build leftovers are ignored, so a clean checkout and a
+    working tree hash the same.
+    """
+    paths = []
+    for source in sources:
+        path = os.path.join(project_dir, source)
+        if os.path.isfile(path):
+            paths.append(path)
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(
+                d for d in dirs
+                if d != '__pycache__' and not d.endswith('.egg-info')
+            )
+            paths.extend(
+                os.path.join(root, n) for n in names
+                if not n.endswith(('.pyc', '.pyo'))
+            )
+
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        name = os.path.relpath(path, project_dir).replace(os.sep, '/')
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest.update(b'%s\0%d\0' % (name.encode('utf-8'), len(content)))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def reproducible_sdist(path, epoch):
+    """Rewrite an sdist with fixed timestamps and owners.
+
+    setuptools stamps the tarball and its gzip header with the build time, so
+    without this every build would produce a "new" sdist.
+    """
+    with tarfile.open(path) as source:
+        members = [
+            (member, source.extractfile(member) if member.isfile() else None)
+            for member in sorted(source.getmembers(), key=lambda m: m.name)
+        ]
+        with open(path + '.tmp', 'wb') as raw, \
+                gzip.GzipFile('', 'wb', fileobj=raw, mtime=0) as gz, \
+                tarfile.open(fileobj=gz, mode='w', format=tarfile.PAX_FORMAT) as tar:
+            for member, data in members:
+                member.mtime = min(member.mtime, epoch)
+                member.uid = member.gid = 0
+                member.uname = member.gname = ''
+                member.pax_headers = {}
+                tar.addfile(member, data)
+    os.replace(path + '.tmp', path)
+
+
+def build(dist_dir, project_dir=HERE):
+    """Build the sdist and wheel into ``dist_dir``; returns ``{filename: path}``."""
+    env = dict(os.environ)
+    epoch = source_date_epoch(project_dir)
+    if epoch:
+        env.setdefault('SOURCE_DATE_EPOCH', epoch)
+    _setup(
+        '-q',
+        'build', '--build-base', os.path.join(dist_dir, 'build'),
+        'sdist', '--formats=gztar', '--dist-dir', dist_dir,
+        'bdist_wheel', '--dist-dir', dist_dir,
+        project_dir=project_dir,
+        env=env,
+    )
+    dists = OrderedDict(
+        (name, os.path.join(dist_dir, name))
+        for name in sorted(os.listdir(dist_dir))
+        if name.endswith(('.whl', '.tar.gz'))
+    )
+    if epoch:
+        for name, path in dists.items():
+            if name.endswith('.tar.gz'):
+                reproducible_sdist(path, int(epoch))
+    return dists
+
+
+###########################################
+#               Publishing
+###########################################
+
+class Publisher(object):
+
+    def __init__(self, bucket, secret=None, client=None, region=None,
+                 endpoint_url=None, acl='public-read', workers=4):
+        self.index = pypi_index.S3Target(
+            bucket,
+            secret or '',
+            client=client,
+            region=region,
+            endpoint_url=endpoint_url,
+            acl=acl,
+        )
+        self.workers = workers
+
+    def _marker(self, digest):
+        return '%s/%s' % (MARKERS, digest)
+
+    def is_published(self, digest):
+        """Whether sources hashing to ``digest`` have been published."""
+        return self.index.read(self._marker(digest)) is not None
+
+    def mark_published(self, digest, results):
+        self.index.put(self._marker(digest), json.dumps(
+            OrderedDict(sorted(results.items())), indent=2
+        ).encode('utf-8'))
+
+    def upload(self, key, path):
+        index = self.index
+        index.client.upload_file(
+            path,
+            index.bucket,
+            index.prefix + key,
+            ExtraArgs=pypi_index.object_args(key, index.acl),
+            Config=TRANSFER,
+        )
+
+    def publish(self, project, dists, force=False, dry_run=False, out=sys.stdout):
+        """Upload the files in ``dists`` (``{filename: path}``) not yet published.
+
+        Returns ``{filename: status}`` with status ``uploaded``, ``unchanged``
+        or ``conflict`` (published with different contents; kept as is), or
+        ``planned`` instead of ``uploaded`` on a dry run.
+        """
+        name = pypi_index.normalize(project)
+        digests = self.index.digests()
+        published = {
+            d.filename: d for d in pypi_index.load_project(self.index, name)
+        }
+
+        results, pending, listed, metadata = OrderedDict(), [], [], {}
+        for filename, path in dists.items():
+            with open(path, 'rb') as f:
+                dist, metadata[filename] = pypi_index.inspect(filename, f.read())
+            old = published.get(filename)
+            if old and old.sha256 not in (None, dist.sha256) and not force:
+                results[filename] = 'conflict'
+                print(
+                    f'{filename} is already published with sha256 {old.sha256}; '
+                    f'bump the version to publish changes',
+                    file=out,
+                )
+                continue
+            listed.append(dist)
+            if old and old.sha256 in (None, dist.sha256):
+                results[filename] = 'unchanged'
+            else:
+                pending.append(filename)
+                results[filename] = 'planned' if dry_run else 'uploaded'
+        if dry_run:
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(
+                lambda filename: self.upload(
+                    '%s/%s' % (name, filename), dists[filename]
+                ),
+                pending,
+            ))
+        # Metadata for new files, and for published ones that lack it.
+        for dist in listed:
+            key = '%s/%s.metadata' % (name, dist.filename)
+            if metadata[dist.filename] and (
+                dist.filename in pending or key not in digests
+            ):
+                self.index.put(key, metadata[dist.filename])
+        # Pages go last, so they never list a file that is not there yet.
+        pypi_index.update(self.index, name, listed, digests)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bucket', default=os.environ.get('BUCKET'))
+    parser.add_argument(
+        '--secret',
+        default=os.environ.get('SECRET'),
+        help='Key prefix of the index within the bucket.',
+    )
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url',
+        default=os.environ.get('AWS_ENDPOINT_URL_S3'),
+        help='S3 endpoint, eg: a local moto server. Defaults to '
+        '$AWS_ENDPOINT_URL_S3, which boto3 before 1.28 ignores.',
+    )
+    parser.add_argument(
+        '--acl',
+        default=os.environ.get('ACL', 'public-read'),
+        help="Canned ACL for uploaded objects; '' for none. Defaults to $ACL.",
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Overwrite published files whose contents differ.',
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true', help='Build and compare only.'
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Exit 0 if these sources are already published, 1 if not.',
+    )
+    args = parser.parse_args(argv)
+    if not args.bucket:
+        parser.error('--bucket or $BUCKET is required')
+
+    publisher = Publisher(
+        args.bucket,
+        args.secret,
+        region=args.region,
+        endpoint_url=args.endpoint_url,
+        acl=args.acl,
+        workers=args.workers,
+    )
+    digest = source_hash()
+    published = publisher.is_published(digest)
+    if published:
+        print(f'Sources {digest[:12]} are already published', file=sys.stderr)
+    if args.check:
+        sys.exit(0 if published else 1)
+    if published and not args.force:
+        return
+
+    try:
+        project, version = check_version()
+    except ValueError as e:
+        sys.exit(str(e))
+
+    with tempfile.TemporaryDirectory() as dist_dir:
+        dists = build(dist_dir)
+        results = publisher.publish(
+            project, dists, force=args.force, dry_run=args.dry_run
+        )
+
+    for name, status in results.items():
+        print(f'{status:>9}  {name}')
+    conflicts = sum(status == 'conflict' for status in results.values())
+    if conflicts:
+        sys.exit(
+            f'{conflicts} file(s) were published with different contents; '
+            'bump the version, or overwrite them with --force'
+        )
+    if not args.dry_run:
+        publisher.mark_published(digest, results)
+
+
+if __name__ == '__main__':
+    main()
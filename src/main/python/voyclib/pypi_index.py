@@ -0,0 +1,471 @@
+"""PEP 503 / PEP 691 "simple" index pages for the voyclib package bucket.
+
+Each project gets an ``index.html`` (PEP 503) and an ``index.json``
+(PEP 691) listing its files with ``#sha256=`` hashes and
+``data-requires-python``. Wheels also get their ``METADATA`` published
+beside them as ``<wheel>.metadata`` (PEP 658/714), so pip and poetry can
+resolve dependencies without downloading whole wheels. The root of the index
+lists the projects in both formats.
+
+Pages are only written when their contents change. The bucket is listed
+once and each rendered page is compared with the listed ETag (the MD5 of a
+single-part upload), so an update touches only the pages that differ.
+
+    python pypi_index.py --bucket $BUCKET --secret $SECRET
+    python pypi_index.py --directory ./simple
+    python pypi_index.py --bucket voyclib --endpoint-url http://localhost:5000
+
+From the command line it rebuilds every page from the files present,
+reading only files whose hash no existing page records. ``publish.py`` calls
+``update`` for the project it has just uploaded.
+"""
+import argparse
+import hashlib
+import html
+import io
+import json
+import os
+import posixpath
+import re
+import tarfile
+import zipfile
+from collections import OrderedDict, namedtuple
+from email.parser import HeaderParser
+from html.parser import HTMLParser
+from urllib.parse import quote, unquote
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+API_VERSION = '1.0'
+DIST_SUFFIXES = ('.whl', '.tar.gz', '.zip')
+
+CONTENT_TYPES = {
+    '.json': 'application/vnd.pypi.simple.v1+json',
+    '.html': 'text/html',
+    '.metadata': 'text/plain',
+    '.whl': 'application/zip',
+    '.tar.gz': 'application/gzip',
+    '.zip': 'application/zip',
+}
+PAGE_CACHE_CONTROL = 'public, must-revalidate, proxy-revalidate, max-age=0'
+# Published files are never overwritten, so they can be cached forever.
+FILE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+Dist = namedtuple(
+    'Dist', ['filename', 'sha256', 'requires_python', 'metadata_sha256']
+)
+
+
+def normalize(name):
+    """PEP 503 project name normalisation."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def content_type(key):
+    for suffix, kind in CONTENT_TYPES.items():
+        if key.endswith(suffix):
+            return kind
+    return 'application/octet-stream'
+
+
+def object_args(key, acl=None):
+    """``put_object`` headers for an index page or published file."""
+    if key == '' or key.endswith('/'):
+        # The directory alias of an index.html page.
+        key += 'index.html'
+    args = {'ContentType': content_type(key)}
+    if key.endswith(('index.html', 'index.json')):
+        args['CacheControl'] = PAGE_CACHE_CONTROL
+    else:
+        args['CacheControl'] = FILE_CACHE_CONTROL
+    if acl:
+        args['ACL'] = acl
+    return args
+
+
+###########################################
+#          Distribution metadata
+###########################################
+
+def core_metadata(filename, data):
+    """The core metadata file of a wheel or sdist, or None."""
+    if filename.endswith('.whl'):
+        with zipfile.ZipFile(io.BytesIO(data)) as whl:
+            for name in whl.namelist():
+                if re.match(r'^[^/]+\.dist-info/METADATA$', name):
+                    return whl.read(name)
+    elif filename.endswith('.tar.gz'):
+        with tarfile.open(fileobj=io.BytesIO(data)) as sdist:
+            for member in sdist.getmembers():
+                if re.match(r'^[^/]+/PKG-INFO$', member.name):
+                    return sdist.extractfile(member).read()
+    return None
+
+
+def inspect(filename, data):
+    """Describe a distribution file. Returns ``(Dist, metadata or None)``.
+
+    Only a wheel's metadata is published (PEP 658); sdist metadata is read
+    for ``Requires-Python`` alone.
+    """
+    metadata = core_metadata(filename, data)
+    requires_python = None
+    if metadata:
+        headers = HeaderParser().parsestr(metadata.decode('utf-8', 'replace'))
+        requires_python = headers.get('Requires-Python') or None
+    if not filename.endswith('.whl'):
+        metadata = None
+    dist = Dist(
+        filename,
+        hashlib.sha256(data).hexdigest(),
+        requires_python,
+        hashlib.sha256(metadata).hexdigest() if metadata else None,
+    )
+    return dist, metadata
+
+
+###########################################
+#               Rendering
+###########################################
+
+def _html(title, links):
+    return (
+        '<!DOCTYPE html>\n<html>\n<head>\n'
+        '    <meta charset="UTF-8">\n'
+        '    <meta name="pypi:repository-version" content="%s">\n'
+        '    <title>%s</title>\n'
+        '</head>\n<body>\n%s</body>\n</html>\n'
+        % (API_VERSION, html.escape(title), ''.join(links))
+    ).encode('utf-8')
+
+
+def _json(document):
+    document = OrderedDict([('meta', {'api-version': API_VERSION})], **document)
+    return (json.dumps(document, indent=2) + '\n').encode('utf-8')
+
+
+def project_pages(project, dists):
+    """``{'index.html': bytes, 'index.json': bytes}`` for one project."""
+    dists = sorted(dists, key=lambda d: d.filename)
+    links, files = [], []
+    for d in dists:
+        attrs = ''
+        if d.requires_python:
+            attrs += ' data-requires-python="%s"' % html.escape(d.requires_python)
+        if d.metadata_sha256:
+            attrs += (
+                ' data-dist-info-metadata="sha256={0}"'
+                ' data-core-metadata="sha256={0}"'.format(d.metadata_sha256)
+            )
+        fragment = '#sha256=%s' % d.sha256 if d.sha256 else ''
+        links.append('    <a href="%s%s"%s>%s</a><br>\n' % (
+            quote(d.filename), fragment, attrs, html.escape(d.filename)
+        ))
+
+        entry = OrderedDict([
+            ('filename', d.filename),
+            ('url', quote(d.filename)),
+            ('hashes', {'sha256': d.sha256} if d.sha256 else {}),
+        ])
+        if d.requires_python:
+            entry['requires-python'] = d.requires_python
+        if d.metadata_sha256:
+            entry['core-metadata'] = {'sha256': d.metadata_sha256}
+            entry['dist-info-metadata'] = {'sha256': d.metadata_sha256}
+        files.append(entry)
+
+    name = normalize(project)
+    return OrderedDict([
+        ('index.html', _html('Links for %s' % name, links)),
+        ('index.json', _json(OrderedDict([('name', name), ('files', files)]))),
+    ])
+
+
+def root_pages(projects):
+    names = sorted({normalize(p) for p in projects})
+    links = [
+        '    <a href="%s/">%s</a><br>\n' % (quote(n), html.escape(n)) for n in names
+    ]
+    return OrderedDict([
+        ('index.html', _html('Simple index', links)),
+        ('index.json', _json({'projects': [{'name': n} for n in names]})),
+    ])
+
+
+###########################################
+#               Parsing
+###########################################
+
+class _Links(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.dists = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag != 'a' or not attrs.get('href'):
+            return
+        href, _, fragment = attrs['href'].partition('#')
+        digest = fragment[len('sha256='):] if fragment.startswith('sha256=') else None
+        metadata = attrs.get('data-core-metadata') or attrs.get(
+            'data-dist-info-metadata'
+        )
+        if not (metadata or '').startswith('sha256='):
+            metadata = None
+        self.dists.append(Dist(
+            posixpath.basename(unquote(href)),
+            digest,
+            attrs.get('data-requires-python'),
+            metadata[len('sha256='):] if metadata else None,
+        ))
+
+
+def parse_project(body, key):
+    """Dists listed on a project page, in either format."""
+    text = body.decode('utf-8')
+    if key.endswith('.json'):
+        return [
+            Dist(
+                f['filename'],
+                f.get('hashes', {}).get('sha256'),
+                f.get('requires-python'),
+                (f.get('core-metadata') or {}).get('sha256'),
+            )
+            for f in json.loads(text)['files']
+        ]
+    parser = _Links()
+    parser.feed(text)
+    return parser.dists
+
+
+###########################################
+#               Targets
+###########################################
+
+class S3Target(object):
+    """Index pages and files under ``<prefix>/`` in a bucket.
+
+    Each ``index.html`` is also stored under its directory key (eg:
+    ``<prefix>/voyclib/``). The S3 website endpoint resolves index documents
+    itself, but CloudFront in front of a private bucket passes
+    ``/<prefix>/voyclib/`` through to S3 as that literal key.
+    """
+
+    def __init__(self, bucket, prefix='', client=None, region=None,
+                 endpoint_url=None, acl='public-read'):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = client or boto3.client(
+            's3', region_name=region, endpoint_url=endpoint_url
+        )
+        self.acl = acl
+
+    def digests(self):
+        """``{relative key: md5 hex}`` for every object, from one listing."""
+        digests = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                key = obj['Key'][len(self.prefix):]
+                digests[key] = obj['ETag'].strip('"')
+        return digests
+
+    def read(self, key):
+        try:
+            return self.client.get_object(
+                Bucket=self.bucket, Key=self.prefix + key
+            )['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def aliases(self, key):
+        if key == 'index.html' or key.endswith('/index.html'):
+            directory = key[:-len('index.html')]
+            if self.prefix or directory:
+                return [directory]
+        return []
+
+    def put(self, key, body):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=body,
+            **object_args(key, self.acl)
+        )
+
+
+class DirectoryTarget(object):
+    """The same layout in a local directory, eg: for ``pip --index-url file:``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def digests(self):
+        digests = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    digests[key] = hashlib.md5(f.read()).hexdigest()
+        return digests
+
+    def aliases(self, key):
+        return []
+
+    def read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, body):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+
+
+###########################################
+#               Updating
+###########################################
+
+def load_project(target, project):
+    """Dists on a project's current pages; the JSON page is preferred."""
+    name = normalize(project)
+    for page in ('index.json', 'index.html'):
+        body = target.read('%s/%s' % (name, page))
+        if body is not None:
+            return parse_project(body, page)
+    return []
+
+
+def write_changed(target, pages, digests):
+    """Write each ``{key: body}`` whose MD5 differs from ``digests``."""
+    written = []
+    for key, body in pages.items():
+        md5 = hashlib.md5(body).hexdigest()
+        for name in [key] + target.aliases(key):
+            if digests.get(name) != md5:
+                target.put(name, body)
+                written.append(name)
+    return written
+
+
+def _projects(digests):
+    return {
+        key.split('/')[0] for key in digests
+        if key.count('/') == 1 and key.endswith(('/index.html', '/index.json'))
+    }
+
+
+def update(target, project, dists, digests=None):
+    """Add or replace ``dists`` on a project's pages and refresh the root.
+
+    Files already listed keep their entries unless replaced. Returns the
+    keys written.
+    """
+    return update_projects(target, {project: dists}, digests)
+
+
+def update_projects(target, projects, digests=None):
+    """``update`` for several ``{project: dists}`` at once, writing the root
+    pages a single time."""
+    digests = target.digests() if digests is None else digests
+    pages = OrderedDict()
+    for project, dists in projects.items():
+        name = normalize(project)
+        merged = OrderedDict((d.filename, d) for d in load_project(target, name))
+        for d in dists:
+            merged[d.filename] = d
+        for page, body in project_pages(name, merged.values()).items():
+            pages['%s/%s' % (name, page)] = body
+    pages.update(root_pages(_projects(digests) | {normalize(p) for p in projects}))
+    return write_changed(target, pages, digests)
+
+
+def reindex(target):
+    """Rebuild every page from the distribution files present.
+
+    Files whose hash is already on a project page are not read; others are
+    downloaded once to hash them and read their metadata. Returns the keys
+    written.
+    """
+    digests = target.digests()
+    found = OrderedDict()
+    for key in sorted(digests):
+        project, _, filename = key.partition('/')
+        if '/' in filename or not filename.endswith(DIST_SUFFIXES):
+            continue
+        found.setdefault(project, []).append(filename)
+
+    pages = OrderedDict()
+    for project, filenames in found.items():
+        known = {
+            d.filename: d for d in load_project(target, project)
+            if d.sha256 and (d.metadata_sha256 or not d.filename.endswith('.whl'))
+        }
+        dists = []
+        for filename in filenames:
+            if filename in known:
+                dists.append(known[filename])
+                continue
+            dist, metadata = inspect(
+                filename, target.read('%s/%s' % (project, filename))
+            )
+            if metadata is not None:
+                pages['%s/%s.metadata' % (project, filename)] = metadata
+            dists.append(dist)
+        for page, body in project_pages(project, dists).items():
+            pages['%s/%s' % (project, page)] = body
+    pages.update(root_pages(found))
+    return write_changed(target, pages, digests)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--bucket')
+    where.add_argument('--directory', help='Local index root.')
+    parser.add_argument(
+        '--secret', default='', help='Key prefix of the index within the bucket.'
+    )
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url', help='S3 endpoint, eg: a local moto server.'
+    )
+    parser.add_argument(
+        '--acl',
+        default='public-read',
+        help="Canned ACL for written objects; '' for none.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.bucket:
+        target = S3Target(
+            args.bucket,
+            args.secret,
+            region=args.region,
+            endpoint_url=args.endpoint_url,
+            acl=args.acl,
+        )
+    else:
+        target = DirectoryTarget(args.directory)
+    written = reindex(target)
+    for key in written:
+        print(f'  wrote  {key}')
+    print(f'{len(written)} objects written')
+
+
+if __name__ == '__main__':
+    main()
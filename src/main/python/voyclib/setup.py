@@ -1,3 +1,4 @@
+
 # -*- coding: utf-8 -*-
 
 # DO NOT EDIT THIS FILE!
@@ -9,6 +10,7 @@ try:
 except ImportError:
     from distutils.core import setup
 
+
 import os.path
 
 readme = ''
@@ -18,10 +20,11 @@ if os.path.exists(readme_path):
     with open(readme_path, 'rb') as stream:
         readme = stream.read().decode('utf8')
 
+
 setup(
     long_description=readme,
     name='voyclib',
-    version='0.0.1',
+    version='0.5.0',
     description='Voyc common library.',
     python_requires='>=3.8',
     author='admin@voyc.ai',
@@ -30,5 +33,5 @@ setup(
     package_dir={"": "."},
     package_data={},
     install_requires=['troposphere==2.*,>=2.6.3'],
-    extras_require={"dev": ["pytest==3.*,>=3.8.0"]},
+    extras_require={"aws": ["boto3==1.*,>=1.16.0"], "db": ["psycopg2==2.*,>=2.8.6", "sshtunnel==0.*,>=0.1.5"], "dev": ["moto==5.*,>=5.0.0", "pytest==6.*,>=6.2.0"]},
 )
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture
+def mock_aws(monkeypatch):
+    """AWS mocked by moto in process, with test credentials and region."""
+    moto = pytest.importorskip('moto')
+    for name in ('AWS_PROFILE', 'AWS_CONFIG_FILE', 'AWS_SHARED_CREDENTIALS_FILE'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        yield
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from voyclib import aws
+
+
+ROLE = 'arn:aws:iam::123456789012:role/docs'
+
+
+def in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@pytest.fixture
+def factory(mock_aws):
+    return aws.ClientFactory()
+
+
+def test_clients_are_cached_per_thread(factory):
+    s3 = factory.client('s3')
+    assert factory.client('s3') is s3
+    assert factory.client('s3', region='eu-west-1') is not s3
+    assert factory.client('sts') is not s3
+
+    other = in_thread(lambda: factory.client('s3'))
+    assert other is not s3
+    # Clients of all threads share one session, and its loaded models.
+    assert factory.session() is in_thread(factory.session)
+
+    factory.clear()
+    assert factory.client('s3') is not s3
+
+
+def test_config_is_merged(mock_aws):
+    factory = aws.ClientFactory(max_pool_connections=7, max_attempts=3)
+    s3 = factory.client('s3', s3={'addressing_style': 'path'}, connect_timeout=5)
+    config = s3.meta.config
+    assert config.max_pool_connections == 7
+    assert config.retries['mode'] == 'adaptive'
+    # Newer botocore keeps total_max_attempts, which counts the first one.
+    assert config.retries.get('total_max_attempts',
+                              config.retries.get('max_attempts', 0) + 1) == 4
+    assert config.s3 == {'addressing_style': 'path'}
+    assert config.connect_timeout == 5
+
+    default = factory.client('s3').meta.config
+    assert default.max_pool_connections == 7
+    assert default.s3 is None
+    assert factory.client(
+        's3', connect_timeout=5, s3={'addressing_style': 'path'}
+    ) is s3
+
+
+def test_role_is_assumed_once(factory):
+    calls = []
+    factory.client('sts').meta.events.register(
+        'before-parameter-build.sts.AssumeRole',
+        lambda **kwargs: calls.append(kwargs),
+    )
+
+    def list_buckets():
+        s3 = factory.client('s3', role=ROLE)
+        s3.list_buckets()
+        return s3
+
+    clients = [list_buckets(), in_thread(list_buckets), in_thread(list_buckets)]
+    assert len(set(map(id, clients))) == 3
+    assert len(calls) == 1
+    assert calls[0]['params']['RoleArn'] == ROLE
+
+    credentials = factory.session(ROLE).get_credentials().get_frozen_credentials()
+    assert credentials.token
+    assert credentials.access_key != factory.session().get_credentials().access_key
+
+
+def test_module_client_uses_the_configured_factory(mock_aws, monkeypatch):
+    monkeypatch.setattr(aws, '_default', None)
+    assert aws.default_factory() is aws.default_factory()
+    factory = aws.configure(max_pool_connections=3)
+    assert aws.default_factory() is factory
+    assert aws.client('s3') is factory.client('s3')
+    assert aws.client('s3').meta.config.max_pool_connections == 3
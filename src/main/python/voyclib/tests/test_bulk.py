@@ -0,0 +1,159 @@
+import datetime
+import decimal
+import uuid
+
+import pytest
+
+from voyclib import bulk
+
+
+@pytest.mark.parametrize('value, field', [
+    (None, '\\N'),
+    (True, 't'),
+    (False, 'f'),
+    (0, '0'),
+    (1.5, '1.5'),
+    (decimal.Decimal('2.50'), '2.50'),
+    (uuid.UUID(int=1), '00000000-0000-0000-0000-000000000001'),
+    (datetime.date(2021, 1, 5), '2021-01-05'),
+    (datetime.datetime(2021, 1, 5, 14, 1, 2), '2021-01-05T14:01:02'),
+    (b'\x00\xff', '\\\\x00ff'),
+    ('plain', 'plain'),
+    ('tab\there', 'tab\\there'),
+    ('line\nbreak\r', 'line\\nbreak\\r'),
+    ('back\\slash', 'back\\\\slash'),
+    ('\\N', '\\\\N'),
+    ({'a': [1, 'x\ty']}, '{"a": [1, "x\\\\ty"]}'),
+])
+def test_field(value, field):
+    assert bulk._field(value) == field
+
+
+def test_encode_row():
+    assert bulk.encode_row((1, None, 'é\t')) == '1\t\\N\té\\t\n'.encode('utf-8')
+
+
+def test_row_stream_reads_in_sizes():
+    rows = [(i, 'row %d' % i) for i in range(100)]
+    expected = b''.join(bulk.encode_row(r) for r in rows)
+    stream = bulk.RowStream(iter(rows))
+    chunks = []
+    while True:
+        chunk = stream.read(64)
+        if not chunk:
+            break
+        assert len(chunk) <= 64
+        chunks.append(chunk)
+    assert b''.join(chunks) == expected
+    assert stream.rows == 100
+
+
+def test_row_stream_is_lazy():
+    consumed = []
+
+    def rows():
+        for i in range(1000):
+            consumed.append(i)
+            yield (i,)
+
+    stream = bulk.RowStream(rows())
+    stream.read(10)
+    assert len(consumed) < 10
+    assert stream.read() == b''.join(
+        bulk.encode_row((i,)) for i in range(1000)
+    )[10:]
+
+
+class FakeCursor(object):
+
+    def __init__(self, conn, name=None, withhold=False):
+        self.conn = conn
+        self.name = name
+        self.withhold = withhold
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append((query, params))
+        self._rows = iter(self.conn.rows)
+
+    def fetchmany(self, size):
+        self.conn.fetches.append(size)
+        return [row for _, row in zip(range(size), self._rows)]
+
+    def copy_expert(self, statement, file, size=8192):
+        self.conn.executed.append((statement, None))
+        while True:
+            data = file.read(size)
+            if not data:
+                break
+            self.conn.copied.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeConnection(object):
+    """The parts of a psycopg2 connection bulk uses."""
+
+    def __init__(self, rows=(), autocommit=False):
+        self.rows = list(rows)
+        self.autocommit = autocommit
+        self.closed = 0
+        self.cursors = []
+        self.executed = []
+        self.fetches = []
+        self.copied = []
+
+    def cursor(self, name=None, withhold=False):
+        cursor = FakeCursor(self, name, withhold)
+        self.cursors.append(cursor)
+        return cursor
+
+
+def test_iter_batches():
+    conn = FakeConnection(rows=[(i,) for i in range(25)])
+    batches = list(bulk.iter_batches(
+        conn, 'SELECT id FROM t WHERE x = %s', (1,), batch_size=10, name='c'
+    ))
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert conn.executed == [('SELECT id FROM t WHERE x = %s', (1,))]
+    assert conn.fetches == [10, 10, 10, 10]
+    cursor, = conn.cursors
+    assert (cursor.name, cursor.withhold, cursor.closed) == ('c', False, True)
+
+
+def test_iter_batches_names_cursors_and_holds_them_in_autocommit():
+    conn = FakeConnection(autocommit=True)
+    assert list(bulk.iter_batches(conn, 'SELECT 1')) == []
+    assert list(bulk.iter_batches(conn, 'SELECT 1')) == []
+    first, second = conn.cursors
+    assert first.withhold and second.withhold
+    assert first.name.startswith('voyclib_') and first.name != second.name
+
+
+def test_iter_rows_closes_cursor_early():
+    conn = FakeConnection(rows=[(i,) for i in range(25)])
+    rows = bulk.iter_rows(conn, 'SELECT id FROM t', batch_size=10)
+    assert [next(rows) for _ in range(12)] == [(i,) for i in range(12)]
+    rows.close()
+    assert conn.cursors[0].closed
+    assert conn.fetches == [10, 10]
+
+
+def test_copy_rows():
+    pytest.importorskip('psycopg2')
+    conn = FakeConnection()
+    rows = [(i, 'name\t%d' % i) for i in range(1000)]
+    assert bulk.copy_rows(conn, 'public.events', rows, columns=('id', 'name'),
+                          buffer_size=256) == 1000
+    assert b''.join(conn.copied) == b''.join(bulk.encode_row(r) for r in rows)
+    assert max(len(chunk) for chunk in conn.copied) == 256
+    statement = repr(conn.executed[0][0])
+    for part in ("'public'", "'events'", "'id'", "'name'", 'FROM STDIN'):
+        assert part in statement
@@ -0,0 +1,166 @@
+import os
+
+import pytest
+
+from voyclib import aws, cache
+
+
+BUCKET = 'voyclib-tests'
+
+
+class Clock(object):
+    """Stands in for the ``time`` module, so recency is deterministic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 0.001
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def client(mock_aws):
+    client = aws.ClientFactory().client('s3', region='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+@pytest.fixture
+def put(client):
+    def put(key, body):
+        client.put_object(Bucket=BUCKET, Key=key, Body=body)
+    return put
+
+
+@pytest.fixture
+def objects(client, tmp_path, clock):
+    with cache.ObjectCache(str(tmp_path / 'cache'), max_bytes=25,
+                           client=client) as objects:
+        yield objects
+
+
+def counters(objects):
+    stats = objects.stats()
+    return stats.fresh, stats.revalidated, stats.misses, stats.evictions
+
+
+def test_get(objects, put):
+    put('a', b'0123456789')
+    view = objects.get(BUCKET, 'a')
+    assert isinstance(view, memoryview) and view.readonly
+    assert bytes(view) == b'0123456789'
+    assert counters(objects) == (0, 0, 1, 0)
+
+    assert bytes(objects.get(BUCKET, 'a')) == b'0123456789'
+    assert counters(objects) == (0, 1, 1, 0)
+
+    old = objects.path(BUCKET, 'a')
+    put('a', b'changed')
+    assert bytes(objects.get(BUCKET, 'a')) == b'changed'
+    assert counters(objects) == (0, 2, 2, 0)
+    assert not os.path.exists(old)
+    stats = objects.stats()
+    assert (stats.entries, stats.bytes) == (1, len(b'changed'))
+
+
+def test_max_age(objects, put, clock):
+    objects.max_age = 60
+    put('a', b'0123456789')
+    objects.get(BUCKET, 'a')
+    clock.now += 30
+    objects.get(BUCKET, 'a')
+    assert counters(objects) == (1, 0, 1, 0)
+
+    clock.now += 60
+    objects.get(BUCKET, 'a')
+    assert counters(objects) == (1, 1, 1, 0)
+    # Revalidating starts a new max_age.
+    clock.now += 30
+    objects.get(BUCKET, 'a')
+    assert counters(objects) == (2, 1, 1, 0)
+
+    put('a', b'changed')
+    assert bytes(objects.get(BUCKET, 'a')) == b'0123456789'
+    clock.now += 60
+    assert bytes(objects.get(BUCKET, 'a')) == b'changed'
+
+
+def test_evicts_least_recently_used(objects, put):
+    for key in 'abc':
+        put(key, b'0123456789')
+    objects.get(BUCKET, 'a')
+    objects.get(BUCKET, 'b')
+    objects.get(BUCKET, 'a')
+    path = objects.path(BUCKET, 'b')
+    view = objects.get(BUCKET, 'b')
+
+    # c makes 30 bytes: a, used before b, goes.
+    objects.get(BUCKET, 'c')
+    stats = objects.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (2, 20, 1)
+    objects.max_age = 60
+    objects.get(BUCKET, 'b')
+    objects.get(BUCKET, 'c')
+    assert objects.stats().fresh == 2
+
+    assert objects.evict(max_bytes=10) == 1
+    assert not os.path.exists(path)
+    # Views handed out outlive their file.
+    assert bytes(view) == b'0123456789'
+
+
+def test_keep(objects, put):
+    put('small', b'0123456789')
+    put('large', b'x' * 40)
+    objects.get(BUCKET, 'small')
+    # Larger than max_bytes on its own: everything else goes, it stays.
+    assert bytes(objects.get(BUCKET, 'large')) == b'x' * 40
+    stats = objects.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (1, 40, 1)
+
+    assert objects.evict(max_bytes=0, keep=(BUCKET, 'large')) == 0
+    assert objects.clear() == 1
+    assert objects.stats().entries == 0
+
+
+def test_empty_object(objects, put):
+    put('empty', b'')
+    for _ in range(2):
+        view = objects.get(BUCKET, 'empty')
+        assert len(view) == 0 and bytes(view) == b''
+    assert os.path.getsize(objects.path(BUCKET, 'empty')) == 0
+    assert counters(objects)[1:3] == (2, 1)
+
+
+def test_missing_file_is_a_miss(objects, put):
+    put('a', b'0123456789')
+    os.remove(objects.path(BUCKET, 'a'))
+    assert bytes(objects.get(BUCKET, 'a')) == b'0123456789'
+    assert counters(objects)[1:3] == (0, 2)
+    assert os.path.exists(objects.path(BUCKET, 'a'))
+
+
+def test_shared_directory(objects, put, client):
+    put('a', b'0123456789')
+    objects.get(BUCKET, 'a')
+    with cache.ObjectCache(objects.directory, client=client) as other:
+        assert bytes(other.get(BUCKET, 'a')) == b'0123456789'
+        assert counters(other) == (0, 1, 0, 0)
+        other.clear()
+    # Evicted by the other cache: downloaded again.
+    assert bytes(objects.get(BUCKET, 'a')) == b'0123456789'
+    assert counters(objects) == (0, 0, 2, 0)
+
+
+def test_missing_object(objects, client):
+    with pytest.raises(client.exceptions.NoSuchKey):
+        objects.get(BUCKET, 'missing')
+    assert objects.stats().entries == 0
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+from voyclib import db
+
+
+# psycopg2.extensions.TRANSACTION_STATUS_IDLE and _INTRANS.
+IDLE, INTRANS = 0, 2
+
+
+class FakeCursor(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.closed or self.conn.fail:
+            raise RuntimeError('server closed the connection unexpectedly')
+        self.conn.info.transaction_status = INTRANS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeInfo(object):
+    transaction_status = IDLE
+
+
+class FakeConnection(object):
+    """The parts of a psycopg2 connection the pool uses."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.fail = False
+        self.info = FakeInfo()
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.info.transaction_status = IDLE
+
+    def rollback(self):
+        if self.fail:
+            raise RuntimeError('connection already closed')
+        self.rollbacks += 1
+        self.info.transaction_status = IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def pool(connections):
+
+    def connect(**kwargs):
+        conn = FakeConnection(**kwargs)
+        connections.append(conn)
+        return conn
+
+    pool = db.ConnectionPool(maxconn=2, timeout=0.1, connect=connect,
+                             dbname='voyc')
+    yield pool
+    pool.close()
+
+
+def test_reuses_connections(pool, connections):
+    for _ in range(3):
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('SELECT 1')
+    assert len(connections) == 1
+    assert conn.kwargs == {'dbname': 'voyc'}
+    assert conn.commits == 3
+    stats = pool.stats()
+    assert (stats.size, stats.idle, stats.acquired, stats.created) == (1, 1, 3, 1)
+
+
+def test_rolls_back_on_error(pool):
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.cursor().execute('INSERT')
+            raise ValueError
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    assert pool.getconn() is conn
+
+
+def test_maxconn_bounds_the_pool(pool, connections):
+    borrowed = [pool.getconn(), pool.getconn()]
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert (stats.size, stats.in_use, stats.saturation, stats.timeouts) == (
+        2, 2, 1.0, 1
+    )
+
+    pool.timeout = 5
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(borrowed[0])
+    waiter.join()
+    assert borrowed[2] is borrowed[0]
+    assert len(connections) == 2
+
+
+def test_broken_connection_is_discarded(pool, connections):
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.fail = True
+            conn.cursor().execute('SELECT 1')
+    assert conn.closed
+    assert pool.stats().discarded == 1
+
+    with pool.connection() as replacement:
+        pass
+    assert replacement is not conn
+    assert len(connections) == 2
+
+
+def test_idle_connection_is_pinged(pool, connections):
+    pool.check_interval = 0
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.fail = True
+    assert pool.getconn() is not conn
+    assert conn.closed
+    assert pool.stats().discarded == 1
+
+
+def test_keyboard_interrupt_releases_the_slot(pool):
+    pool.maxconn = 1
+    with pytest.raises(KeyboardInterrupt):
+        with pool.connection():
+            raise KeyboardInterrupt
+    assert pool.stats().in_use == 0
+    with pool.connection():
+        pass
+
+
+def test_closed_pool(pool):
+    conn = pool.getconn()
+    pool.close()
+    with pytest.raises(db.PoolClosed):
+        pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
@@ -0,0 +1,166 @@
+import hashlib
+import io
+import json
+import tarfile
+import zipfile
+
+import boto3
+import pytest
+
+import pypi_index
+
+
+BUCKET = 'voyclib-index-tests'
+
+
+def metadata(name, version, requires_python='>=3.8'):
+    return (
+        'Metadata-Version: 2.1\nName: %s\nVersion: %s\nRequires-Python: %s\n'
+        % (name, version, requires_python)
+    ).encode('utf-8')
+
+
+def wheel(name, version, **kwargs):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as whl:
+        whl.writestr('%s/__init__.py' % name, '')
+        whl.writestr(
+            '%s-%s.dist-info/METADATA' % (name, version),
+            metadata(name, version, **kwargs),
+        )
+    return data.getvalue()
+
+
+def sdist(name, version, **kwargs):
+    data = io.BytesIO()
+    info = metadata(name, version, **kwargs)
+    with tarfile.open(fileobj=data, mode='w:gz') as tar:
+        member = tarfile.TarInfo('%s-%s/PKG-INFO' % (name, version))
+        member.size = len(info)
+        tar.addfile(member, io.BytesIO(info))
+    return data.getvalue()
+
+
+WHEEL = 'voyclib-0.5.0-py3-none-any.whl'
+SDIST = 'voyclib-0.5.0.tar.gz'
+FILES = {
+    'voyclib/' + WHEEL: wheel('voyclib', '0.5.0'),
+    'voyclib/' + SDIST: sdist('voyclib', '0.5.0'),
+    'other-pkg/other_pkg-1.0-py3-none-any.whl': wheel(
+        'other_pkg', '1.0', requires_python='>=3.6, <4'
+    ),
+}
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_inspect():
+    dist, meta = pypi_index.inspect(WHEEL, FILES['voyclib/' + WHEEL])
+    assert meta == metadata('voyclib', '0.5.0')
+    assert dist == pypi_index.Dist(
+        WHEEL, sha256(FILES['voyclib/' + WHEEL]), '>=3.8', sha256(meta)
+    )
+    # Only a wheel's metadata is published.
+    dist, meta = pypi_index.inspect(SDIST, FILES['voyclib/' + SDIST])
+    assert meta is None
+    assert (dist.requires_python, dist.metadata_sha256) == ('>=3.8', None)
+
+
+def test_pages_round_trip():
+    dists = [
+        pypi_index.Dist('a-1.0.tar.gz', 'ab' * 32, None, None),
+        pypi_index.Dist('a-1.0-py3-none-any.whl', 'cd' * 32, '>=3.6, <4',
+                        'ef' * 32),
+    ]
+    pages = pypi_index.project_pages('A', dists)
+    for page, body in pages.items():
+        assert sorted(pypi_index.parse_project(body, page)) == sorted(dists)
+    assert b'data-requires-python="&gt;=3.6, &lt;4"' in pages['index.html']
+    assert json.loads(pages['index.json'])['name'] == 'a'
+
+
+def check_index(read):
+    """Check the pages of ``FILES`` as read by ``read(key)``."""
+    root = json.loads(read('index.json'))
+    assert root['projects'] == [{'name': 'other-pkg'}, {'name': 'voyclib'}]
+    assert b'<a href="voyclib/">voyclib</a>' in read('index.html')
+
+    page = json.loads(read('voyclib/index.json'))
+    files = {f['filename']: f for f in page['files']}
+    assert sorted(files) == sorted([SDIST, WHEEL])
+    assert files[WHEEL]['hashes'] == {'sha256': sha256(FILES['voyclib/' + WHEEL])}
+    assert files[WHEEL]['requires-python'] == '>=3.8'
+    assert files[WHEEL]['core-metadata'] == {
+        'sha256': sha256(read('voyclib/%s.metadata' % WHEEL))
+    }
+    assert 'core-metadata' not in files[SDIST]
+    html = read('voyclib/index.html').decode('utf-8')
+    assert '%s#sha256=%s' % (WHEEL, sha256(FILES['voyclib/' + WHEEL])) in html
+
+
+def test_directory_target(tmp_path):
+    target = pypi_index.DirectoryTarget(str(tmp_path))
+    for key, data in FILES.items():
+        target.put(key, data)
+
+    written = pypi_index.reindex(target)
+    assert sorted(written) == [
+        'index.html', 'index.json',
+        'other-pkg/index.html', 'other-pkg/index.json',
+        'other-pkg/other_pkg-1.0-py3-none-any.whl.metadata',
+        'voyclib/index.html', 'voyclib/index.json',
+        'voyclib/%s.metadata' % WHEEL,
+    ]
+    check_index(target.read)
+    assert pypi_index.reindex(target) == []
+
+
+def test_update_adds_files(tmp_path):
+    target = pypi_index.DirectoryTarget(str(tmp_path))
+    for key, data in FILES.items():
+        target.put(key, data)
+    pypi_index.reindex(target)
+
+    new = pypi_index.Dist('voyclib-0.6.0.tar.gz', 'ab' * 32, '>=3.8', None)
+    written = pypi_index.update(target, 'VoycLib', [new])
+    assert sorted(written) == ['voyclib/index.html', 'voyclib/index.json']
+    dists = {d.filename: d for d in pypi_index.load_project(target, 'voyclib')}
+    assert sorted(dists) == sorted([WHEEL, SDIST, new.filename])
+    assert dists[new.filename] == new
+    assert dists[WHEEL].sha256 == sha256(FILES['voyclib/' + WHEEL])
+
+
+@pytest.fixture
+def client(mock_aws):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    return client
+
+
+def test_s3_target(client):
+    target = pypi_index.S3Target(BUCKET, 'wheelhouse', client=client)
+    for key, data in FILES.items():
+        target.put(key, data)
+
+    written = pypi_index.reindex(target)
+    # Each index.html is also stored as its directory.
+    assert {'', 'voyclib/', 'other-pkg/'} <= set(written)
+    for key in ('', 'voyclib/'):
+        assert target.read(key) == target.read(key + 'index.html')
+    check_index(target.read)
+
+    alias = client.head_object(Bucket=BUCKET, Key='wheelhouse/voyclib/')
+    assert alias['ContentType'] == 'text/html'
+    assert alias['CacheControl'] == pypi_index.PAGE_CACHE_CONTROL
+    whl = client.head_object(Bucket=BUCKET, Key='wheelhouse/voyclib/' + WHEEL)
+    assert whl['CacheControl'] == pypi_index.FILE_CACHE_CONTROL
+    assert pypi_index.reindex(target) == []
+
+
+def test_s3_target_root_has_no_empty_alias(client):
+    target = pypi_index.S3Target(BUCKET, client=client)
+    assert target.aliases('index.html') == []
+    assert target.aliases('voyclib/index.html') == ['voyclib/']
+    assert target.aliases('voyclib/index.json') == []
@@ -0,0 +1,142 @@
+import os
+import threading
+
+import pytest
+
+from voyclib import aws, s3
+
+
+BUCKET = 'voyclib-tests'
+# 150 keys two levels below reports/, and one directly in it.
+KEYS = ['reports/%s/%s/%03d.json' % ('abcde'[i % 5], 'xyz'[i // 5 % 3], i)
+        for i in range(150)] + ['reports/index.json']
+
+
+@pytest.fixture
+def client(mock_aws):
+    client = aws.ClientFactory().client('s3', region='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    for key in KEYS + ['other/skipped.json']:
+        client.put_object(Bucket=BUCKET, Key=key, Body=key.encode('utf-8'))
+    return client
+
+
+def listed_prefixes(client):
+    """The ``(Prefix, Delimiter)`` of each listing ``client`` sends."""
+    prefixes = []
+    lock = threading.Lock()
+
+    def record(params, **kwargs):
+        with lock:
+            prefixes.append((params['Prefix'], params.get('Delimiter')))
+
+    client.meta.events.register(
+        'before-parameter-build.s3.ListObjectsV2', record
+    )
+    return prefixes
+
+
+@pytest.mark.parametrize('depth, shards', [(0, 1), (1, 6), (2, 21), (3, 21)])
+def test_iter_objects(client, depth, shards):
+    prefixes = listed_prefixes(client)
+    objects = list(s3.iter_objects(
+        BUCKET, 'reports/', depth=depth, max_workers=4, client=client
+    ))
+    keys = [obj['Key'] for obj in objects]
+    assert len(keys) == 151
+    assert sorted(keys) == sorted(KEYS)
+    assert all(obj['Size'] == len(obj['Key']) for obj in objects)
+    assert len(prefixes) == shards
+    # Below depth, shards are listed without a delimiter.
+    assert all((prefix.count('/') > depth) == (delimiter is None)
+               for prefix, delimiter in prefixes)
+
+
+def test_iter_keys(client):
+    assert sorted(s3.iter_keys(BUCKET, 'reports/b/', client=client)) == sorted(
+        k for k in KEYS if k.startswith('reports/b/')
+    )
+    assert list(s3.iter_keys(BUCKET, 'missing/', client=client)) == []
+
+
+def test_failing_shard_raises(client):
+    def fail(params, **kwargs):
+        if params['Prefix'] == 'reports/c/':
+            raise RuntimeError('listing reports/c/ failed')
+
+    client.meta.events.register('before-parameter-build.s3.ListObjectsV2', fail)
+    with pytest.raises(RuntimeError, match='reports/c/'):
+        list(s3.iter_objects(BUCKET, 'reports/', depth=2, client=client))
+
+
+def test_missing_bucket_raises(client):
+    with pytest.raises(client.exceptions.NoSuchBucket):
+        list(s3.iter_objects('voyclib-missing', client=client))
+
+
+@pytest.mark.parametrize('key, prefix, relative', [
+    ('reports/a/x/000.json', 'reports/', ['a', 'x', '000.json']),
+    ('reports/index.json', '', ['reports', 'index.json']),
+    ('reports//index.json', 'reports/', ['index.json']),
+])
+def test_local_path(tmp_path, key, prefix, relative):
+    assert s3.local_path(str(tmp_path), key, prefix) == os.path.join(
+        str(tmp_path), *relative
+    )
+
+
+@pytest.mark.parametrize('key, prefix', [
+    ('reports/../../etc/passwd', 'reports/'),
+    ('../outside.json', ''),
+    ('reports/a/../../../outside.json', 'reports/'),
+    ('reports/', 'reports/'),
+    ('other/index.json', 'reports/'),
+])
+def test_local_path_rejects(tmp_path, key, prefix):
+    with pytest.raises(ValueError):
+        s3.local_path(str(tmp_path / 'docs'), key, prefix)
+
+
+def test_transfers(client, tmp_path):
+    source = tmp_path / 'source'
+    (source / 'a').mkdir(parents=True)
+    (source / 'a' / 'small.txt').write_bytes(b'small')
+    large = os.urandom(11 * s3.MB)
+    (source / 'large.bin').write_bytes(large)
+
+    with s3.Transfers(client, max_concurrency=4, multipart_threshold=5 * s3.MB,
+                      part_size=5 * s3.MB, window=1) as transfers:
+        uploaded = list(transfers.upload(BUCKET, s3.walk(str(source), 'up/')))
+        assert uploaded == ['up/large.bin', 'up/a/small.txt']
+
+        target = tmp_path / 'target'
+        downloaded = dict(transfers.download(
+            BUCKET, s3.iter_objects(BUCKET, 'up/', client=client),
+            str(target), prefix='up/',
+        ))
+    assert downloaded == {
+        'up/a/small.txt': str(target / 'a' / 'small.txt'),
+        'up/large.bin': str(target / 'large.bin'),
+    }
+    assert (target / 'a' / 'small.txt').read_bytes() == b'small'
+    assert (target / 'large.bin').read_bytes() == large
+
+
+def test_download_skips_directory_markers(client, tmp_path):
+    # As written by the console's "Create folder", and by pypi_index.S3Target
+    # as aliases of index pages.
+    for key in ('reports/', 'reports/a/'):
+        client.put_object(Bucket=BUCKET, Key=key, Body=b'')
+    target = tmp_path / 'target'
+    with s3.Transfers(client) as transfers:
+        downloaded = dict(transfers.download(
+            BUCKET, s3.iter_objects(BUCKET, 'reports/a/', client=client),
+            str(target), prefix='reports/',
+        ))
+        assert sorted(downloaded) == sorted(
+            k for k in KEYS if k.startswith('reports/a/')
+        )
+        assert list(transfers.download(
+            BUCKET, ['reports/', 'reports/a/'], str(target), prefix='reports/'
+        )) == []
+    assert (target / 'a' / 'x' / '000.json').read_bytes() == b'reports/a/x/000.json'
@@ -0,0 +1,28 @@
+import importlib
+
+import pytest
+
+from voyclib import aws, db, voyclib
+
+
+def test_test(capsys):
+    voyclib.test()
+    assert capsys.readouterr().out == 'This are test\n'
+
+
+@pytest.mark.parametrize('name', ['aws', 'bulk', 'cache', 'db', 's3'])
+def test_modules_import_without_extras(name):
+    # Each module guards its optional imports, so importing never needs them.
+    assert importlib.import_module('voyclib.' + name).__doc__
+
+
+def test_aws_without_boto3(monkeypatch):
+    monkeypatch.setattr(aws, 'boto3', None)
+    with pytest.raises(ImportError, match=r'voyclib\[aws\]'):
+        aws.ClientFactory()
+
+
+def test_db_without_psycopg2(monkeypatch):
+    monkeypatch.setattr(db, 'psycopg2', None)
+    with pytest.raises(ImportError, match=r'voyclib\[db\]'):
+        db.ConnectionPool()
@@ -0,0 +1,197 @@
+import io
+import os
+import sys
+
+import pytest
+
+import pypi_index
+
+if sys.version_info < (3, 11):
+    # wheelhouse reads the locks with tomli, which buildspec.yml installs.
+    pytest.importorskip('tomli')
+
+import wheelhouse  # noqa: E402
+from test_pypi_index import sha256, wheel  # noqa: E402
+
+
+LOCK = '''
+[[package]]
+name = "requests"
+version = "2.25.0"
+description = ""
+category = "main"
+optional = false
+python-versions = "*"
+
+[package.dependencies]
+idna = ">=2.5,<3"
+pywin32 = {version = "227", markers = "sys_platform == \\"win32\\""}
+zipp = {version = "*", python = "<3.8"}
+
+[[package]]
+name = "idna"
+version = "2.10"
+description = ""
+category = "main"
+optional = false
+python-versions = "*"
+
+[[package]]
+name = "pywin32"
+version = "227"
+description = ""
+category = "main"
+optional = false
+python-versions = "*"
+
+[[package]]
+name = "zipp"
+version = "3.4.0"
+description = ""
+category = "dev"
+optional = false
+python-versions = ">=3.6"
+
+[[package]]
+name = "voyclib"
+version = "0.5.0"
+description = ""
+category = "main"
+optional = false
+python-versions = "*"
+
+[package.source]
+type = "legacy"
+url = "http://voyclib.s3-website.eu-west-1.amazonaws.com/hello"
+reference = "voyclib"
+
+[metadata]
+lock-version = "1.1"
+python-versions = "^3.6"
+content-hash = "0"
+
+[metadata.files]
+requests = [
+    {file = "requests-2.25.0-py2.py3-none-any.whl", hash = "sha256:%s"},
+    {file = "requests-2.25.0.tar.gz", hash = "sha256:%s"},
+]
+idna = [
+    {file = "idna-2.10-py2.py3-none-any.whl", hash = "sha256:%s"},
+]
+pywin32 = [
+    {file = "pywin32-227-cp38-cp38-win_amd64.whl", hash = "sha256:%s"},
+]
+zipp = [
+    {file = "zipp-3.4.0-py3-none-any.whl", hash = "sha256:%s"},
+]
+voyclib = []
+''' % ('1' * 64, '2' * 64, '3' * 64, '4' * 64, '5' * 64)
+
+
+@pytest.mark.parametrize('constraint, marker', [
+    ('*', None),
+    ('>=3.8', 'python_version >= "3.8"'),
+    ('^3.6', 'python_version >= "3.6" and python_version < "4"'),
+    ('~3.7', 'python_version >= "3.7" and python_version < "3.8"'),
+    ('>=3.6,<3.8', 'python_version >= "3.6" and python_version < "3.8"'),
+    ('<3.6 || >=3.8', '(python_version < "3.6") or (python_version >= "3.8")'),
+])
+def test_python_marker(constraint, marker):
+    assert wheelhouse.python_marker(constraint) == marker
+
+
+@pytest.fixture
+def lock(tmp_path):
+    path = tmp_path / 'poetry.lock'
+    path.write_text(LOCK)
+    return str(path)
+
+
+def test_read_lock(lock):
+    packages = {p.name: p for p in wheelhouse.read_lock(lock)}
+    # voyclib comes from another index, without hashes.
+    assert sorted(packages) == ['idna', 'pywin32', 'requests', 'zipp']
+    assert packages['requests'].hashes == ['1' * 64, '2' * 64]
+    assert packages['requests'].marker is None
+    assert packages['pywin32'].marker == 'sys_platform == "win32"'
+    assert packages['zipp'].marker == 'python_version < "3.8"'
+    assert packages['zipp'].category == 'dev'
+
+
+@pytest.mark.parametrize('filename, version_info, platform, expected', [
+    ('idna-2.10-py2.py3-none-any.whl', (3, 8), None, True),
+    ('x-1.0-cp38-cp38-manylinux2014_x86_64.whl', (3, 8), 'linux_x86_64', True),
+    ('x-1.0-cp38-cp38-manylinux2014_x86_64.whl', (3, 9), 'linux_x86_64', False),
+    ('x-1.0-cp38-cp38-manylinux2014_x86_64.whl', (3, 8), 'linux_aarch64', False),
+    ('x-1.0-cp36-abi3-manylinux2010_x86_64.whl', (3, 9), 'linux_x86_64', True),
+    ('x-1.0-cp38-cp38-win_amd64.whl', (3, 8), 'linux_x86_64', False),
+    ('x-1.0.tar.gz', (3, 8), None, False),
+])
+def test_installable(filename, version_info, platform, expected):
+    assert wheelhouse.installable(filename, version_info, platform) is expected
+
+
+@pytest.fixture
+def target(tmp_path):
+    return pypi_index.DirectoryTarget(str(tmp_path / 'wheelhouse'))
+
+
+@pytest.fixture
+def wheels(monkeypatch):
+    """Stands in for ``pip wheel``: writes a built wheel of each package."""
+    calls = []
+
+    def build_wheels(packages, wheel_dir, pip_args=()):
+        calls.append([p.name for p in packages])
+        wheels = {}
+        for p in packages:
+            filename = '%s-%s-py3-none-any.whl' % (p.name, p.version)
+            with open(os.path.join(wheel_dir, filename), 'wb') as f:
+                f.write(wheel(p.name, p.version))
+            wheels[(pypi_index.normalize(p.name), p.version)] = [filename]
+        return wheels
+
+    monkeypatch.setattr(wheelhouse, 'build_wheels', build_wheels)
+    return calls
+
+
+def test_mirror_and_export(lock, target, wheels, tmp_path):
+    packages = [p for p in wheelhouse.read_lock(lock) if p.name != 'pywin32']
+    results = wheelhouse.mirror(target, packages, out=io.StringIO())
+    assert results == {
+        'requests-2.25.0-py3-none-any.whl': 'built',
+        'idna-2.10-py3-none-any.whl': 'built',
+        'zipp-3.4.0-py3-none-any.whl': 'built',
+    }
+    assert pypi_index.load_project(target, 'requests')
+    # Already installable from the wheelhouse: nothing to build.
+    assert wheelhouse.mirror(target, packages) == {}
+    assert len(wheels) == 1
+
+    requirements = tmp_path / 'requirements.txt'
+    have = wheelhouse.published(target, packages)
+    pinned = wheelhouse.read_lock(lock)
+    wheelhouse.export(str(requirements), pinned, have, lock=lock)
+    lines = requirements.read_text()
+    assert lines.startswith('# Generated by wheelhouse.py from poetry.lock')
+    # Pinned to the wheels in the wheelhouse, not the lock's files.
+    assert 'requests==2.25.0 \\\n    --hash=sha256:%s\n' % sha256(
+        wheel('requests', '2.25.0')
+    ) in lines
+    assert '1' * 64 not in lines
+    # Not mirrored, but excluded by its marker off Windows.
+    assert (
+        'pywin32==227 ; sys_platform == "win32" \\\n    --hash=sha256:%s\n'
+        % ('4' * 64)
+    ) in lines
+    assert 'zipp==3.4.0 ; python_version < "3.8"' in lines
+
+    wheelhouse.export(str(requirements), pinned, have, dev=False)
+    assert 'zipp' not in requirements.read_text()
+
+
+def test_export_needs_wheels(lock, tmp_path):
+    with pytest.raises(ValueError, match='requests==2.25.0'):
+        wheelhouse.export(
+            str(tmp_path / 'requirements.txt'), wheelhouse.read_lock(lock), {}
+        )
@@ -0,0 +1,183 @@
+"""Process-wide boto3 clients, created once per thread and reused.
+
+Creating a client resolves credentials, loads the service's endpoint and API
+models and opens a new connection pool, which adds up in Lambda cold starts
+and in loops that build a client per call. ``client`` returns a client
+cached per ``(service, region, role)`` and thread, so the same thread keeps
+getting the same client and its open connections:
+
+    from voyclib import aws
+
+    s3 = aws.client('s3')
+    docs = aws.client('s3', region='eu-west-1', role='arn:aws:iam::...:role/docs')
+
+All clients of a ``ClientFactory`` share one botocore session per role, so
+models are loaded from disk once, and are created under a lock, since
+sessions are not thread-safe. For a ``role``, the factory assumes the role
+through STS once and shares the credentials between its clients and
+threads. botocore refreshes them shortly (10 to 15 minutes) before they
+expire.
+
+Clients use ``max_pool_connections`` connections and the ``adaptive`` retry
+mode, which adds client-side rate limiting to the standard retries when AWS
+throttles. Both are options of the factory; other ``botocore`` ``Config``
+options can be given per client:
+
+    factory = aws.ClientFactory(max_pool_connections=50, max_attempts=10)
+    s3 = factory.client('s3', s3={'addressing_style': 'path'})
+
+Needs the ``aws`` extra: ``pip install voyclib[aws]``.
+"""
+import threading
+
+try:
+    import boto3
+    import botocore.session
+    from botocore.config import Config
+    from botocore.credentials import (
+        CredentialProvider,
+        DeferredRefreshableCredentials,
+    )
+except ImportError:  # The aws extra is not installed.
+    boto3 = None
+    CredentialProvider = object
+
+
+MAX_POOL_CONNECTIONS = 10
+MAX_ATTEMPTS = 5
+RETRY_MODE = 'adaptive'
+ROLE_SESSION_NAME = 'voyclib'
+ROLE_DURATION = 3600
+
+
+def _require():
+    if boto3 is None:
+        raise ImportError(
+            'voyclib.aws needs boto3; install voyclib with the aws extra: '
+            'pip install voyclib[aws]'
+        )
+
+
+class AssumeRoleProvider(CredentialProvider):
+    """Credentials of ``role_arn``, assumed with ``sts`` when first used and
+    again when they are about to expire."""
+
+    METHOD = 'voyclib-assume-role'
+
+    def __init__(self, sts, role_arn, session_name=ROLE_SESSION_NAME,
+                 duration=ROLE_DURATION):
+        self.sts = sts
+        self.role_arn = role_arn
+        self.session_name = session_name
+        self.duration = duration
+
+    def _refresh(self):
+        credentials = self.sts.assume_role(
+            RoleArn=self.role_arn,
+            RoleSessionName=self.session_name,
+            DurationSeconds=self.duration,
+        )['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    def load(self):
+        return DeferredRefreshableCredentials(self._refresh, self.METHOD)
+
+
+class ClientFactory(object):
+    """boto3 clients cached per service, region, role, options and thread."""
+
+    def __init__(self, max_pool_connections=MAX_POOL_CONNECTIONS,
+                 max_attempts=MAX_ATTEMPTS, retry_mode=RETRY_MODE,
+                 role_session_name=ROLE_SESSION_NAME,
+                 role_duration=ROLE_DURATION, **config):
+        _require()
+        self.config = Config(
+            max_pool_connections=max_pool_connections,
+            retries={'mode': retry_mode, 'max_attempts': max_attempts},
+            **config
+        )
+        self.role_session_name = role_session_name
+        self.role_duration = role_duration
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._local = threading.local()
+
+    def session(self, role=None):
+        """The ``boto3.Session`` whose credentials are ``role``'s, or the
+        default credentials when ``role`` is None."""
+        session = self._sessions.get(role)
+        if session is not None:
+            return session
+        with self._lock:
+            if role not in self._sessions:
+                core = botocore.session.Session()
+                if role is not None:
+                    provider = AssumeRoleProvider(
+                        self.client('sts'),
+                        role,
+                        self.role_session_name,
+                        self.role_duration,
+                    )
+                    core.get_component('credential_provider').insert_before(
+                        'env', provider
+                    )
+                self._sessions[role] = boto3.Session(botocore_session=core)
+            return self._sessions[role]
+
+    def client(self, service, region=None, role=None, endpoint_url=None,
+               **config):
+        """This thread's client for ``service``; ``config`` are botocore
+        ``Config`` options on top of the factory's."""
+        key = (service, region, role, endpoint_url, repr(sorted(config.items())))
+        clients = self._local.__dict__.setdefault('clients', {})
+        client = clients.get(key)
+        if client is None:
+            session = self.session(role)
+            merged = self.config.merge(Config(**config)) if config else self.config
+            with self._lock:
+                client = session.client(
+                    service,
+                    region_name=region,
+                    endpoint_url=endpoint_url,
+                    config=merged,
+                )
+            clients[key] = client
+        return client
+
+    def clear(self):
+        """Forget this thread's clients, eg: after a fork."""
+        self._local.__dict__.pop('clients', None)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_factory():
+    """The process-wide ``ClientFactory`` used by ``client``."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ClientFactory()
+    return _default
+
+
+def configure(**options):
+    """Replace the process-wide factory with ``ClientFactory(**options)``."""
+    global _default
+    with _default_lock:
+        _default = ClientFactory(**options)
+    return _default
+
+
+def client(service, region=None, role=None, endpoint_url=None, **config):
+    """A client from the process-wide factory; see ``ClientFactory.client``."""
+    return default_factory().client(
+        service, region, role, endpoint_url, **config
+    )
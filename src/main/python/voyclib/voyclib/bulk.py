@@ -0,0 +1,155 @@
+"""Move large row sets through PostgreSQL in constant memory.
+
+``copy_rows`` streams any iterable of rows into ``COPY ... FROM STDIN``.
+Rows are encoded to COPY's text format only as psycopg2 reads them, at most
+``buffer_size`` bytes at a time, so a generator over millions of rows is
+never held in memory, and the server parses one stream instead of one
+statement per row as with ``executemany``.
+
+``iter_rows`` reads a query through a named (server-side) cursor in batches
+of ``batch_size``, so only one batch is held at a time however large the
+result, unlike a client-side ``fetchall``.
+
+    from voyclib.bulk import copy_rows, iter_rows
+
+    with pool.connection() as conn:
+        copy_rows(conn, 'events', ((i, 'name') for i in range(10 ** 7)),
+                  columns=('id', 'name'))
+        for row in iter_rows(conn, 'SELECT id, name FROM events'):
+            ...
+
+Needs the ``db`` extra: ``pip install voyclib[db]``.
+"""
+import datetime
+import decimal
+import itertools
+import json
+import uuid
+
+try:
+    from psycopg2 import sql
+except ImportError:  # The db extra is not installed.
+    sql = None
+
+
+BUFFER_SIZE = 1024 * 1024
+BATCH_SIZE = 10000
+
+_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+_cursor_ids = itertools.count()
+
+
+###########################################
+#               COPY FROM
+###########################################
+
+def _field(value):
+    """One value in COPY text format; dicts and lists are written as JSON."""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (int, float, decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).translate(_ESCAPES)
+
+
+def encode_row(row):
+    return ('\t'.join(_field(v) for v in row) + '\n').encode('utf-8')
+
+
+class RowStream(object):
+    """A read-only file over ``rows`` encoded for COPY, for ``copy_expert``.
+
+    Each ``read`` encodes rows until it has ``size`` bytes; the overflow of
+    the last row is kept for the next read, so at most about ``size`` bytes
+    are buffered. ``rows`` counts the rows read so far.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = b''
+        self.rows = 0
+
+    def read(self, size=-1):
+        chunks, length = [self._pending], len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            data = encode_row(row)
+            chunks.append(data)
+            length += len(data)
+            self.rows += 1
+        data = b''.join(chunks)
+        if size < 0:
+            self._pending = b''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def copy_rows(conn, table, rows, columns=None, buffer_size=BUFFER_SIZE):
+    """Load ``rows`` (tuples in ``columns`` order) into ``table`` with COPY.
+
+    ``table`` may be ``'name'`` or ``'schema.name'``. Runs in the
+    connection's current transaction; returns the number of rows loaded.
+    """
+    statement = sql.SQL('COPY {} {}FROM STDIN').format(
+        sql.Identifier(*table.split('.')),
+        sql.SQL('({}) ').format(
+            sql.SQL(', ').join(sql.Identifier(c) for c in columns)
+        ) if columns else sql.SQL(''),
+    )
+    stream = RowStream(rows)
+    with conn.cursor() as cur:
+        cur.copy_expert(statement, stream, size=buffer_size)
+    return stream.rows
+
+
+###########################################
+#           Server-side cursors
+###########################################
+
+def iter_batches(conn, query, params=None, batch_size=BATCH_SIZE, name=None):
+    """Yield lists of up to ``batch_size`` rows of ``query``.
+
+    A named cursor keeps the result on the server. Named cursors live in a
+    transaction; on an autocommit connection the cursor is declared ``WITH
+    HOLD`` instead. The cursor is closed when the generator is exhausted or
+    closed.
+    """
+    name = name or 'voyclib_%d' % next(_cursor_ids)
+    cur = conn.cursor(name=name, withhold=conn.autocommit)
+    try:
+        cur.execute(query, params)
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        if not conn.closed:
+            cur.close()
+
+
+def iter_rows(conn, query, params=None, batch_size=BATCH_SIZE, name=None):
+    """Yield the rows of ``query``, ``batch_size`` at a time from the server."""
+    for batch in iter_batches(conn, query, params, batch_size, name):
+        yield from batch
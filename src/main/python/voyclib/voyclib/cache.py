@@ -0,0 +1,293 @@
+"""A local disk cache of S3 objects, shared by threads and processes.
+
+Objects are stored under ``directory`` as one file per bucket, key and ETag,
+and indexed in a SQLite file next to them. ``get`` returns an object as a
+read-only ``memoryview`` of the memory-mapped file, so a large object is
+never copied into Python bytes:
+
+    from voyclib.cache import ObjectCache
+
+    cache = ObjectCache('/tmp/s3-cache', max_bytes=20 * 1024 ** 3)
+    view = cache.get('voyc-docs', 'reference/model.bin')
+    header = bytes(view[:16])
+
+A cached object is revalidated with a conditional GET (``If-None-Match``
+its ETag): when it has not changed, S3 answers 304 without a body. Within
+``max_age`` seconds of the last check it is not revalidated at all. A
+changed object is downloaded again under its new ETag.
+
+Downloads are written to a temporary file and renamed into place, and the
+index is updated in a SQLite transaction, so processes sharing the
+directory never see a partial object. Each ``get`` marks its object as
+used; when the cache grows past ``max_bytes`` the least recently used
+objects are deleted. Views already handed out stay valid after their file
+is deleted, on POSIX. An object whose file another process evicted between
+the index lookup and opening it is downloaded again, and counted as a miss.
+
+Needs the ``aws`` extra: ``pip install voyclib[aws]``.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:  # The aws extra is not installed.
+    ClientError = None
+
+from voyclib import aws
+
+
+GB = 1024 ** 3
+INDEX = 'index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    checked REAL NOT NULL,
+    PRIMARY KEY (bucket, key)
+);
+CREATE INDEX IF NOT EXISTS objects_used ON objects (used);
+"""
+
+CacheStats = namedtuple('CacheStats', [
+    'entries',
+    'bytes',
+    'max_bytes',
+    'fresh',
+    'revalidated',
+    'misses',
+    'evictions',
+])
+
+
+def _not_modified(error):
+    return error.response.get('Error', {}).get('Code') in ('304', 'NotModified')
+
+
+def _map(f):
+    """A read-only memoryview of the open file ``f``."""
+    if not os.fstat(f.fileno()).st_size:
+        # Empty files cannot be mapped.
+        return memoryview(b'')
+    return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class ObjectCache(object):
+    """S3 objects cached on disk by bucket, key and ETag, evicted LRU."""
+
+    def __init__(self, directory, max_bytes=10 * GB, max_age=0, client=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.client = client or aws.client('s3')
+        os.makedirs(os.path.join(self.directory, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.directory, INDEX),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('fresh', 'revalidated', 'misses', 'evictions'), 0
+        )
+
+    def _execute(self, statement, params=()):
+        with self._lock:
+            return self._db.execute(statement, params).fetchall()
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] += n
+
+    def _relative_path(self, bucket, key, etag):
+        digest = hashlib.sha256(('%s/%s' % (bucket, key)).encode('utf-8'))
+        name = '%s-%s' % (digest.hexdigest(), etag.strip('"'))
+        return os.path.join('objects', name[:2], name)
+
+    def _remove(self, relative):
+        try:
+            os.remove(os.path.join(self.directory, relative))
+        except OSError:
+            # Already evicted by another process, or mapped on Windows.
+            pass
+
+    def _store(self, bucket, key, response):
+        """Write a GET response's body into place; returns ``(open file,
+        relative path)``."""
+        etag = response['ETag']
+        relative = self._relative_path(bucket, key, etag)
+        path = os.path.join(self.directory, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        f = os.fdopen(fd, 'w+b')
+        try:
+            shutil.copyfileobj(response['Body'], f, 1024 * 1024)
+            f.flush()
+            os.replace(tmp, path)
+        except BaseException:
+            f.close()
+            self._remove(tmp)
+            raise
+        f.seek(0)
+        size = os.fstat(f.fileno()).st_size
+
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                old = self._db.execute(
+                    'SELECT path FROM objects WHERE bucket = ? AND key = ?',
+                    (bucket, key),
+                ).fetchone()
+                self._db.execute(
+                    'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (bucket, key, etag, relative, size, now, now),
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                f.close()
+                raise
+        if old and old[0] != relative:
+            self._remove(old[0])
+        return f, relative
+
+    def _open(self, bucket, key):
+        """The current version of the object as ``(open file, path)``.
+
+        The file is opened before anything can evict it, and an open file
+        outlives its deletion, so the caller can always read it.
+        """
+        row = self._execute(
+            'SELECT etag, path, checked FROM objects WHERE bucket = ? AND key = ?',
+            (bucket, key),
+        )
+        now = time.time()
+        f = None
+        if row:
+            etag, relative, checked = row[0]
+            try:
+                f = open(os.path.join(self.directory, relative), 'rb')
+            except FileNotFoundError:
+                # Evicted by another process since the lookup: downloaded
+                # again below, as a miss.
+                pass
+        if f is not None and now - checked < self.max_age:
+            self._count('fresh')
+            self._touch(bucket, key, now)
+            return f, os.path.join(self.directory, relative)
+
+        kwargs = {'Bucket': bucket, 'Key': key}
+        if f is not None:
+            kwargs['IfNoneMatch'] = etag
+        try:
+            response = self.client.get_object(**kwargs)
+        except Exception as e:
+            if f is not None and isinstance(e, ClientError) and _not_modified(e):
+                self._count('revalidated')
+                self._touch(bucket, key, now, checked=True)
+                return f, os.path.join(self.directory, relative)
+            if f is not None:
+                f.close()
+            raise
+        if f is not None:
+            f.close()
+
+        self._count('misses')
+        f, relative = self._store(bucket, key, response)
+        self.evict(keep=(bucket, key))
+        return f, os.path.join(self.directory, relative)
+
+    def path(self, bucket, key):
+        """The local path of the current version of the object. Unlike a
+        view from ``get``, the file may be evicted by then."""
+        f, path = self._open(bucket, key)
+        f.close()
+        return path
+
+    def get(self, bucket, key):
+        """The object as a read-only ``memoryview`` of its cached file."""
+        f, _ = self._open(bucket, key)
+        with f:
+            return _map(f)
+
+    def _touch(self, bucket, key, now, checked=False):
+        self._execute(
+            'UPDATE objects SET used = ?%s WHERE bucket = ? AND key = ?'
+            % (', checked = ?' if checked else ''),
+            (now, now, bucket, key) if checked else (now, bucket, key),
+        )
+
+    def evict(self, max_bytes=None, keep=None):
+        """Delete least recently used objects until the cache holds at most
+        ``max_bytes``; ``keep`` is a ``(bucket, key)`` never evicted.
+        Returns the number of objects deleted."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                total = self._db.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM objects'
+                ).fetchone()[0]
+                victims = []
+                if total > limit:
+                    for bucket, key, relative, size in self._db.execute(
+                        'SELECT bucket, key, path, size FROM objects ORDER BY used'
+                    ):
+                        if total <= limit:
+                            break
+                        if (bucket, key) == keep:
+                            continue
+                        victims.append((bucket, key, relative))
+                        total -= size
+                    self._db.executemany(
+                        'DELETE FROM objects WHERE bucket = ? AND key = ?',
+                        [v[:2] for v in victims],
+                    )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._counters['evictions'] += len(victims)
+        for _, _, relative in victims:
+            self._remove(relative)
+        return len(victims)
+
+    def clear(self):
+        return self.evict(max_bytes=0)
+
+    def stats(self):
+        entries, size = self._execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects'
+        )[0]
+        return CacheStats(
+            entries=entries,
+            bytes=size,
+            max_bytes=self.max_bytes,
+            **self._counters
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
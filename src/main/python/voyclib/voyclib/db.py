@@ -0,0 +1,386 @@
+"""PostgreSQL connections pooled over one shared SSH tunnel.
+
+Opening an SSH tunnel and a PostgreSQL session costs several round trips,
+which dominates short queries. A ``Tunnel`` wraps one
+``sshtunnel.SSHTunnelForwarder`` per bastion and database address, shared
+by every pool in the process. A ``ConnectionPool`` keeps psycopg2
+connections open through it and lends them to threads:
+
+    from voyclib.db import ConnectionPool, Tunnel
+
+    tunnel = Tunnel.shared(
+        'bastion.voyc.ai', ('db.internal', 5432),
+        ssh_username='ec2-user', ssh_pkey='~/.ssh/voyc.pem',
+    )
+    pool = ConnectionPool(
+        tunnel=tunnel, dbname='voyc', user='app', password=..., maxconn=8
+    )
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT 1')
+
+The tunnel is started on first use, checked at most every
+``check_interval`` seconds and restarted when it is down. Idle connections
+are pinged before reuse when they have been idle that long, and replaced
+when broken or older than ``max_lifetime``. ``pool.stats()`` reports the
+pool's size, waiters and saturation.
+
+Needs the ``db`` extra: ``pip install voyclib[db]``.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:  # The db extra is not installed.
+    psycopg2 = None
+
+try:
+    import sshtunnel
+except ImportError:
+    sshtunnel = None
+
+
+PoolStats = namedtuple('PoolStats', [
+    'size',
+    'idle',
+    'in_use',
+    'waiting',
+    'maxconn',
+    'saturation',
+    'acquired',
+    'created',
+    'discarded',
+    'timeouts',
+    'wait_seconds',
+    'max_wait_seconds',
+])
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    """No connection became free within the pool's ``timeout``."""
+
+
+class PoolClosed(PoolError):
+    pass
+
+
+def _require(module, name):
+    if module is None:
+        raise ImportError(
+            'voyclib.db needs %s; install voyclib with the db extra: '
+            'pip install voyclib[db]' % name
+        )
+
+
+###########################################
+#               Tunnel
+###########################################
+
+class Tunnel(object):
+    """A lazily started, self-healing SSH tunnel to one database address."""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ssh_address, remote_address, ssh_port=22,
+                 check_interval=30, forwarder=None, **ssh_options):
+        self.ssh_address = ssh_address
+        self.ssh_port = ssh_port
+        self.remote_address = tuple(remote_address)
+        self.check_interval = check_interval
+        self.ssh_options = dict(ssh_options)
+        self._forwarder = forwarder
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._started = False
+        self.restarts = 0
+
+    @classmethod
+    def shared(cls, ssh_address, remote_address, **options):
+        """The process-wide tunnel for this bastion, user and remote address."""
+        key = (
+            ssh_address,
+            options.get('ssh_port', 22),
+            options.get('ssh_username'),
+            tuple(remote_address),
+        )
+        with cls._shared_lock:
+            tunnel = cls._shared.get(key)
+            if tunnel is None:
+                tunnel = cls._shared[key] = cls(
+                    ssh_address, remote_address, **options
+                )
+            return tunnel
+
+    def _new_forwarder(self):
+        _require(sshtunnel, 'sshtunnel')
+        options = dict(self.ssh_options)
+        options.setdefault('set_keepalive', 30)
+        return sshtunnel.SSHTunnelForwarder(
+            (self.ssh_address, self.ssh_port),
+            remote_bind_address=self.remote_address,
+            local_bind_address=('127.0.0.1', 0),
+            **options
+        )
+
+    def _healthy(self):
+        self._forwarder.check_tunnels()
+        return all(self._forwarder.tunnel_is_up.values())
+
+    def ensure(self, force_check=False):
+        """Start or restart the tunnel if needed; returns ``(host, port)``.
+
+        A restarted tunnel may listen on another local port; connections
+        made through the old one fail their next health check.
+        """
+        with self._lock:
+            now = time.monotonic()
+            due = force_check or now - self._checked >= self.check_interval
+            if self._forwarder is None:
+                self._forwarder = self._new_forwarder()
+            if not self._started:
+                self._forwarder.start()
+                self._started = True
+            elif not self._forwarder.is_active or (due and not self._healthy()):
+                self._forwarder.restart()
+                self.restarts += 1
+            if due:
+                self._checked = now
+            return self._forwarder.local_bind_address
+
+    def close(self):
+        with self._lock:
+            if self._forwarder is not None and self._started:
+                self._forwarder.stop()
+            self._forwarder = None
+            self._started = False
+
+
+###########################################
+#               Pool
+###########################################
+
+class _Slot(object):
+    __slots__ = ('conn', 'created', 'released')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = self.released = time.monotonic()
+
+
+class ConnectionPool(object):
+    """A thread-safe pool of psycopg2 connections, optionally over a tunnel.
+
+    ``connect_kwargs`` are passed to ``psycopg2.connect``; with a tunnel,
+    ``host`` and ``port`` are the tunnel's local end. At most ``maxconn``
+    connections are open; a thread asking for more waits up to ``timeout``
+    seconds, then gets ``PoolTimeout``.
+    """
+
+    def __init__(self, minconn=0, maxconn=10, tunnel=None, timeout=30,
+                 check_interval=30, max_lifetime=3600, connect=None,
+                 **connect_kwargs):
+        if connect is None:
+            _require(psycopg2, 'psycopg2')
+            connect = psycopg2.connect
+        self.maxconn = maxconn
+        self.tunnel = tunnel
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_lifetime = max_lifetime
+        self._connect = connect
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._borrowed = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._counters = dict.fromkeys(
+            ('acquired', 'created', 'discarded', 'timeouts'), 0
+        )
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._open())
+
+    def _connect_once(self, force_check=False):
+        kwargs = dict(self.connect_kwargs)
+        if self.tunnel is not None:
+            kwargs['host'], kwargs['port'] = self.tunnel.ensure(force_check)
+        return self._connect(**kwargs)
+
+    def _open(self):
+        """Open a connection for a slot already counted in ``_size``."""
+        try:
+            try:
+                conn = self._connect_once()
+            except Exception:
+                if self.tunnel is None:
+                    raise
+                # A dead tunnel fails every new connection: check it, retry once.
+                conn = self._connect_once(force_check=True)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters['created'] += 1
+        return _Slot(conn)
+
+    def _usable(self, slot):
+        now = time.monotonic()
+        if slot.conn.closed or now - slot.created > self.max_lifetime:
+            return False
+        if now - slot.released < self.check_interval:
+            return True
+        try:
+            with slot.conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            slot.conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, slot):
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Borrow a connection; give it back with ``putconn``."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosed('The pool is closed')
+                    if self._idle:
+                        # Most recently used first, so surplus connections
+                        # go idle for long enough to be recycled.
+                        slot = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        slot = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            'No connection free after %ss (%d in use)'
+                            % (self.timeout, self._size)
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if slot is None:
+                slot = self._open()
+            elif not self._usable(slot):
+                self._discard(slot)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._counters['acquired'] += 1
+                self._wait_seconds += waited
+                self._max_wait = max(self._max_wait, waited)
+                self._borrowed[id(slot.conn)] = slot
+            return slot.conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection, rolled back if left in a transaction."""
+        with self._cond:
+            slot = self._borrowed.pop(id(conn))
+        if not close and not conn.closed and psycopg2 is not None:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+        if close or conn.closed or self._closed:
+            self._discard(slot)
+            return
+        slot.released = time.monotonic()
+        with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for a ``with`` block.
+
+        The transaction is committed when the block succeeds and rolled back
+        when it raises; a connection broken by the error is replaced. The
+        connection goes back to the pool whatever the block raises, eg:
+        ``KeyboardInterrupt``.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return PoolStats(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=in_use,
+                waiting=self._waiting,
+                maxconn=self.maxconn,
+                saturation=in_use / float(self.maxconn),
+                wait_seconds=self._wait_seconds,
+                max_wait_seconds=self._max_wait,
+                **self._counters
+            )
+
+    def close(self):
+        """Close idle connections now and borrowed ones when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for slot in idle:
+            self._discard(slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,227 @@
+"""List and transfer many S3 objects concurrently.
+
+``iter_objects`` walks a prefix as a tree instead of one serial
+``list_objects_v2`` pagination. The prefix is listed with a delimiter; each
+common prefix found becomes a shard listed by another worker, down to
+``depth`` levels, below which shards are listed without a delimiter. Objects
+are yielded as pages arrive, in no particular order:
+
+    from voyclib import s3
+
+    for obj in s3.iter_objects('voyc-docs', 'reports/', max_workers=16):
+        print(obj['Key'], obj['Size'])
+
+A prefix whose keys have no delimiter below it is a single shard, listed
+serially.
+
+``Transfers`` downloads and uploads many objects through one s3transfer
+manager, so at most ``max_concurrency`` requests run at a time across all of
+them. Objects larger than ``multipart_threshold`` are fetched with parallel
+ranged GETs (and uploaded in parts) of ``part_size`` bytes, and files are
+written under a temporary name and renamed when complete. Inputs are
+consumed lazily and results yielded as transfers finish, so listing and
+downloading overlap:
+
+    with s3.Transfers() as transfers:
+        objects = s3.iter_objects('voyc-docs', 'reports/')
+        for key, path in transfers.download('voyc-docs', objects, 'docs',
+                                            prefix='reports/'):
+            ...
+
+Clients come from ``voyclib.aws`` unless one is passed. Needs the ``aws``
+extra: ``pip install voyclib[aws]``.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from boto3.s3.transfer import TransferConfig, create_transfer_manager
+    from s3transfer.subscribers import BaseSubscriber
+except ImportError:  # The aws extra is not installed.
+    BaseSubscriber = object
+
+from voyclib import aws
+
+
+MB = 1024 * 1024
+DEPTH = 1
+PART_SIZE = 8 * MB
+
+
+###########################################
+#               Listing
+###########################################
+
+def iter_objects(bucket, prefix='', delimiter='/', depth=DEPTH,
+                 max_workers=aws.MAX_POOL_CONNECTIONS, client=None):
+    """Yield the object summaries under ``prefix``, listing shards in
+    parallel; see the module docstring."""
+    client = client or aws.client('s3')
+    results = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def list_shard(shard, level):
+        if stop.is_set():
+            return
+        try:
+            kwargs = {'Bucket': bucket, 'Prefix': shard}
+            if level < depth:
+                kwargs['Delimiter'] = delimiter
+            children = []
+            paginator = client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(**kwargs):
+                if stop.is_set():
+                    return
+                if page.get('Contents'):
+                    put(('objects', page['Contents']))
+                children.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+            put(('done', children, level + 1))
+        except Exception as e:
+            put(('error', e))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        executor.submit(list_shard, prefix, 0)
+        pending = 1
+        while pending:
+            item = results.get()
+            if item[0] == 'objects':
+                yield from item[1]
+            elif item[0] == 'done':
+                pending -= 1
+                for child in item[1]:
+                    executor.submit(list_shard, child, item[2])
+                    pending += 1
+            else:
+                raise item[1]
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def iter_keys(bucket, prefix='', **options):
+    for obj in iter_objects(bucket, prefix, **options):
+        yield obj['Key']
+
+
+###########################################
+#               Transfers
+###########################################
+
+class _KnownSize(BaseSubscriber):
+    """Gives s3transfer the size from the listing, saving a HEAD request."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def on_queued(self, future, **kwargs):
+        future.meta.provide_transfer_size(self.size)
+
+
+def _key(obj):
+    return obj if isinstance(obj, str) else obj['Key']
+
+
+def local_path(directory, key, prefix=''):
+    """Where ``key`` goes under ``directory``, without ``prefix``."""
+    if not key.startswith(prefix):
+        raise ValueError('%s is not under %s' % (key, prefix))
+    root = os.path.abspath(directory)
+    path = os.path.abspath(os.path.join(root, *key[len(prefix):].split('/')))
+    if not path.startswith(root + os.sep):
+        raise ValueError('%s would be written outside %s' % (key, directory))
+    return path
+
+
+def walk(directory, prefix=''):
+    """``(path, key)`` of each file under ``directory``, keyed under ``prefix``."""
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, '/')
+            yield path, prefix + relative
+
+
+class Transfers(object):
+    """Many downloads and uploads sharing one bounded s3transfer manager."""
+
+    def __init__(self, client=None, max_concurrency=aws.MAX_POOL_CONNECTIONS,
+                 multipart_threshold=PART_SIZE, part_size=PART_SIZE,
+                 window=None):
+        self.client = client or aws.client('s3')
+        self.manager = create_transfer_manager(self.client, TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+        ))
+        # Transfers submitted ahead of the one being waited for.
+        self.window = window or max_concurrency * 4
+
+    def _run(self, submit, items):
+        """Submit each item, keeping at most ``window`` in flight, and yield
+        the results of ``submit(item)`` in order as they complete."""
+        in_flight = []
+        for item in items:
+            in_flight.append(submit(item))
+            if len(in_flight) >= self.window:
+                future, result = in_flight.pop(0)
+                future.result()
+                yield result
+        for future, result in in_flight:
+            future.result()
+            yield result
+
+    def download(self, bucket, objects, directory, prefix=''):
+        """Download ``objects`` (keys, or summaries from ``iter_objects``)
+        under ``directory``, without their ``prefix``; yields
+        ``(key, path)``. Directory markers, keys ending in ``/``, have no
+        file and are skipped."""
+        made = set()
+
+        def submit(obj):
+            key = _key(obj)
+            path = local_path(directory, key, prefix)
+            parent = os.path.dirname(path)
+            if parent not in made:
+                os.makedirs(parent, exist_ok=True)
+                made.add(parent)
+            subscribers = None
+            if not isinstance(obj, str) and 'Size' in obj:
+                subscribers = [_KnownSize(obj['Size'])]
+            future = self.manager.download(
+                bucket, key, path, subscribers=subscribers
+            )
+            return future, (key, path)
+
+        return self._run(
+            submit, (obj for obj in objects if not _key(obj).endswith('/'))
+        )
+
+    def upload(self, bucket, files, extra_args=None):
+        """Upload ``(path, key)`` pairs, eg: from ``walk``; yields keys."""
+
+        def submit(item):
+            path, key = item
+            future = self.manager.upload(path, bucket, key, extra_args=extra_args)
+            return future, key
+
+        return self._run(submit, files)
+
+    def close(self, cancel=False):
+        self.manager.shutdown(cancel=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(cancel=exc_type is not None)
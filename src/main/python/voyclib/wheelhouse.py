@@ -0,0 +1,455 @@
+"""Mirror the wheels pinned by the poetry lock files into the voyclib bucket.
+
+Every package pinned by ``infrastructure/poetry.lock`` and
+``voyclib/poetry.lock`` is fetched or built into a wheel once, by a single
+``pip wheel --require-hashes`` run that checks each download against the
+lock's hashes. The wheels are published under the ``wheelhouse/`` prefix as a
+PEP 503 index with ``#sha256=`` hashes (see ``pypi_index.py``). Packages that
+already have a wheel for this interpreter and platform there are skipped, and
+published wheels are never overwritten, so the hashes below stay valid.
+
+Each lock is then exported beside it as a hash-pinned ``requirements.txt``
+listing the hashes of the wheels actually in the wheelhouse, and builds
+install from the mirror alone:
+
+    pip install --no-deps --require-hashes \\
+        --index-url http://voyclib.s3-website-eu-west-1.amazonaws.com/wheelhouse/ \\
+        -r requirements.txt
+
+    python wheelhouse.py --bucket $BUCKET
+    python wheelhouse.py --bucket voyclib --endpoint-url http://localhost:5000
+    python wheelhouse.py --directory /tmp/wheelhouse \\
+        --pip-args '--no-index --find-links /tmp/downloads'
+    python wheelhouse.py --directory /tmp/wheelhouse --export-only
+
+Wheels built from an sdist are built for the running interpreter and
+platform, so run this on the CodeBuild image the builds use (psycopg2 also
+needs ``pg_config`` there). Below Python 3.11 the locks are read with
+``tomli``, which ``buildspec.yml`` installs. ``--bucket`` and ``--acl``
+default to the ``BUCKET`` and ``ACL`` environment variables set on the
+CodeBuild project.
+"""
+import argparse
+import os
+import platform as _platform
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict, namedtuple
+
+import pypi_index
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: the same parser, from PyPI.
+    import tomli as tomllib
+
+
+def _load_toml(path):
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LOCKS = [
+    os.path.join(HERE, '..', 'infrastructure', 'poetry.lock'),
+    os.path.join(HERE, 'poetry.lock'),
+]
+REQUIREMENTS = 'requirements.txt'
+PREFIX = 'wheelhouse'
+
+WHEEL_NAME = re.compile(
+    r'^(?P<name>[^-]+)-(?P<version>[^-]+)(-\d[^-]*)?'
+    r'-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$'
+)
+PLATFORM_TAGS = {
+    'linux': ('manylinux', 'musllinux', 'linux'),
+    'darwin': ('macosx',),
+    'win32': ('win',),
+}
+PYTHON_CLAUSE = re.compile(r'^(\^|~=|~|>=|<=|!=|==|>|<)?\s*([\d.*]+)$')
+
+Package = namedtuple(
+    'Package', ['name', 'version', 'category', 'hashes', 'marker']
+)
+
+
+###########################################
+#               Lock files
+###########################################
+
+def python_marker(constraint):
+    """A poetry ``python`` constraint as a PEP 508 marker, or None for ``*``."""
+    alternatives = []
+    for part in constraint.split('||'):
+        clauses = []
+        for clause in part.split(','):
+            clause = clause.strip()
+            if clause in ('', '*'):
+                continue
+            match = PYTHON_CLAUSE.match(clause)
+            if not match:
+                raise ValueError('Unsupported python constraint %r' % constraint)
+            op, version = match.groups()
+            numbers = [int(n) for n in version.split('.') if n != '*']
+            if op in ('^', '~'):
+                upper = numbers[:1] if op == '^' else numbers[:2]
+                upper[-1] += 1
+                clauses.append('python_version >= "%s"' % version)
+                clauses.append(
+                    'python_version < "%s"' % '.'.join(map(str, upper))
+                )
+            else:
+                clauses.append('python_version %s "%s"' % (op or '==', version))
+        if not clauses:
+            return None
+        alternatives.append(' and '.join(clauses))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return ' or '.join('(%s)' % a for a in alternatives)
+
+
+def _dependency_markers(dependency):
+    """Markers of one ``[package.dependencies]`` entry; None if unconditional."""
+    specs = dependency if isinstance(dependency, list) else [dependency]
+    markers = []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            return None
+        parts = [spec['markers']] if spec.get('markers') else []
+        python = python_marker(spec['python']) if spec.get('python') else None
+        if python:
+            parts.append(python)
+        if not parts:
+            return None
+        markers.append(
+            parts[0] if len(parts) == 1 else ' and '.join('(%s)' % p for p in parts)
+        )
+    return markers[0] if len(markers) == 1 else ' or '.join(
+        '(%s)' % m for m in markers
+    )
+
+
+def read_lock(path):
+    """The packages pinned by a poetry lock file, in lock order.
+
+    A package is given the markers under which its dependents require it,
+    when every dependent does so conditionally (eg: pywin32 only on
+    Windows). Packages from other indexes, which have no hashes in the lock,
+    are left out.
+    """
+    lock = _load_toml(path)
+    files = lock.get('metadata', {}).get('files', {})
+
+    required = {}
+    for package in lock.get('package', []):
+        for name, dependency in package.get('dependencies', {}).items():
+            required.setdefault(pypi_index.normalize(name), []).append(
+                _dependency_markers(dependency)
+            )
+
+    packages = []
+    for package in lock.get('package', []):
+        hashes = [
+            f['hash'].split(':', 1)[1]
+            for f in files.get(package['name'], [])
+            if f['hash'].startswith('sha256:')
+        ]
+        if not hashes:
+            continue
+        markers = required.get(pypi_index.normalize(package['name']), [None])
+        marker = None
+        if None not in markers:
+            marker = ' or '.join(
+                '(%s)' % m for m in OrderedDict.fromkeys(markers)
+            ) if len(set(markers)) > 1 else markers[0]
+        packages.append(Package(
+            package['name'],
+            package['version'],
+            package.get('category', 'main'),
+            hashes,
+            marker,
+        ))
+    return packages
+
+
+def merge(locks):
+    """One package per name and version across ``{path: [Package]}``.
+
+    Hashes are combined; a package keeps a marker only if every lock gives it
+    the same one.
+    """
+    merged = OrderedDict()
+    for packages in locks.values():
+        for p in packages:
+            key = (pypi_index.normalize(p.name), p.version)
+            if key not in merged:
+                merged[key] = p
+                continue
+            old = merged[key]
+            merged[key] = old._replace(
+                category='main' if 'main' in (old.category, p.category) else 'dev',
+                hashes=list(OrderedDict.fromkeys(old.hashes + p.hashes)),
+                marker=old.marker if old.marker == p.marker else None,
+            )
+    return list(merged.values())
+
+
+def requirement(package, hashes):
+    line = '%s==%s' % (package.name, package.version)
+    if package.marker:
+        line += ' ; %s' % package.marker
+    return ' \\\n    '.join([line] + ['--hash=sha256:%s' % h for h in hashes])
+
+
+###########################################
+#               Wheels
+###########################################
+
+def parse_wheel(filename):
+    """``(project, version, python tags, abi, platform tags)`` of a wheel name."""
+    match = WHEEL_NAME.match(filename)
+    if not match:
+        return None
+    return (
+        pypi_index.normalize(match.group('name')),
+        match.group('version'),
+        match.group('python').split('.'),
+        match.group('abi'),
+        match.group('platform').split('.'),
+    )
+
+
+def installable(filename, version_info=sys.version_info, platform=None):
+    """Whether pip on this interpreter would take the wheel.
+
+    A rough check over the wheel's tags, enough to tell whether this run
+    still has to provide a wheel for the package.
+    """
+    parsed = parse_wheel(filename)
+    if not parsed:
+        return False
+    _, _, pythons, abi, platforms = parsed
+    major, minor = version_info[:2]
+    cpython = 'cp%d%d' % (major, minor)
+    python = False
+    for tag in pythons:
+        if tag in ('py%d' % major, 'py%d%d' % (major, minor), cpython):
+            python = True
+        elif abi == 'abi3' and tag.startswith('cp%d' % major):
+            python = python or int(tag[3:] or 0) <= minor
+    if not python:
+        return False
+
+    if platforms == ['any']:
+        return True
+    platform = platform or '%s_%s' % (sys.platform, _platform.machine().lower())
+    system, _, machine = platform.partition('_')
+    return any(
+        tag.startswith(PLATFORM_TAGS.get(system, (system,)))
+        and tag.endswith((machine, 'universal2'))
+        for tag in platforms
+    )
+
+
+def build_wheels(packages, wheel_dir, pip_args=()):
+    """Fetch or build a wheel of each package into ``wheel_dir``.
+
+    pip downloads a wheel when one fits this interpreter and otherwise builds
+    one from the sdist, after checking either download against the lock's
+    hashes. Packages whose marker excludes this environment are skipped by
+    pip. Returns ``{(project, version): [wheel filename]}``.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for p in packages:
+            f.write(requirement(p, p.hashes) + '\n')
+    try:
+        subprocess.run(
+            [
+                sys.executable, '-m', 'pip', 'wheel',
+                '--no-deps', '--require-hashes', '--wheel-dir', wheel_dir,
+                '-r', f.name,
+            ] + list(pip_args),
+            check=True,
+        )
+    finally:
+        os.remove(f.name)
+
+    wheels = {}
+    for filename in sorted(os.listdir(wheel_dir)):
+        parsed = parse_wheel(filename)
+        if parsed:
+            wheels.setdefault(parsed[:2], []).append(filename)
+    return wheels
+
+
+###########################################
+#               Mirroring
+###########################################
+
+def published(target, packages):
+    """``{(project, version): [Dist]}`` of the wheels in the wheelhouse."""
+    found = {}
+    for name in sorted({pypi_index.normalize(p.name) for p in packages}):
+        for dist in pypi_index.load_project(target, name):
+            parsed = parse_wheel(dist.filename)
+            if parsed and dist.sha256:
+                found.setdefault(parsed[:2], []).append(dist)
+    return found
+
+
+def mirror(target, packages, pip_args=(), out=sys.stdout):
+    """Publish a wheel of each package that the wheelhouse cannot install yet.
+
+    Returns ``{filename: status}``, status ``fetched`` (hash in the lock),
+    ``built`` (from the locked sdist) or ``kept`` (already published; never
+    overwritten).
+    """
+    digests = target.digests()
+    have = published(target, packages)
+    missing = [
+        p for p in packages
+        if not any(
+            installable(d.filename)
+            for d in have.get((pypi_index.normalize(p.name), p.version), [])
+        )
+    ]
+    if not missing:
+        return OrderedDict()
+
+    results, projects = OrderedDict(), OrderedDict()
+    with tempfile.TemporaryDirectory() as wheel_dir:
+        wheels = build_wheels(missing, wheel_dir, pip_args)
+        for p in missing:
+            name = pypi_index.normalize(p.name)
+            for filename in wheels.get((name, p.version), []):
+                key = '%s/%s' % (name, filename)
+                if key in digests:
+                    results[filename] = 'kept'
+                    continue
+                with open(os.path.join(wheel_dir, filename), 'rb') as f:
+                    data = f.read()
+                dist, metadata = pypi_index.inspect(filename, data)
+                target.put(key, data)
+                if metadata:
+                    target.put(key + '.metadata', metadata)
+                projects.setdefault(name, []).append(dist)
+                results[filename] = (
+                    'fetched' if dist.sha256 in p.hashes else 'built'
+                )
+    # Pages go last, so they never list a file that is not there yet.
+    pypi_index.update_projects(target, projects, digests)
+    for filename, status in results.items():
+        print(f'{status:>9}  {filename}', file=out)
+    return results
+
+
+def export(path, packages, have, dev=True, lock=None):
+    """Write a hash-pinned requirements file for ``packages``.
+
+    Each package lists the hashes of its wheels in the wheelhouse. One
+    without wheels there is only allowed if a marker may exclude it (eg:
+    Windows-only packages), and then lists the lock's hashes.
+    """
+    lines = [
+        '# Generated by wheelhouse.py from %s; do not edit.'
+        % os.path.relpath(lock, os.path.dirname(path)) if lock else
+        '# Generated by wheelhouse.py; do not edit.'
+    ]
+    missing = []
+    for p in packages:
+        if p.category == 'dev' and not dev:
+            continue
+        dists = have.get((pypi_index.normalize(p.name), p.version), [])
+        hashes = [d.sha256 for d in dists] or (p.hashes if p.marker else [])
+        if not hashes:
+            missing.append('%s==%s' % (p.name, p.version))
+            continue
+        lines.append(requirement(p, hashes))
+    if missing:
+        raise ValueError(
+            'No wheels in the wheelhouse for %s' % ', '.join(missing)
+        )
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--bucket', default=os.environ.get('BUCKET'))
+    where.add_argument('--directory', help='Local wheelhouse root.')
+    parser.add_argument(
+        '--prefix',
+        default=PREFIX,
+        help='Key prefix of the wheelhouse within the bucket.',
+    )
+    parser.add_argument('--region')
+    parser.add_argument(
+        '--endpoint-url', help='S3 endpoint, eg: a local moto server.'
+    )
+    parser.add_argument(
+        '--acl',
+        default=os.environ.get('ACL', 'public-read'),
+        help="Canned ACL for uploaded objects; '' for none. Defaults to $ACL.",
+    )
+    parser.add_argument(
+        '--lock',
+        action='append',
+        help='A poetry.lock to mirror; repeatable. Defaults to both projects.',
+    )
+    parser.add_argument(
+        '--no-dev', action='store_true', help='Leave out dev dependencies.'
+    )
+    parser.add_argument(
+        '--pip-args',
+        default='',
+        help="Extra `pip wheel` arguments, eg: '--no-index --find-links DIR'.",
+    )
+    parser.add_argument(
+        '--export-only',
+        action='store_true',
+        help='Only write the requirements files from the current wheelhouse.',
+    )
+    args = parser.parse_args(argv)
+    if not args.bucket and not args.directory:
+        parser.error('--bucket (or $BUCKET) or --directory is required')
+
+    if args.bucket:
+        target = pypi_index.S3Target(
+            args.bucket,
+            args.prefix,
+            region=args.region,
+            endpoint_url=args.endpoint_url,
+            acl=args.acl,
+        )
+    else:
+        target = pypi_index.DirectoryTarget(args.directory)
+
+    locks = OrderedDict(
+        (os.path.normpath(path), read_lock(path)) for path in args.lock or LOCKS
+    )
+    packages = [
+        p for p in merge(locks) if p.category == 'main' or not args.no_dev
+    ]
+    if not args.export_only:
+        try:
+            mirror(target, packages, shlex.split(args.pip_args))
+        except subprocess.CalledProcessError:
+            sys.exit('pip could not fetch or build every pinned wheel')
+
+    have = published(target, packages)
+    try:
+        for lock, pinned in locks.items():
+            path = os.path.join(os.path.dirname(lock), REQUIREMENTS)
+            export(path, pinned, have, dev=not args.no_dev, lock=lock)
+            print(f'Wrote {path}', file=sys.stderr)
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()